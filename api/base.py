@@ -7,19 +7,36 @@ import tornado.web
 import tornado.websocket
 
 from tornado import gen
+from tornado import stack_context
 from tornado.web import (
     HTTPError,
     decode_signed_value,
 )
 
+from sqlalchemy import (
+    or_,
+    and_,
+)
+
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
 
+import util
+import cards
 import models
+import readers
+import leaderboard
+import database
+import taxonomy
+import metrics
+import instrument
+import lifecycle
 from database import db_session
+from . import baseForms
 from util import conn_redis
 
 
 redis_cli = conn_redis()
+lifecycle.on_close(redis_cli.connection_pool.disconnect)
 
 
 class JSONHTTPError(HTTPError):
@@ -30,11 +47,33 @@ class JSONHTTPError(HTTPError):
 
 class BaseDBHandler(tornado.web.RequestHandler):
     def initialize(self):
+        self.timing = instrument.Timing('{} {} {}'.format(
+            type(self).__name__, self.request.method, self.request.path))
         self.session = db_session()
         self.redis_cli = redis_cli
+        with self.timing.active():
+            taxonomy.registry.check(self.redis_cli)
+        lifecycle.requests.add(self)
+
+    def _execute(self, *args, **kwargs):
+        # every callback of the request, across its yields, runs with
+        # self.timing as instrument.current
+        with stack_context.StackContext(self.timing.active):
+            return super()._execute(*args, **kwargs)
+
+    def finish(self, chunk=None):
+        if not self._headers_written:
+            if instrument.server_timing:
+                self.set_header('Server-Timing', self.timing.header())
+            if lifecycle.draining:
+                self.set_header('Connection', 'close')
+        return super().finish(chunk)
 
     def on_finish(self):
+        lifecycle.requests.discard(self)
         self.session.close()
+        self.timing.report(self)
+        metrics.observe_request(self, self.timing.elapsed())
 
 
 class JSONHandler(BaseDBHandler):
@@ -101,8 +140,14 @@ class QueryHandlerMixin():
             query = query.limit(form.limit.data)
         return query
 
-    def apply_order(self, query, form, apply_limit=True):
-        query = query.order_by("%s %s" % (form.sortby.data, form.order.data))
+    def apply_order(self, query, form, apply_limit=True, entity=None):
+        if entity is not None:
+            column = getattr(entity, form.sortby.data)
+            query = query.order_by(column.desc()
+                                   if form.order.data == 'desc'
+                                   else column.asc())
+        else:
+            query = query.order_by("%s %s" % (form.sortby.data, form.order.data))
         if apply_limit:
             query = self.apply_limit(query, form)
         return query
@@ -122,8 +167,17 @@ class QueryHandlerMixin():
         return changed
 
     def get_or_404(self, query, query_string=None, **kwargs):
+        """
+        query is a Query, or a model class to look the id up through a
+        baked query.
+        """
         try:
-            if query_string is not None:
+            if isinstance(query, type):
+                if query_string is None:
+                    query_string = kwargs.pop('id', None)
+                result = database.get_by_id(self.session, query,
+                                            query_string, **kwargs)
+            elif query_string is not None:
                 result = query.get(query_string)
             else:
                 result = query.filter_by(**kwargs).first()
@@ -133,16 +187,35 @@ class QueryHandlerMixin():
         else:
             return result
 
+    def ranked_ids(self, form, ranking):
+        """
+        With ranking = (Model, leaderboard key), the hex ids of a
+        likes-descending page; None when SQL has to sort it.
+        """
+        if ranking is None or not leaderboard.serves(form):
+            return None
+        return leaderboard.page(self.redis_cli, ranking[1],
+                                form.offset.data, form.limit.data)
+
     def finish_objects(self, Form, Model=None, query=None,
-                       permission_check=None,
+                       permission_check=None, feed=None, ranking=None,
                        *args, **kwargs):
         form = Form(self.request.arguments,
                     locale_code=self.locale.code)
         if form.validate():
+            kwargs.update(self.fieldset(form))
             if Model is not None:
                 query = self.session.query(Model)
-            objects_query = self.apply_order(query, form)
-            objects = objects_query.all()
+            if feed is not None and form.since.data is not None:
+                return self.finish_changes(form, query, *feed,
+                                           *args, **kwargs)
+            ids = self.ranked_ids(form, ranking)
+            if ids is not None:
+                objects = query.filter(ranking[0].id.in_(ids)).all() if ids else []
+                objects = leaderboard.ordered(objects, ids, lambda o: o.id.hex)
+            else:
+                objects_query = self.apply_order(query, form)
+                objects = objects_query.all()
 
             response = list()
             for obj in objects:
@@ -157,19 +230,131 @@ class QueryHandlerMixin():
         else:
             self.validation_error(form)
 
-    def finish_objects_count(self, Model=None, query=None):
-        if Model is not None:
-            query = self.session.query(Model)
+    def finish_rows(self, Form, query, read, feed=None,
+                    order_entity=None, form=None, ranking=None, **kwargs):
+        """
+        Like finish_objects, but reads the page through
+        readers.Reader; `read` is one of its list methods. A `form`
+        already validated by the caller is used as is.
+        """
+        if form is None:
+            form = Form(self.request.arguments,
+                        locale_code=self.locale.code)
+            if not form.validate():
+                self.validation_error(form)
+
+        fieldset = self.fieldset(form)
+        if feed is not None and form.since.data is not None:
+            kwargs.update(fieldset)
+            return self.finish_changes(form, query, *feed, **kwargs)
+
+        reader = readers.Reader(self.session, **fieldset)
+        ids = self.ranked_ids(form, ranking)
+        if ids is not None:
+            rows = read(reader, query.filter(ranking[0].id.in_(ids))) if ids else []
+            rows = leaderboard.ordered(rows, ids, lambda row: row.id)
+        else:
+            objects_query = self.apply_order(query, form, entity=order_entity)
+            rows = read(reader, objects_query)
+
+        kwargs.update(fieldset)
+        response = [row.format_detail(**kwargs) for row in rows]
+        self.finish(json.dumps(response))
+
+    def finish_cards(self, statement, params=None):
+        """
+        Finish with the pre-rendered photographer cards `statement`
+        selects, without decoding them.
+        """
+        rows = readers.Reader(self.session).execute(statement, params)
+        self.finish(cards.dumps(detail for detail, in rows))
+
+    def finish_changes(self, form, query, Model, kind, parent_id=None,
+                       *args, read=None, **kwargs):
+        """
+        Finish with the rows of `query` created or updated since
+        `form.since`, and the ids of `kind` tombstoned in the same
+        window. With `read`, one of the readers.Reader list methods,
+        the page is rendered through it instead of the models, and
+        kwargs are its fieldset.
+
+        A full page returns the last row's (updated_at, id) as the next
+        cursor, and the next page starts strictly after it, so rows
+        sharing a timestamp are neither repeated nor skipped; its
+        tombstones stop at that updated_at. Otherwise the cursor is
+        the start of the second this request started in: updated_at
+        may be stored to the second, and rows still committing in it
+        must not be missed.
+        """
+        now = util.get_utc_time()
+        since, since_id = form.since.data
+        Tombstone = models.Tombstone
+        if since_id is None:
+            objects_query = query.filter(Model.updated_at >= since)
+            deleted = Tombstone.delete_time >= since
+        else:
+            objects_query = query.filter(or_(
+                Model.updated_at > since,
+                and_(Model.updated_at == since, Model.id > since_id)))
+            deleted = Tombstone.delete_time > since
+        objects_query = objects_query.order_by(Model.updated_at.asc(),
+                                               Model.id.asc())
+        if read is None:
+            objects = self.apply_limit(objects_query, form).all()
+            keys = [(obj.updated_at, obj.id) for obj in objects]
+            changed = [obj.format_detail(*args, **kwargs) for obj in objects]
+        else:
+            keys = self.apply_limit(
+                objects_query.with_entities(Model.updated_at, Model.id), form).all()
+            ids = [id for updated_at, id in keys]
+            rows = read(readers.Reader(self.session, **kwargs),
+                        query.filter(Model.id.in_(ids))) if ids else []
+            rows = leaderboard.ordered(rows, [id.hex for id in ids],
+                                       lambda row: row.id)
+            changed = [row.format_detail(**kwargs) for row in rows]
+        tombstones = self.session.query(Tombstone.object_id)\
+            .filter_by(kind=kind, parent_id=parent_id)\
+            .filter(deleted)
+
+        if form.limit.data is not None and len(keys) == form.limit.data:
+            updated_at, id = keys[-1]
+            cursor = util.encode_cursor(updated_at, id)
+            tombstones = tombstones.filter(Tombstone.delete_time <= updated_at)
+        else:
+            cursor = util.encode_cursor(now.replace(microsecond=0))
+
         response = {
-            'count': query.count()
+            'cursor': cursor,
+            'changed': changed,
+            'deleted': [t.object_id.hex for t in tombstones],
+        }
+        self.finish(json.dumps(response))
+
+    def finish_objects_count(self, Model=None, query=None, count=None):
+        """
+        count, when the caller keeps one, saves the COUNT(*).
+        """
+        if count is None:
+            if Model is not None:
+                query = self.session.query(Model)
+            count = query.count()
+        response = {
+            'count': count
         }
         self.finish(json.dumps(response))
 
     def finish_object(self, Model, id=None, permission_check=None,
                       query_kwargs={},
-                      format_args=[], format_kwargs={}):
-        obj = self.get_or_404(self.session.query(Model),
-                              id, **query_kwargs)
+                      format_args=[], format_kwargs={},
+                      Form=None):
+        if Form is not None:
+            form = Form(self.request.arguments,
+                        locale_code=self.locale.code)
+            if not form.validate():
+                self.validation_error(form)
+            format_kwargs = dict(format_kwargs, **self.fieldset(form))
+
+        obj = self.get_or_404(Model, id, **query_kwargs)
         if permission_check is not None \
                 and not permission_check(obj, self.current_user):
             raise JSONHTTPError(404)
@@ -179,6 +364,18 @@ class QueryHandlerMixin():
         ))
         return obj
 
+    @staticmethod
+    def fieldset(form):
+        """
+        format_detail kwargs for the `fields=`/`expand=` of a validated form.
+        """
+        if not isinstance(form, baseForms.FieldsetMixin):
+            return {}
+        return {
+            'fields': form.fields.data,
+            'expand': form.expand.data,
+        }
+
 
 class APIBaseHandler(JSONHandler, FormHandlerMixin, QueryHandlerMixin):
     def get_current_user(self):
@@ -191,7 +388,7 @@ class APIBaseHandler(JSONHandler, FormHandlerMixin, QueryHandlerMixin):
         if data:
             auth = data.get('uid', None)
         try:
-            current_user = self.session.query(models.User).get(auth)
+            current_user = database.get_by_id(self.session, models.User, auth)
         except Exception:
             current_user = None
 
@@ -1,4 +1,5 @@
 from form import Form
+from . import baseValidators
 from wtforms.fields import (
     Field,
     StringField,
@@ -12,3 +13,23 @@ from wtforms.fields import (
 class SliceMixin():
     limit = IntegerField('limit')
     offset = IntegerField('offset')
+
+
+class SinceMixin():
+    since = StringField('since', [
+        baseValidators.cursor_get
+    ])
+
+
+class FieldsetMixin():
+    """
+    `fields=` and `expand=` take comma separated names checked against
+    the `detail_fields` and `detail_relations` of `fieldset_model`.
+    """
+    fieldset_model = None
+    fields = StringField('fields', [
+        baseValidators.fieldset_get('detail_fields')
+    ])
+    expand = StringField('expand', [
+        baseValidators.fieldset_get('detail_relations')
+    ])
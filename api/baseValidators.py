@@ -5,29 +5,22 @@ from wtforms.validators import (
     ValidationError,
     StopValidation,
 )
+import util
 import models
+import database
+import taxonomy
 
 
-def objects_get(query, msg):
-    def _objects_get(form, field):
-        datas = list()
-        for data_id in list(field.data):
-            try:
-                data = query.get(data_id)
-                assert data is not None
-                datas.append(data)
-            except Exception:
-                raise StopValidation(msg)
-        field.data = tuple(datas)
-    return _objects_get
+def objects_get(Model, msg):
+    return objects_filter_get(Model, msg)
 
 
-def object_get(query, msg):
+def object_get(Model, msg):
     def _object_get(form, field):
         try:
             if not field.data:
                 return None
-            target = query.get(field.data)
+            target = database.get_by_id(database.db_session(), Model, field.data)
             assert target is not None
             field.data = target
         except Exception:
@@ -36,11 +29,19 @@ def object_get(query, msg):
 
 
 def object_filter_get(query, msg, **kwargs):
+    """
+    query is a Query, or a model class to look the id up through a
+    baked query.
+    """
     def _object_filter_get(form, field):
         try:
             if not field.data:
                 return None
-            target = query.filter_by(id=field.data, **kwargs).first()
+            if isinstance(query, type):
+                target = database.get_by_id(database.db_session(), query,
+                                            field.data, **kwargs)
+            else:
+                target = query.filter_by(id=field.data, **kwargs).first()
             assert target is not None
             field.data = target
         except Exception:
@@ -48,53 +49,98 @@ def object_filter_get(query, msg, **kwargs):
     return _object_filter_get
 
 
-def objects_filter_get(query, msg, **kwargs):
+def objects_filter_get(Model, msg, **kwargs):
+    """
+    Resolve a list of ids with one IN query, keeping the input order
+    and naming the ids that are invalid.
+    """
     def _objects_filter_get(form, field):
+        try:
+            ids = list(field.data)
+        except TypeError:
+            raise StopValidation(msg)
+        datas, invalid = database.get_by_ids(database.db_session(), Model,
+                                             ids, **kwargs)
+        if invalid:
+            raise StopValidation('{} ({})'.format(msg, ', '.join(invalid)))
+        field.data = tuple(datas)
+    return _objects_filter_get
+
+
+def options_get(kind, msg):
+    """
+    Resolve style, school, category or theme ids against the
+    taxonomy registry, without touching the database. Repeated ids
+    are dropped, so the lists are never longer than the taxonomy.
+    """
+    def _options_get(form, field):
+        try:
+            ids = list(field.data)
+        except TypeError:
+            raise StopValidation(msg)
         datas = list()
-        for data_id in list(field.data):
+        invalid = list()
+        for data_id in ids:
             try:
-                data = query.filter_by(id=data_id, **kwargs).first()
-                assert data is not None
+                data = taxonomy.registry.get(kind, data_id)
+            except ValueError:
+                data = None
+            if data is None:
+                invalid.append(data_id.decode() if isinstance(data_id, bytes) else str(data_id))
+            elif all(d.id != data.id for d in datas):
                 datas.append(data)
-            except Exception:
-                raise StopValidation(msg)
+        if invalid:
+            raise StopValidation('{} ({})'.format(msg, ', '.join(invalid)))
         field.data = tuple(datas)
-    return _objects_filter_get
+    return _options_get
+
+
+def option_get(kind, msg):
+    def _option_get(form, field):
+        try:
+            if not field.data:
+                return None
+            target = taxonomy.registry.get(kind, field.data)
+            assert target is not None
+            field.data = target
+        except Exception:
+            raise StopValidation(msg)
+    return _option_get
 
 
 def image_get(form, field):
     _ = field.gettext
-    return object_get(models.Image.query,
+    return object_get(models.Image,
                       _('Invalid Image.'))(form, field)
 
 
 def images_get(form, field):
     _ = field.gettext
-    return objects_get(models.Image.query,
+    return objects_get(models.Image,
                        _('Invalid Image.'))(form, field)
 
 
 def banner_get(form, field):
     _ = field.gettext
-    return object_get(models.Banner.query,
+    return object_get(models.Banner,
                       _('Invalid Banner.'))(form, field)
 
 
 def banners_get(form, field):
     _ = field.gettext
-    return objects_get(models.Banner.query,
+    return objects_get(models.Banner,
                        _('Invalid Banner.'))(form, field)
 
 
 def user_get(form, field):
     _ = field.gettext
-    return object_get(models.User.query,
+    return object_get(models.User,
                       _('Invalid User.'))(form, field)
 
 
 def photographer_get(form, field):
     _ = field.gettext
-    return object_filter_get(models.User.query,
+    return object_filter_get(models.User,
                              _('Invalid Photographer.'),
                              is_admin=False,
                              status="reviewed")(form, field)
@@ -102,7 +148,7 @@ def photographer_get(form, field):
 
 def photographers_get(form, field):
     _ = field.gettext
-    return objects_filter_get(models.User.query,
+    return objects_filter_get(models.User,
                               _('Invalid Photographer.'),
                               is_admin=False,
                               status="reviewed")(form, field)
@@ -110,55 +156,55 @@ def photographers_get(form, field):
 
 def home_photographers_get(form, field):
     _ = field.gettext
-    return objects_get(models.HomePhotographer.query,
+    return objects_get(models.HomePhotographer,
                        _('Invalid Photographer.'))(form, field)
 
 
 def home_collections_get(form, field):
     _ = field.gettext
-    return objects_get(models.HomeCollection.query,
+    return objects_get(models.HomeCollection,
                        _('Invalid Work.'))(form, field)
 
 
 def styles_get(form, field):
     _ = field.gettext
-    return objects_get(models.Style.query,
+    return options_get('style',
                        _('Invalid Style.'))(form, field)
 
 
 def themes_get(form, field):
     _ = field.gettext
-    return objects_get(models.Theme.query,
+    return options_get('theme',
                        _('Invalid Theme'))(form, field)
 
 
 def schools_get(form, field):
     _ = field.gettext
-    return objects_get(models.School.query,
+    return options_get('school',
                        _('Invalid School'))(form, field)
 
 
 def school_get(form, field):
     _ = field.gettext
-    return object_get(models.School.query,
-                       _('Invalid School'))(form, field)
+    return option_get('school',
+                      _('Invalid School'))(form, field)
 
 
 def categories_get(form, field):
     _ = field.gettext
-    return objects_get(models.Category.query,
+    return options_get('category',
                        _('Invalid Category'))(form, field)
 
 
 def collection_get(form, field):
     _ = field.gettext
-    return object_get(models.Collection.query,
+    return object_get(models.Collection,
                       _('Invalid Collection'))(form, field)
 
 
 def collections_get(form, field):
     _ = field.gettext
-    return objects_get(models.Collection.query,
+    return objects_get(models.Collection,
                        _('Invalid Collection'))(form, field)
 
 
@@ -174,6 +220,32 @@ def user_collection_get(form, field):
                              _('Invalid collection.'))(form, field)
 
 
+def cursor_get(form, field):
+    _ = field.gettext
+    if not field.data:
+        field.data = None
+        return None
+    try:
+        field.data = util.decode_cursor(field.data)
+    except Exception:
+        raise StopValidation(_('Invalid cursor.'))
+
+
+def fieldset_get(attr):
+    def _fieldset_get(form, field):
+        _ = field.gettext
+        if not field.data:
+            field.data = None
+            return None
+        names = set(n.strip() for n in field.data.split(',') if n.strip())
+        invalid = names - set(getattr(form.fieldset_model, attr))
+        if invalid:
+            raise StopValidation(_('Invalid field.') +
+                                 ' ' + ', '.join(sorted(invalid)))
+        field.data = names
+    return _fieldset_get
+
+
 def ignore_match(kw, form, field):
     ignore = form.kwargs.get(kw, None)
     if ignore is not None \
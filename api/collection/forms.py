@@ -32,10 +32,17 @@ class CollectionForm(Form):
     ])
 
 
-class CollectionsForm(Form, baseForms.SliceMixin):
+class CollectionDetailForm(Form, baseForms.FieldsetMixin):
+    fieldset_model = models.Collection
+
+
+class CollectionsForm(Form, baseForms.SliceMixin, baseForms.SinceMixin,
+                      baseForms.FieldsetMixin):
+    fieldset_model = models.Collection
     sortby = SelectField('sortby', default="create_time", choices=[
         ("create_time", "create_time"),
         ("likes", "likes"),
+        ("trending", "trending"),
     ])
     order = SelectField('order', default="asc", choices=[
         ("asc", "asc"),
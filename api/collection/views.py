@@ -1,6 +1,12 @@
 import json
 
+import util
+import cards
 import models
+import database
+import counters
+import trending
+import leaderboard
 from .. import base
 from . import forms
 
@@ -26,7 +32,8 @@ class CollectionHandler(base.APIBaseHandler):
                            uuid,
                            format_kwargs={
                                'check_func': self.check_like,
-                           })
+                           },
+                           Form=forms.CollectionDetailForm)
 
     def check_like(self, collection):
         return self.redis_cli.sismember(collection.id.hex, self.request.remote_ip)
@@ -38,15 +45,21 @@ class CollectionsHandler(base.APIBaseHandler):
     Allowed methods: GET
     """
     def get(self, uuid):
-        photographer = self.get_or_404(models.User.query,
+        photographer = self.get_or_404(models.User,
                                        uuid)
         if photographer.cover_collection:
             query = photographer.collections\
                 .filter(models.Collection.id != photographer.cover_collection.id)
         else:
             query = photographer.collections
+        # the cover collection is counted but not listed
+        self.set_header('X-Total-Count', photographer.collection_count -
+                        (1 if photographer.cover_collection_id else 0))
         self.finish_objects(forms.CollectionsForm,
                             query=query,
+                            feed=(models.Collection, 'collection', photographer.id),
+                            ranking=(models.Collection,
+                                     leaderboard.collections_key(photographer.id)),
                             check_func=self.check_like)
 
     def check_like(self, collection):
@@ -59,42 +72,61 @@ class CollectionLikeHandler(base.APIBaseHandler):
     Allowed methods: GET, DELETE
     """
     def get(self, uuid):
-        collection = self.get_or_404(models.Collection.query,
+        collection = self.get_or_404(models.Collection,
                                      uuid)
         ip = self.request.remote_ip
         if not self.redis_cli.sismember(collection.id.hex, ip):
+            now = util.get_utc_time()
             self.redis_cli.sadd(collection.id.hex, ip)
-            self.like_collection(collection)
+            self.redis_cli.hset(trending.liked_key(collection), ip, now.timestamp())
+            self.like_collection(collection, now)
+            leaderboard.like(self.redis_cli, collection, 1)
             self.set_status(204)
         else:
             self.set_status(403)
         self.finish()
 
     def delete(self, uuid):
-        collection = self.get_or_404(models.Collection.query,
+        collection = self.get_or_404(models.Collection,
                                      uuid)
         ip = self.request.remote_ip
         if self.redis_cli.sismember(collection.id.hex, ip):
+            key = trending.liked_key(collection)
+            liked = trending.liked_at(self.redis_cli.hget(key, ip), collection)
             self.redis_cli.srem(collection.id.hex, ip)
-            self.unlike_collection(collection)
+            self.redis_cli.hdel(key, ip)
+            self.unlike_collection(collection, liked)
+            leaderboard.like(self.redis_cli, collection, -1)
             self.set_status(204)
         else:
             self.set_status(403)
         self.finish()
 
     @base.db_success_or_500
-    def like_collection(self, collection):
+    def like_collection(self, collection, time):
+        shown = cards.shown_collection(collection.user)
         collection.likes += 1
         collection.user.likes += 1
+        trending.bump(collection, trending.like_weight, time)
+        trending.bump(collection.user, trending.like_weight, time)
+        collection.user.offer_hottest_collection(collection)
         self.session.add(collection)
         self.session.add(collection.user)
+        cards.like(self.session, collection, shown)
 
     @base.db_success_or_500
-    def unlike_collection(self, collection):
+    def unlike_collection(self, collection, liked):
+        shown = cards.shown_collection(collection.user)
         collection.likes -= 1
         collection.user.likes -= 1
+        trending.drop(collection, trending.like_weight, liked)
+        trending.drop(collection.user, trending.like_weight, liked)
+        if collection.user.hottest_collection_id == collection.id:
+            self.session.flush()
+            collection.user.refresh_hottest_collection()
         self.session.add(collection)
         self.session.add(collection.user)
+        cards.like(self.session, collection, shown)
 
 
 class CollectionsCountHandler(base.APIBaseHandler):
@@ -103,9 +135,9 @@ class CollectionsCountHandler(base.APIBaseHandler):
     Allowed methods: GET
     """
     def get(self, uuid):
-        photographer = self.get_or_404(models.User.query,
+        photographer = self.get_or_404(models.User,
                                        uuid)
-        self.finish_objects_count(query=photographer.collections)
+        self.finish_objects_count(count=photographer.collection_count)
 
 
 class UserCollectionHandler(base.APIBaseHandler):
@@ -141,7 +173,10 @@ class UserCollectionHandler(base.APIBaseHandler):
     def delete(self, uuid):
         collection = self.get_or_404(self.current_user.collections,
                                      id=uuid)
-        self.delete_collection(collection)
+        collection_id = collection.id
+        theme_ids = self.delete_collection(collection)
+        leaderboard.remove_collection(self.redis_cli, self.current_user.id,
+                                      collection_id, theme_ids)
 
         self.set_status(204)
         self.finish()
@@ -150,15 +185,34 @@ class UserCollectionHandler(base.APIBaseHandler):
     def edit_collection(self, collection, form):
         attr_list = ['name', 'description', 'model_name', 'photoshop', 'filming_time']
         self.apply_edit(collection, form, attr_list)
+        cards.refresh(self.session, self.current_user)
 
         return collection
 
     @base.db_success_or_500
     def delete_collection(self, collection):
-        self.current_user.collections.remove(collection)
-        for i in collection.images:
-            collection.images.remove(i)
+        self.session.add(models.Tombstone('collection',
+                                          collection.id,
+                                          self.current_user.id))
+        added, theme_ids = database.sync_association(
+            self.session, models.theme_collection_table,
+            'collection_id', collection.id, 'theme_id', [])
+        for theme_id in theme_ids:
+            self.session.add(models.Tombstone('theme_collection',
+                                              collection.id,
+                                              theme_id))
+        counters.add_each(self.session, models.Theme, 'collection_count',
+                          theme_ids, -1)
+        counters.add(self.current_user, 'collection_count', -1)
+        if self.current_user.hottest_collection_id == collection.id:
+            self.current_user.refresh_hottest_collection(exclude=collection)
+            self.session.flush()
+        database.sync_association(self.session, models.image_collection_table,
+                                  'collection_id', collection.id, 'image_id', [])
         self.session.delete(collection)
+        cards.refresh(self.session, self.current_user)
+
+        return theme_ids
 
     @staticmethod
     def collection_user_check(collection, user):
@@ -188,6 +242,7 @@ class UserCollectionsHandler(base.APIBaseHandler):
                                     locale_code=self.locale.code)
         if form.validate():
             collection = self.create_collection(form)
+            leaderboard.add_collection(self.redis_cli, collection)
             self.set_status(201)
             self.finish(json.dumps(
                 collection.format_detail()
@@ -205,9 +260,17 @@ class UserCollectionsHandler(base.APIBaseHandler):
         for image in form.images.data:
             if image not in collection.images:
                 collection.images.append(image)
+                counters.add(collection, 'image_count', 1)
+        counters.add(self.current_user, 'collection_count', 1)
+        if form.images.data:
+            weight = trending.upload_weight * len(form.images.data)
+            collection.trending = trending.exponent(weight)
+            trending.bump(self.current_user, weight)
         collection.user = self.current_user
+        self.current_user.offer_hottest_collection(collection)
 
         self.session.add(collection)
+        cards.refresh(self.session, self.current_user)
 
         return collection
 
@@ -247,7 +310,9 @@ class UserCollectionWorkHandler(base.APIBaseHandler):
     @base.db_success_or_500
     def delete_work(self, work, collection):
         collection.images.remove(work)
-        self.session.flush()
+        collection.updated_at = util.get_utc_time()
+        counters.add(collection, 'image_count', -1)
+        cards.refresh(self.session, self.current_user)
 
 
 class UserCollectionWorksHandler(base.APIBaseHandler):
@@ -278,7 +343,11 @@ class UserCollectionWorksHandler(base.APIBaseHandler):
         work = form.work.data
         if work not in collection.images:
             collection.images.append(work)
-        self.session.flush()
+            collection.updated_at = util.get_utc_time()
+            counters.add(collection, 'image_count', 1)
+            trending.bump(collection, trending.upload_weight)
+            trending.bump(self.current_user, trending.upload_weight)
+        cards.refresh(self.session, self.current_user)
 
         return work
 
@@ -61,7 +61,9 @@ class HomePhotographerForm(Form):
     ])
 
 
-class HomePhotographersForm(Form, baseForms.SliceMixin):
+class HomePhotographersForm(Form, baseForms.SliceMixin,
+                            baseForms.FieldsetMixin):
+    fieldset_model = models.HomePhotographer
     sortby = SelectField('sortby', default="number", choices=[
         ("number", "number"),
     ])
@@ -73,7 +75,7 @@ class HomePhotographersForm(Form, baseForms.SliceMixin):
 
 class HomePhotographerSortForm(Form):
     photographers = Field('photographers', default=[], validators=[
-        baseValidators.photographers_get,
+        baseValidators.home_photographers_get,
     ])
 
 
@@ -83,7 +85,9 @@ class HomeCollectionForm(Form):
     ])
 
 
-class HomeCollectionsForm(Form, baseForms.SliceMixin):
+class HomeCollectionsForm(Form, baseForms.SliceMixin,
+                          baseForms.FieldsetMixin):
+    fieldset_model = models.HomeCollection
     sortby = SelectField('sortby', default="number", choices=[
         ("number", "number"),
     ])
@@ -95,5 +99,5 @@ class HomeCollectionsForm(Form, baseForms.SliceMixin):
 
 class HomeCollectionSortForm(Form):
     collections = Field('collections', default=[], validators=[
-        baseValidators.collections_get,
+        baseValidators.home_collections_get,
     ])
@@ -1,8 +1,10 @@
 import json
 
-from sqlalchemy import func
-
+import cards
 import models
+import database
+import counters
+import readers
 from .. import base
 from . import forms
 
@@ -27,7 +29,7 @@ class BannerHandler(base.APIBaseHandler):
 
     @base.authenticated(admin=True)
     def patch(self, uuid):
-        banner = self.get_or_404(models.Banner.query,
+        banner = self.get_or_404(models.Banner,
                                  uuid)
 
         form = forms.BannerForm(self.json_args,
@@ -40,7 +42,7 @@ class BannerHandler(base.APIBaseHandler):
 
     @base.authenticated(admin=True)
     def delete(self, uuid):
-        banner = self.get_or_404(models.Banner.query,
+        banner = self.get_or_404(models.Banner,
                                  uuid)
         self.delete_banner(banner)
         self.set_status(204)
@@ -64,8 +66,10 @@ class BannersHandler(base.APIBaseHandler):
     Allowed methods: GET, POST, PATCH
     """
     def get(self):
-        return self.finish_objects(forms.BannersForm,
-                                   query=models.Banner.query.order_by("number asc"))
+        return self.finish_rows(forms.BannersForm,
+                                models.Banner.query,
+                                readers.Reader.banners,
+                                order_entity=models.Banner)
 
     @base.authenticated(admin=True)
     def post(self):
@@ -84,19 +88,18 @@ class BannersHandler(base.APIBaseHandler):
         form = forms.BannerSortForm(self.json_args,
                                     locale_code=self.locale.code)
         if form.validate():
-            self.resort_banner(form)
-            self.finish_objects(forms.BannersForm,
-                                models.Banner)
+            ids = self.resort_banner(form)
+            self.finish(json.dumps({
+                'order': [id.hex for id in ids],
+            }))
         else:
             self.validation_error(form)
 
     @base.db_success_or_500
     def create_banner(self, form):
-        maxnum = self.session.query(func.max(models.Banner.number)).first()[0]
-        number = maxnum + 1 if maxnum else models.Banner.query.count()
         banner = models.Banner(
             cover=form.cover.data,
-            number=number,
+            number=counters.allocate('banner_number'),
             url=form.url.data
         )
         self.session.add(banner)
@@ -105,11 +108,10 @@ class BannersHandler(base.APIBaseHandler):
 
     @base.db_success_or_500
     def resort_banner(self, form):
-        for i in range(0, len(form.banners.data)):
-            banner = form.banners.data[i]
-            banner.number = i
+        ids = [o.id for o in form.banners.data]
+        database.reorder(self.session, models.Banner, ids)
 
-        self.session.flush()
+        return ids
 
 
 class HomePhotographerHandler(base.APIBaseHandler):
@@ -123,7 +125,7 @@ class HomePhotographerHandler(base.APIBaseHandler):
 
     @base.authenticated(admin=True)
     def delete(self, uuid):
-        hp = self.get_or_404(models.HomePhotographer.query,
+        hp = self.get_or_404(models.HomePhotographer,
                              uuid)
         self.delete_home_photographer(hp)
         self.set_status(204)
@@ -140,8 +142,42 @@ class HomePhotographersHandler(base.APIBaseHandler):
     Allowed methods: GET, POST, PATCH
     """
     def get(self):
-        return self.finish_objects(forms.HomePhotographersForm,
-                                   query=models.HomePhotographer.query.order_by("number asc"))
+        form = forms.HomePhotographersForm(self.request.arguments,
+                                           locale_code=self.locale.code)
+        if not form.validate():
+            self.validation_error(form)
+        if cards.serves(form):
+            return self.finish_home_cards(form)
+
+        query = self.session.query(models.User)\
+            .join(models.HomePhotographer,
+                  models.HomePhotographer.id == models.User.id)
+        return self.finish_rows(forms.HomePhotographersForm,
+                                query,
+                                readers.Reader.photographers,
+                                order_entity=models.HomePhotographer,
+                                form=form)
+
+    def finish_home_cards(self, form):
+        """
+        Home photographers stay on the page after they stop being
+        listed and lose their card; those are rendered from the live
+        tables like the fields= path does.
+        """
+        reader = readers.Reader(self.session)
+        rows = reader.execute(cards.home_statement(
+            form.sortby.data, form.order.data,
+            form.offset.data, form.limit.data))
+        missing = [id for id, detail in rows if detail is None]
+        if missing:
+            query = models.User.query.filter(models.User.id.in_(missing))
+            rendered = dict((user.id, json.dumps(user.format_detail()))
+                            for user in reader.photographers(query))
+        else:
+            rendered = dict()
+        self.finish(cards.dumps(rendered[id] if detail is None else detail
+                                for id, detail in rows
+                                if detail is not None or id in rendered))
 
     @base.authenticated(admin=True)
     def post(self):
@@ -160,20 +196,18 @@ class HomePhotographersHandler(base.APIBaseHandler):
         form = forms.HomePhotographerSortForm(self.json_args,
                                               locale_code=self.locale.code)
         if form.validate():
-            self.resort_home_photographer(form)
-            self.finish_objects(forms.HomePhotographersForm,
-                                models.HomePhotographer)
+            ids = self.resort_home_photographer(form)
+            self.finish(json.dumps({
+                'order': [id.hex for id in ids],
+            }))
         else:
             self.validation_error(form)
 
     @base.db_success_or_pass
     def create_home_photographer(self, form):
-        maxnum = self.session.query(func.max(models.HomePhotographer.number)).first()[0]
-        number = maxnum + 1 if maxnum else models.HomePhotographer.query.count()
-
         hp = models.HomePhotographer(
             photographer=form.photographer.data,
-            number=number
+            number=counters.allocate('home_photographer_number')
         )
         self.session.add(hp)
 
@@ -181,11 +215,10 @@ class HomePhotographersHandler(base.APIBaseHandler):
 
     @base.db_success_or_500
     def resort_home_photographer(self, form):
-        for i in range(0, len(form.photographers.data)):
-            hp = form.photographers.data[i]
-            hp.number = i
+        ids = [o.id for o in form.photographers.data]
+        database.reorder(self.session, models.HomePhotographer, ids)
 
-        self.session.flush()
+        return ids
 
 
 class HomeCollectionHandler(base.APIBaseHandler):
@@ -199,7 +232,7 @@ class HomeCollectionHandler(base.APIBaseHandler):
 
     @base.authenticated(admin=True)
     def delete(self, uuid):
-        hc = self.get_or_404(models.HomeCollection.query,
+        hc = self.get_or_404(models.HomeCollection,
                              uuid)
         self.delete_home_collection(hc)
         self.set_status(204)
@@ -216,8 +249,13 @@ class HomeCollectionsHandler(base.APIBaseHandler):
         Allowed methods: GET, POST, PATCH
     """
     def get(self):
-        return self.finish_objects(forms.HomeCollectionsForm,
-                                   models.HomeCollection)
+        query = self.session.query(models.Collection)\
+            .join(models.HomeCollection,
+                  models.HomeCollection.id == models.Collection.id)
+        return self.finish_rows(forms.HomeCollectionsForm,
+                                query,
+                                readers.Reader.collections,
+                                order_entity=models.HomeCollection)
 
     @base.authenticated(admin=True)
     def post(self):
@@ -236,20 +274,18 @@ class HomeCollectionsHandler(base.APIBaseHandler):
         form = forms.HomeCollectionSortForm(self.json_args,
                                             locale_code=self.locale.code)
         if form.validate():
-            self.resort_home_collection(form)
-            self.finish_objects(forms.HomeCollectionsForm,
-                                models.HomeCollection)
+            ids = self.resort_home_collection(form)
+            self.finish(json.dumps({
+                'order': [id.hex for id in ids],
+            }))
         else:
             self.validation_error(form)
 
     @base.db_success_or_500
     def create_home_collection(self, form):
-        maxnum = self.session.query(func.max(models.HomeCollection.number)).first()[0]
-        number = maxnum + 1 if maxnum else models.HomeCollection.query.count()
-
         hc = models.HomeCollection(
             collection=form.collection.data,
-            number=number
+            number=counters.allocate('home_collection_number')
         )
         self.session.add(hc)
 
@@ -257,8 +293,7 @@ class HomeCollectionsHandler(base.APIBaseHandler):
 
     @base.db_success_or_500
     def resort_home_collection(self, form):
-        for i in range(0, len(form.collections.data)):
-            hc = form.collections.data[i]
-            hc.number = i
+        ids = [o.id for o in form.collections.data]
+        database.reorder(self.session, models.HomeCollection, ids)
 
-        self.session.flush()
+        return ids
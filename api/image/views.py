@@ -14,14 +14,9 @@ from tornado.httpclient import (
 )
 from pymysql.err import IntegrityError
 
-from PIL import (
-    Image,
-    ImageFont,
-    ImageDraw,
-)
-
 import util
 import models
+import instrument
 from settings import cdn_settings
 from .. import base
 
@@ -111,7 +106,8 @@ class ImageUploadHandler(base.APIBaseHandler):
                                                  validate_cert=False)
 
         try:
-            response = yield AsyncHTTPClient().fetch(request)
+            with instrument.timer('cos'):
+                response = yield AsyncHTTPClient().fetch(request)
         except HTTPError as e:
             print(e.response)
             raise base.JSONHTTPError(e.code)
@@ -123,12 +119,14 @@ class ImageUploadHandler(base.APIBaseHandler):
         temp = tempfile.NamedTemporaryFile('wb+', delete=True)
         file['file'].seek(0)
         temp.write(file['file'].read())
-        img = Image.open(temp.name)
-        w, h = img.size
-        if w >= h:
-            img.resize((1080, int(1080.0 * h / w))).save(temp.name, img.format)
-        elif w < h:
-            img.resize((int(1080.0 * w / h), 1080)).save(temp.name, img.format)
+        with instrument.timer('pil'):
+            from PIL import Image
+            img = Image.open(temp.name)
+            w, h = img.size
+            if w >= h:
+                img.resize((1080, int(1080.0 * h / w))).save(temp.name, img.format)
+            elif w < h:
+                img.resize((int(1080.0 * w / h), 1080)).save(temp.name, img.format)
         temp.seek(0)
 
         return {
@@ -141,12 +139,14 @@ class ImageUploadHandler(base.APIBaseHandler):
         temp = tempfile.NamedTemporaryFile('wb+', delete=True)
         file['file'].seek(0)
         temp.write(file['file'].read())
-        img = Image.open(temp.name)
-        w, h = img.size
-        if w >= h:
-            img.crop((w/2 - h/2, 0, w/2 + h/2, h)).save(temp.name, img.format)
-        elif w < h:
-            img.crop((0, h/2 - w/2, w, h/2 + w/2)).save(temp.name, img.format)
+        with instrument.timer('pil'):
+            from PIL import Image
+            img = Image.open(temp.name)
+            w, h = img.size
+            if w >= h:
+                img.crop((w/2 - h/2, 0, w/2 + h/2, h)).save(temp.name, img.format)
+            elif w < h:
+                img.crop((0, h/2 - w/2, w, h/2 + w/2)).save(temp.name, img.format)
 
         temp.seek(0)
 
@@ -156,6 +156,17 @@ class ImageUploadHandler(base.APIBaseHandler):
         }
 
     def add_watermark(self, file):
+        with instrument.timer('pil'):
+            self.draw_watermark(file)
+        file.seek(0)
+
+    def draw_watermark(self, file):
+        from PIL import (
+            Image,
+            ImageFont,
+            ImageDraw,
+        )
+
         img = Image.open(file.name)
         text = "©youpai/{}".format(self.current_user.name)
         rgba_img = img.convert('RGBA')
@@ -169,4 +180,3 @@ class ImageUploadHandler(base.APIBaseHandler):
         img_with_text = Image.alpha_composite(rgba_img, text_overlay)
 
         img_with_text.save(file.name, img.format)
-        file.seek(0)
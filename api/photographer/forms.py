@@ -22,11 +22,18 @@ from .. import baseForms
 from .. import baseValidators
 
 
-class PhotographersForm(Form, baseForms.SliceMixin):
+class PhotographerForm(Form, baseForms.FieldsetMixin):
+    fieldset_model = models.User
+
+
+class PhotographersForm(Form, baseForms.SliceMixin, baseForms.SinceMixin,
+                        baseForms.FieldsetMixin):
+    fieldset_model = models.User
     sortby = SelectField('sortby', default="number", choices=[
         ("number", "number"),
         ("create_time", "create_time"),
         ("likes", "likes"),
+        ("trending", "trending"),
     ])
     order = SelectField('order', default="asc", choices=[
         ("asc", "asc"),
@@ -46,7 +53,9 @@ class PhotographersForm(Form, baseForms.SliceMixin):
     ])
 
 
-class PhotographersSearchForm(Form, baseForms.SliceMixin):
+class PhotographersSearchForm(Form, baseForms.SliceMixin,
+                              baseForms.FieldsetMixin):
+    fieldset_model = models.User
     keyword = StringField("keyword")
     sortby = SelectField('sortby', default="number", choices=[
         ("number", "number"),
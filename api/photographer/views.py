@@ -1,13 +1,24 @@
 import json
-from sqlalchemy import or_
+from sqlalchemy import (
+    or_,
+    bindparam,
+)
+from sqlalchemy.orm import Query
 
+import cards
 import models
+import counters
+import readers
+import database
+import leaderboard
+import taxonomy
 from .. import base
 from . import forms
 
 
 __all__ = [
     "PhotographerHandler",
+    "PhotographerSimilarHandler",
     "PhotographersHandler",
     "PhotographersCountHandler",
     "PhotographersSearchHandler",
@@ -25,7 +36,25 @@ class PhotographerHandler(base.APIBaseHandler):
         Get a photographer's info.
         """
         self.finish_object(models.User,
-                           uuid)
+                           uuid,
+                           Form=forms.PhotographerForm)
+
+
+class PhotographerSimilarHandler(base.APIBaseHandler):
+    """
+    URL: /photographer/(?P<uuid>[0-9a-fA-F]{32})/similar
+    Allowed methods: GET
+    """
+    def get(self, uuid):
+        """
+        Cards of the photographers most like this one, as last
+        computed by recommend.build.
+        """
+        photographer = self.get_or_404(models.User,
+                                       uuid)
+        statement = database.statement(('similar_photographers',),
+                                       cards.similar_statement)
+        self.finish_cards(statement, {'user_id': photographer.id})
 
 
 class PhotographersHandler(base.APIBaseHandler):
@@ -43,25 +72,128 @@ class PhotographersHandler(base.APIBaseHandler):
         form = forms.PhotographersForm(args,
                                        locale_code=self.locale.code)
         if form.validate():
-            query = models.User.query\
-                .filter_by(is_admin=False, status='reviewed')\
-                .filter(or_(models.User.styles.contains(s) for s in form.styles.data))\
-                .filter(or_(models.User.school == s for s in form.schools.data))\
-                .filter(or_(models.User.categories.contains(c) for c in form.categories.data))\
-                .filter(or_(models.User.themes.contains(t) for t in form.themes.data))
-
-            objects_query = self.apply_order(query, form)
-            objects = objects_query.all()
-
-            response = list()
-            for obj in objects:
-                response.append(
-                    obj.format_detail()
-                )
-            self.finish(json.dumps(response))
+            fieldset = self.fieldset(form)
+            if not (form.styles.data or form.schools.data
+                    or form.categories.data or form.themes.data):
+                count = counters.get(self.session, 'photographers')
+                if count is not None:
+                    self.set_header('X-Total-Count', count)
+            if form.since.data is not None:
+                query = models.User.query\
+                    .filter_by(is_admin=False, status='reviewed')\
+                    .filter(or_(models.User.styles.any(models.Style.id == s.id)
+                                for s in form.styles.data))\
+                    .filter(or_(models.User.school_id == s.id for s in form.schools.data))\
+                    .filter(or_(models.User.categories.any(models.Category.id == c.id)
+                                for c in form.categories.data))\
+                    .filter(or_(models.User.themes.any(models.Theme.id == t.id)
+                                for t in form.themes.data))
+                return self.finish_changes(form, query,
+                                           models.User, 'photographer',
+                                           read=readers.Reader.photographers,
+                                           **fieldset)
+            ids = self.ranked_ids(form, self.ranking(form))
+            if ids is not None:
+                return self.finish_ranked(form, ids)
+            if cards.serves(form):
+                return self.finish_cards(*self.page_statement(form, card=True))
+
+            statement, params = self.page_statement(form)
+            users = readers.Reader(self.session, **fieldset)\
+                .photographers(statement, params)
+            self.finish(json.dumps(
+                [user.format_detail(**fieldset) for user in users]
+            ))
         else:
             self.validation_error(form)
 
+    @staticmethod
+    def ranking(form):
+        """
+        The leaderboard for an unfiltered or single-theme page.
+        """
+        if form.styles.data or form.schools.data or form.categories.data \
+                or len(form.themes.data) > 1:
+            return None
+        theme_id = form.themes.data[0].id if form.themes.data else None
+        return models.User, leaderboard.photographers_key(theme_id)
+
+    def finish_ranked(self, form, ids):
+        fieldset = self.fieldset(form)
+        reader = readers.Reader(self.session, **fieldset)
+        if not ids:
+            return self.finish(json.dumps([]))
+        if cards.serves(form):
+            rows = reader.execute(cards.ids_statement(ids))
+            details = leaderboard.ordered(rows, ids, lambda row: row[0])
+            return self.finish(cards.dumps(detail for id, detail in details))
+
+        query = models.User.query\
+            .filter_by(is_admin=False, status='reviewed')\
+            .filter(models.User.id.in_(ids))
+        users = leaderboard.ordered(reader.photographers(query), ids,
+                                    lambda user: user.id)
+        self.finish(json.dumps(
+            [user.format_detail(**fieldset) for user in users]
+        ))
+
+    @staticmethod
+    def page_statement(form, card=False):
+        """
+        The cached statement for this combination of filter counts,
+        ordering and slicing, and its parameters; with card, the one
+        reading photographer_card.
+        """
+        filters = (
+            ('style', form.styles.data),
+            ('school', form.schools.data),
+            ('category', form.categories.data),
+            ('theme', form.themes.data),
+        )
+        params = dict()
+        for name, objects in filters:
+            for i, obj in enumerate(objects):
+                params['%s_%d' % (name, i)] = cards.facet_key(obj.id) \
+                    if card and name != 'school' else obj.id
+        if form.offset.data is not None:
+            params['offset'] = form.offset.data
+        if form.limit.data is not None:
+            params['limit'] = form.limit.data
+
+        key = ('photographer_cards' if card else 'photographers',
+               tuple(len(objects) for name, objects in filters),
+               form.sortby.data, form.order.data,
+               'offset' in params, 'limit' in params)
+        build = cards.page_statement if card else page_statement
+        statement = database.statement(key, lambda: build(*key[1:]))
+
+        return statement, params
+
+
+def page_statement(counts, sortby, order, offset, limit):
+    User = models.User
+    styles, schools, categories, themes = counts
+    column = getattr(User, sortby)
+    query = Query(User)\
+        .filter_by(is_admin=False, status='reviewed')\
+        .filter(or_(*[User.styles.any(models.Style.id == bindparam('style_%d' % i))
+                      for i in range(styles)]))\
+        .filter(or_(*[User.school_id == bindparam('school_%d' % i)
+                      for i in range(schools)]))\
+        .filter(or_(*[User.categories.any(models.Category.id == bindparam('category_%d' % i))
+                      for i in range(categories)]))\
+        .filter(or_(*[User.themes.any(models.Theme.id == bindparam('theme_%d' % i))
+                      for i in range(themes)]))\
+        .order_by(column.desc() if order == 'desc' else column.asc())\
+        .with_entities(*readers.UserRow.columns())
+    statement = query.statement
+    if offset:
+        statement = statement.offset(bindparam('offset'))
+    if limit:
+        statement = statement.limit(bindparam('limit'))
+
+    return statement
+
 
 class PhotographersCountHandler(base.APIBaseHandler):
     """
@@ -70,7 +202,8 @@ class PhotographersCountHandler(base.APIBaseHandler):
     """
     def get(self):
         self.finish_objects_count(
-            query=models.User.filter_by(is_admin=False, status='reviewed'))
+            query=models.User.query.filter_by(is_admin=False, status='reviewed'),
+            count=counters.get(self.session, 'photographers'))
 
 
 class PhotographersSearchHandler(base.APIBaseHandler):
@@ -82,21 +215,20 @@ class PhotographersSearchHandler(base.APIBaseHandler):
         form = forms.PhotographersSearchForm(self.request.arguments,
                                              locale_code=self.locale.code)
         if form.validate():
+            if cards.serves(form):
+                return self.finish_cards(cards.search_statement(
+                    form.keyword.data, form.sortby.data, form.order.data,
+                    form.offset.data, form.limit.data))
             if form.keyword.data:
                 query = models.User.query\
                     .filter_by(is_admin=False, status='reviewed')\
                     .filter(or_(models.User.name.like('%'+k+'%') for k in form.keyword.data))
             else:
                 query = models.User.query.filter_by(is_admin=False, status='reviewed')
-            objects_query = self.apply_order(query, form)
-            objects = objects_query.all()
-
-            response = list()
-            for obj in objects:
-                response.append(
-                    obj.format_detail()
-                )
-            self.finish(json.dumps(response))
+            self.finish_rows(forms.PhotographersSearchForm,
+                             query,
+                             readers.Reader.photographers,
+                             form=form)
         else:
             self.validation_error(form)
 
@@ -107,16 +239,12 @@ class PhotographerOptionHandler(base.APIBaseHandler):
     Allowed methods: GET
     """
     def get(self):
-        styles = models.Style.query.order_by("id desc").all()
-        schools = models.School.query.order_by("id desc").all()
-        categories = models.Category.query.order_by("id desc").all()
-        themes = models.Theme.query.order_by("create_time asc").all()
-
+        registry = taxonomy.registry
         response = {
-            "styles": [style.format_detail() for style in styles],
-            "school": [school.format_detail() for school in schools],
-            "categories": [category.format_detail() for category in categories],
-            "themes": [theme.format_detail() for theme in themes]
+            "styles": [style.format_detail() for style in registry.all('style')],
+            "school": [school.format_detail() for school in registry.all('school')],
+            "categories": [category.format_detail() for category in registry.all('category')],
+            "themes": [theme.format_detail() for theme in registry.all('theme')]
         }
 
         self.finish(json.dumps(response))
@@ -127,6 +255,7 @@ class PhotographerOptionHandler(base.APIBaseHandler):
                                             locale_code=self.locale.code)
         if form.validate():
             option = self.create_option(form)
+            taxonomy.registry.invalidate(self.redis_cli, self.session)
             self.finish(
                 option.format_detail()
             )
@@ -20,10 +20,13 @@ from .. import baseForms
 from .. import baseValidators
 
 
-class ThemeCollectionsForm(Form, baseForms.SliceMixin):
+class ThemeCollectionsForm(Form, baseForms.SliceMixin, baseForms.SinceMixin,
+                           baseForms.FieldsetMixin):
+    fieldset_model = models.Collection
     sortby = SelectField('sortby', default="likes", choices=[
         ("create_time", "create_time"),
         ("likes", "likes"),
+        ("trending", "trending"),
     ])
     order = SelectField('order', default="asc", choices=[
         ("asc", "asc"),
@@ -31,7 +34,8 @@ class ThemeCollectionsForm(Form, baseForms.SliceMixin):
     ])
 
 
-class ThemesForm(Form, baseForms.SliceMixin):
+class ThemesForm(Form, baseForms.SliceMixin, baseForms.FieldsetMixin):
+    fieldset_model = models.Theme
     sortby = SelectField('sortby', default="create_time", choices=[
         ("create_time", "create_time"),
         ("name", "name"),
@@ -1,6 +1,15 @@
 import json
 
+from sqlalchemy import and_
+
+import util
+import cards
 import models
+import database
+import counters
+import leaderboard
+import readers
+import taxonomy
 from .. import base
 from . import forms
 
@@ -30,10 +39,11 @@ class ThemeHandler(base.APIBaseHandler):
     def patch(self, uuid):
         form = forms.ThemeForm(self.json_args,
                                locale_code=self.locale.code)
-        theme = self.get_or_404(models.Theme.query,
+        theme = self.get_or_404(models.Theme,
                                 uuid)
         if form.validate():
             self.edit_theme(theme, form)
+            taxonomy.registry.invalidate(self.redis_cli, self.session)
             self.finish(json.dumps(
                 theme.format_detail()
             ))
@@ -42,9 +52,12 @@ class ThemeHandler(base.APIBaseHandler):
 
     @base.authenticated(admin=True)
     def delete(self, uuid):
-        theme = self.get_or_404(models.Theme.query,
+        theme = self.get_or_404(models.Theme,
                                 uuid)
+        theme_id = theme.id
         self.delete_theme(theme)
+        leaderboard.drop_theme(self.redis_cli, theme_id)
+        taxonomy.registry.invalidate(self.redis_cli, self.session)
         self.set_status(204)
         self.finish()
 
@@ -59,6 +72,10 @@ class ThemeHandler(base.APIBaseHandler):
 
     @base.db_success_or_500
     def delete_theme(self, theme):
+        self.session.add(models.Tombstone('theme', theme.id))
+        self.session.execute(cards.facet_table.delete().where(and_(
+            cards.facet_table.c.kind == 'theme',
+            cards.facet_table.c.facet_id == theme.id.hex)))
         self.session.delete(theme)
 
 
@@ -83,6 +100,7 @@ class ThemesHandler(base.APIBaseHandler):
                                locale_code=self.locale.code)
         if form.validate():
             theme = self.create_theme(form)
+            taxonomy.registry.invalidate(self.redis_cli, self.session)
             self.set_status(201)
             self.finish(json.dumps(
                 theme.format_detail()
@@ -100,6 +118,7 @@ class ThemesHandler(base.APIBaseHandler):
             for collection in form.collections.data:
                 if collection not in theme.collections:
                     theme.collections.append(collection)
+                    counters.add(theme, 'collection_count', 1)
         self.session.add(theme)
 
         return theme
@@ -110,7 +129,7 @@ class ThemesCountHandler(base.APIBaseHandler):
     URL: /theme/count
     """
     def get(self):
-        self.finish_objects_count(models.Theme)
+        self.finish_objects_count(count=len(taxonomy.registry.all('theme')))
 
 
 class ThemeCollectionHandler(base. APIBaseHandler):
@@ -119,7 +138,7 @@ class ThemeCollectionHandler(base. APIBaseHandler):
     Allowed methods: GET, DELETE
     """
     def get(self, theme_id, col_id):
-        theme = self.get_or_404(models.Theme.query, theme_id)
+        theme = self.get_or_404(models.Theme, theme_id)
         collection = self.get_or_404(theme.collections, col_id)
 
         self.finish(json.dumps(
@@ -128,20 +147,33 @@ class ThemeCollectionHandler(base. APIBaseHandler):
 
     @base.authenticated(admin=True)
     def delete(self, theme_id, col_id):
-        theme = self.get_or_404(models.Theme.query,
+        theme = self.get_or_404(models.Theme,
                                 theme_id)
-        collection = self.get_or_404(models.Collection.query,
-                                     col_id)
-        self.delete_theme_collection(theme, collection)
+        collection = self.get_or_404(theme.collections,
+                                     id=col_id)
+        left = self.delete_theme_collection(theme, collection)
+        leaderboard.remove_theme_collection(self.redis_cli, theme.id, collection.id,
+                                            collection.user_id if left else None)
         self.set_status(204)
         self.finish()
 
     @base.db_success_or_500
     def delete_theme_collection(self, theme, collection):
-        theme.collections.remove(collection)
-        self.session.flush()
+        self.session.add(models.Tombstone('theme_collection',
+                                          collection.id,
+                                          theme.id))
+        database.change_association(self.session, models.theme_collection_table,
+                                    'theme_id', theme.id, 'collection_id',
+                                    removed=[collection.id])
+        counters.add(theme, 'collection_count', -1)
         if not theme.collections.filter_by(user=collection.user).first():
-            collection.user.themes.remove(theme)
+            database.change_association(self.session, models.theme_photographer_table,
+                                        'photographer_id', collection.user_id, 'theme_id',
+                                        removed=[theme.id])
+            collection.user.updated_at = util.get_utc_time()
+            cards.refresh(self.session, collection.user)
+            return True
+        return False
 
 
 class ThemeCollectionsHandler(base.APIBaseHandler):
@@ -150,18 +182,25 @@ class ThemeCollectionsHandler(base.APIBaseHandler):
     Allowed methods: GET
     """
     def get(self, uuid):
-        theme = self.get_or_404(models.Theme.query, uuid)
+        theme = self.get_or_404(models.Theme, uuid)
 
-        self.finish_objects(forms.ThemeCollectionsForm,
-                            query=theme.collections)
+        self.set_header('X-Total-Count', theme.collection_count)
+        self.finish_rows(forms.ThemeCollectionsForm,
+                         theme.collections,
+                         readers.Reader.collections,
+                         feed=(models.Collection, 'theme_collection', theme.id),
+                         ranking=(models.Collection,
+                                  leaderboard.theme_collections_key(theme.id)))
 
     @base.authenticated(admin=True)
     def post(self, uuid):
-        theme = self.get_or_404(models.Theme.query, uuid)
+        theme = self.get_or_404(models.Theme, uuid)
         form = forms.ThemeCollectionForm(self.json_args,
                                          locale_code=self.locale.code)
         if form.validate():
             self.add_theme_collection(theme, form.collection.data)
+            leaderboard.add_theme_collection(self.redis_cli, theme.id,
+                                             form.collection.data)
             self.finish(json.dumps(
                 form.collection.data.format_detail()
             ))
@@ -172,9 +211,13 @@ class ThemeCollectionsHandler(base.APIBaseHandler):
     def add_theme_collection(self, theme, collection):
         if collection not in theme.collections:
             theme.collections.append(collection)
+            collection.updated_at = util.get_utc_time()
+            counters.add(theme, 'collection_count', 1)
 
         if theme not in collection.user.themes:
             collection.user.themes.append(theme)
+            collection.user.updated_at = util.get_utc_time()
+            cards.refresh(self.session, collection.user)
 
 
 class ThemeCollectionsCountHandler(base.APIBaseHandler):
@@ -183,8 +226,8 @@ class ThemeCollectionsCountHandler(base.APIBaseHandler):
     Allowed methods: GET
     """
     def get(self, uuid):
-        theme = self.get_or_404(models.Theme.query,
+        theme = self.get_or_404(models.Theme,
                                 uuid)
 
-        self.finish_objects_count(query=theme.collections)
+        self.finish_objects_count(count=theme.collection_count)
 
@@ -19,6 +19,7 @@ urls = [
     (r"/home/collection", "home.HomeCollectionsHandler"),
     (r"/image", "image.ImageUploadHandler"),
     (r"/photographer/(?P<uuid>[0-9a-fA-F]{32})", "photographer.PhotographerHandler"),
+    (r"/photographer/(?P<uuid>[0-9a-fA-F]{32})/similar", "photographer.PhotographerSimilarHandler"),
     (r"/photographer", "photographer.PhotographersHandler"),
     (r"/photographer/count", "photographer.PhotographersCountHandler"),
     (r"/photographer/search", "photographer.PhotographersSearchHandler"),
@@ -88,17 +88,11 @@ class ProfileForm(Form):
             raise StopValidation(_("密码错误."))
 
     def validate_tags(form, field):
-        current_user = form.kwargs.get("current_user", None)
-        if current_user is None:
-            return
-        tags = list()
+        texts = list()
         for text in list(field.data):
-            nd = models.Tag(
-                user=current_user,
-                text=text
-            )
-            tags.append(nd)
-        field.data = tags
+            if text not in texts:
+                texts.append(text)
+        field.data = texts
 
     def validate_sex(form, field):
         current_user = form.kwargs.get("current_user", None)
@@ -1,23 +1,24 @@
 import json
+import time
 import string
 import random
 
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-
 import tornado.httpclient
 from tornado import gen
 
 from sqlalchemy import (
-    func,
     or_,
 )
 
-from tornado_smtpclient.client import SMTPAsync
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
 
 import util
+import cards
 import models
+import database
+import instrument
+import counters
+import leaderboard
 from settings import mail_settings
 from .. import base
 from . import forms
@@ -36,6 +37,11 @@ __all__ = [
 class MailMixin():
     @gen.coroutine
     def send_confirm_mail(self, user):
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+        from tornado_smtpclient.client import SMTPAsync
+
+        start = time.time()
         s = SMTPAsync()
         yield s.connect(mail_settings['host'], mail_settings['port'])
         yield s.starttls()
@@ -65,6 +71,7 @@ class MailMixin():
 
         yield s.sendmail(me, user.email, msg.as_string())
         yield s.quit()
+        instrument.record('smtp', time.time() - start)
 
     def generate_confirmation_token(self, user, expiration=86400):
         s = Serializer(self.application.settings['cookie_secret'], expiration)
@@ -102,12 +109,10 @@ class RegisterHandler(base.APIBaseHandler, MailMixin):
         admin = models.User.query.filter_by(number=0).first()
         avatar = admin.images.filter_by(filename=avatar_name).first()
 
-        number = self.session.query(func.max(models.User.number)).first()[0] + 1
-
         user = models.User(email=form.email.data,
                            name=form.name.data,
                            avatar=avatar,
-                           number=number)
+                           number=counters.allocate('user_number'))
         user.set_password(form.password.data)
 
         self.session.add(user)
@@ -135,7 +140,7 @@ class ConfirmationHandler(base.APIBaseHandler):
     Allowed methods: POST
     """
     def post(self, uuid, token):
-        user = self.get_or_404(models.User.query,
+        user = self.get_or_404(models.User,
                                uuid)
         if not self.confirm(user, token):
             self.set_status(403)
@@ -165,7 +170,7 @@ class ResendConfirmationHandler(base.APIBaseHandler, MailMixin):
     @base.authenticated(status=("unconfirmed",))
     @gen.coroutine
     def post(self, uuid):
-        user = self.get_or_404(models.User.query,
+        user = self.get_or_404(models.User,
                                uuid)
         yield self.send_confirm_mail(user)
         self.finish()
@@ -246,34 +251,41 @@ class ProfileHandler(base.APIBaseHandler):
         if form.avatar.data:
             self.current_user.avatar = form.avatar.data
         if form.school.data:
-            self.current_user.school = form.school.data
+            self.current_user.school_id = form.school.data.id
+        changes = []
         if form.tags.data:
-            for o in self.current_user.tags:
-                self.current_user.tags.remove(o)
-                self.session.delete(o)
-            for d in form.tags.data:
-                self.current_user.tags.append(d)
+            changes += database.sync_association(
+                self.session, models.Tag.__table__,
+                'user_id', self.current_user.id,
+                'text', form.tags.data)
         if form.styles.data:
-            for o in self.current_user.styles:
-                self.current_user.styles.remove(o)
-            for s in form.styles.data:
-                self.current_user.styles.append(s)
+            changes += database.sync_association(
+                self.session, models.photographer_style_table,
+                'photographer_id', self.current_user.id,
+                'style_id', [s.id for s in form.styles.data])
         if form.categories.data:
-            for o in self.current_user.categories:
-                self.current_user.categories.remove(o)
-            for c in form.categories.data:
-                self.current_user.categories.append(c)
+            changes += database.sync_association(
+                self.session, models.photographer_category_table,
+                'photographer_id', self.current_user.id,
+                'category_id', [c.id for c in form.categories.data])
+        # the association tables are written directly, so the sync feed
+        # only sees these changes through the user's updated_at
+        if any(changes):
+            self.current_user.updated_at = util.get_utc_time()
         self.session.add(self.current_user)
+        cards.refresh(self.session, self.current_user)
 
     @base.db_success_or_500
     def submit_profile(self):
         self.current_user.status = "reviewing"
         self.session.add(self.current_user)
+        cards.refresh(self.session, self.current_user)
 
     @base.db_success_or_500
     def cancel_submit_profile(self):
         self.current_user.status = "confirmed"
         self.session.add(self.current_user)
+        cards.refresh(self.session, self.current_user)
 
 
 class UserQueryHandler(base.APIBaseHandler):
@@ -312,6 +324,7 @@ class ActivateHandler(base.APIBaseHandler):
         if form.validate():
             user = form.kwargs['user']
             user = yield self.activate_user(user)
+            leaderboard.add_photographer(self.redis_cli, user)
 
             self.finish(json.dumps(
                 user.format_detail(get_email=True, get_collections=True)
@@ -327,6 +340,7 @@ class ActivateHandler(base.APIBaseHandler):
         if form.validate():
             user = form.kwargs['user']
             user = yield self.unactivate_user(user)
+            leaderboard.remove_photographer(self.redis_cli, user)
 
             self.finish(json.dumps(
                 user.format_detail()
@@ -337,24 +351,35 @@ class ActivateHandler(base.APIBaseHandler):
     @base.db_success_or_500
     @gen.coroutine
     def activate_user(self, user):
+        if user.status != "reviewed" and not user.is_admin:
+            counters.incr(self.session, 'photographers', 1)
         user.status = "reviewed"
         self.session.add(user)
-        self.session.flush()
+        cards.refresh(self.session, user)
         yield self.send_activate_mail(user)
         return user
 
     @base.db_success_or_500
     @gen.coroutine
     def unactivate_user(self, user):
+        if user.status == "reviewed":
+            self.session.add(models.Tombstone('photographer', user.id))
+            if not user.is_admin:
+                counters.incr(self.session, 'photographers', -1)
         user.status = "confirmed"
         self.session.add(user)
-        self.session.flush()
+        cards.refresh(self.session, user)
         yield self.send_activate_mail(user, False)
         return user
 
     @gen.coroutine
     def send_activate_mail(self, user, is_activate=True):
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+        from tornado_smtpclient.client import SMTPAsync
+
         subjects = ("【友拍平台】摄影师审核失败", "【友拍平台】摄影师审核通过")
+        start = time.time()
         s = SMTPAsync()
         yield s.connect(mail_settings['host'], mail_settings['port'])
         yield s.starttls()
@@ -393,3 +418,4 @@ class ActivateHandler(base.APIBaseHandler):
 
         yield s.sendmail(me, user.email, msg.as_string())
         yield s.quit()
+        instrument.record('smtp', time.time() - start)
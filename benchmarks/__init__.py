@@ -0,0 +1,6 @@
+"""
+Benchmarks, run from the repository root against the database in
+`settings`:
+
+    python3 -m benchmarks.<name> --help
+"""
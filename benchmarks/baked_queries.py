@@ -0,0 +1,67 @@
+"""
+Python-side cost of the hot lookups, rebuilt on every call against
+database.get_by_id and the cached photographer list statement.
+
+Each case runs against the configured database; the number that
+matters is the difference between the two rows of a case, since the
+round trip is the same for both.
+
+    python3 -m benchmarks.baked_queries --number 2000
+"""
+import argparse
+import timeit
+
+from database import (
+    db_session,
+    get_by_id,
+    query_cache_stats,
+)
+import models
+from api.photographer.views import page_statement
+import readers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    session = db_session()
+    user = models.User.query.filter_by(is_admin=False).first()
+    style = models.Style.query.first()
+    user_id = user.id.hex
+    db_session.remove()
+
+    def rebuilt_user():
+        session.query(models.User).filter(models.User.id == user_id).first()
+        session.expunge_all()
+
+    def baked_user():
+        get_by_id(session, models.User, user_id)
+        session.expunge_all()
+
+    key = ((1, 0, 0, 0), 'likes', 'desc', False, True)
+
+    def rebuilt_page():
+        statement = page_statement(*key)
+        session.execute(statement, {'style_0': style.id, 'limit': 20}).fetchall()
+
+    cached = page_statement(*key)
+
+    def cached_page():
+        readers.Reader(session).execute(cached, {'style_0': style.id, 'limit': 20})
+
+    for name, case in (('user by id, rebuilt', rebuilt_user),
+                       ('user by id, baked', baked_user),
+                       ('photographer page, rebuilt', rebuilt_page),
+                       ('photographer page, cached', cached_page)):
+        seconds = timeit.timeit(case, number=args.number)
+        print('{:<30}{:>10.1f} us/query'.format(name, seconds / args.number * 1e6))
+
+    for name, stats in sorted(query_cache_stats().items()):
+        print('{} cache: {}'.format(name, stats))
+    db_session.remove()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Cold start of a server process, from interpreter start to the first
+response.
+
+Every run is a fresh interpreter that configures tools/harness.py
+against the same SQLite file (or --database), then times the startup
+phases: the schema and seed rows, building the application (importing
+every handler) and serving one request. The first boot, which creates
+the schema, is not counted. It also reports the statements startup
+issued and which of the modules the handlers only need on first use
+(Pillow, SMTP, email) were already imported. Two runs compare like
+benchmarks.suite results:
+
+    python3 -m benchmarks.cold_start --output before.json
+    python3 -m benchmarks.cold_start --output after.json
+    python3 -m benchmarks.cold_start --compare before.json after.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+from tools import stats
+
+
+deferred_modules = ('PIL.Image', 'PIL.ImageDraw', 'PIL.ImageFont',
+                    'email.mime.multipart', 'email.mime.text',
+                    'tornado_smtpclient.client')
+
+
+def boot(database_url, skip_create):
+    """
+    Runs in the child: {phase: seconds}, the startup statement count
+    and the deferred modules imported by then.
+    """
+    phases = dict()
+    last = [time.perf_counter()]
+
+    def mark(phase):
+        now = time.perf_counter()
+        phases[phase] = now - last[0]
+        last[0] = now
+
+    from tools import harness
+    harness.configure(database_url, init=False)
+    import settings
+    settings.database_settings['create_tables'] = not skip_create
+    mark('import')
+
+    from sqlalchemy import event
+    import database
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+    event.listen(database.engine, 'before_cursor_execute', count)
+    database.startup()
+    database.db_session.remove()
+    mark('startup')
+    startup_statements = statements[0]
+
+    import main
+    application = main.make_app()
+    mark('application')
+    loaded = [name for name in deferred_modules if name in sys.modules]
+
+    from tornado.ioloop import IOLoop
+    from tornado.httpserver import HTTPServer
+    from tornado.httpclient import AsyncHTTPClient
+    port = harness.free_port()
+    HTTPServer(application).listen(port, '127.0.0.1')
+    url = 'http://127.0.0.1:{}/api/photographer'.format(port)
+    response = IOLoop.current().run_sync(
+        lambda: AsyncHTTPClient().fetch(url, raise_error=False))
+    if response.code >= 500:
+        raise RuntimeError("first request failed with {}".format(response.code))
+    mark('first_request')
+
+    return phases, startup_statements, loaded
+
+
+def run(args):
+    database_url = args.database
+    if database_url is None:
+        directory = tempfile.mkdtemp(prefix='hstxcn-')
+        database_url = 'sqlite:///' + os.path.join(directory, 'cold_start.db')
+
+    command = [sys.executable, '-m', 'benchmarks.cold_start',
+               '--child', '--database', database_url]
+    # the first boot creates the schema and seed rows
+    subprocess.check_output(command)
+    if args.skip_create:
+        command.append('--skip-create')
+
+    samples = dict()
+    for i in range(args.runs):
+        start = time.perf_counter()
+        output = subprocess.check_output(command)
+        samples.setdefault('process', []).append(time.perf_counter() - start)
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        for phase, seconds in result['phases'].items():
+            samples.setdefault(phase, []).append(seconds)
+
+    phases = dict((phase, stats.summary(values)) for phase, values in samples.items())
+    print('{:<16}{:>10}{:>10}{:>10}'.format('phase', 'p50 ms', 'p90 ms', 'max ms'))
+    for phase in ('import', 'startup', 'application', 'first_request', 'process'):
+        print('{:<16}{:>10}{:>10}{:>10}'.format(
+            phase, phases[phase]['p50_ms'], phases[phase]['p90_ms'],
+            phases[phase]['max_ms']))
+    print('startup statements: {}'.format(result['statements']))
+    print('imported before first use: {}'.format(', '.join(result['loaded']) or 'none'))
+
+    from benchmarks.suite import commit
+    return {
+        'commit': commit(),
+        'python': sys.version.split()[0],
+        'database': database_url.split(':')[0],
+        'runs': args.runs,
+        'skip_create': args.skip_create,
+        'statements': result['statements'],
+        'loaded': result['loaded'],
+        'phases': phases,
+    }
+
+
+def compare(args):
+    with open(args.compare[0]) as f:
+        baseline = json.load(f)
+    with open(args.compare[1]) as f:
+        current = json.load(f)
+    rows, regressed = stats.compare(baseline['phases'], current['phases'],
+                                    args.tolerance)
+    print('{} -> {}'.format(baseline.get('commit'), current.get('commit')))
+    for phase, metric, old, new, change, worse in rows:
+        print('{:<16}{:>12}{:>12}{:>12}{:>+9.1%}{}'.format(
+            phase, metric, old, new, change, '  !' if worse else ''))
+    print('{:<16}{:>12}{:>12}{:>12}'.format(
+        'statements', '', baseline['statements'], current['statements']))
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', help='database url, SQLite file by default')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--skip-create', action='store_true',
+                        help="boot with database_settings['create_tables'] off")
+    parser.add_argument('--output', help='write the results here as JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='compare two result files instead of running')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        phases, statements, loaded = boot(args.database, args.skip_create)
+        print(json.dumps({'phases': phases, 'statements': statements,
+                          'loaded': loaded}))
+        return
+    if args.compare:
+        sys.exit(1 if compare(args) else 0)
+
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+GUID storage: per-row conversion cost, index sizes and join speed.
+
+Conversion is timed for the old CHAR(32) implementation and for the
+current GUID in both storage modes, so it needs no database. Index
+sizes and the join are read from the configured MySQL database; run
+them before and after migrations.binary_guid to compare.
+
+    python3 -m benchmarks.guid --rows 100000 --joins 20
+"""
+import argparse
+import time
+import timeit
+import uuid
+
+from sqlalchemy import (
+    func,
+    select,
+    text,
+)
+from sqlalchemy.dialects import mysql
+
+import models
+from database import engine
+
+
+dialect = mysql.dialect()
+
+
+def legacy_bind(value):
+    if not isinstance(value, uuid.UUID):
+        return "%.32x" % uuid.UUID(value).int
+    else:
+        return "%.32x" % value.int
+
+
+def legacy_result(value):
+    return uuid.UUID(str(value))
+
+
+def make_guid(binary):
+    guid = models.GUID()
+    guid.binary = binary
+    return guid
+
+
+def conversion(rows):
+    ids = [uuid.uuid4() for i in range(1000)]
+    hexes = [i.hex for i in ids]
+    char, binary = make_guid(False), make_guid(True)
+    char_values = [char.process_bind_param(h, dialect) for h in hexes]
+    binary_values = [binary.process_bind_param(h, dialect) for h in hexes]
+    number = max(rows // len(ids), 1)
+
+    cases = [
+        ('legacy bind', lambda: [legacy_bind(h) for h in hexes]),
+        ('char bind', lambda: [char.process_bind_param(h, dialect) for h in hexes]),
+        ('binary bind', lambda: [binary.process_bind_param(h, dialect) for h in hexes]),
+        ('legacy result', lambda: [legacy_result(v) for v in char_values]),
+        ('char result', lambda: [char.process_result_value(v, dialect) for v in char_values]),
+        ('binary result', lambda: [binary.process_result_value(v, dialect) for v in binary_values]),
+    ]
+    for name, case in cases:
+        seconds = timeit.timeit(case, number=number)
+        print('{:<16}{:>10.3f} us/row'.format(name, seconds / (number * len(ids)) * 1e6))
+
+
+def index_sizes():
+    statement = text(
+        "SELECT table_name, data_length, index_length "
+        "FROM information_schema.tables "
+        "WHERE table_schema = DATABASE() ORDER BY table_name")
+    print('{:<32}{:>14}{:>14}'.format('table', 'data KiB', 'index KiB'))
+    for name, data, index in engine.execute(statement):
+        print('{:<32}{:>14.1f}{:>14.1f}'.format(name, data / 1024, index / 1024))
+
+
+def join_speed(repeat):
+    table = models.image_collection_table
+    statement = select([func.count()])\
+        .select_from(table
+                     .join(models.Image.__table__)
+                     .join(models.Collection.__table__)
+                     .join(models.User.__table__,
+                           models.Collection.user_id == models.User.id))
+    timings = []
+    with engine.connect() as conn:
+        for i in range(repeat):
+            start = time.perf_counter()
+            conn.execute(statement).scalar()
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    print('image/collection/user join: median {:.2f} ms over {} runs'.format(
+        timings[len(timings) // 2] * 1000, repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--joins', type=int, default=20)
+    parser.add_argument('--no-db', action='store_true',
+                        help="only time the conversions")
+    args = parser.parse_args()
+
+    conversion(args.rows)
+    if not args.no_db:
+        index_sizes()
+        join_speed(args.joins)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+ORM list path against readers.Reader, per page of each list endpoint.
+
+Reports median latency and, from tracemalloc, the peak traced memory
+while building one page's JSON and the blocks still held once it is
+built (the response plus whatever the session keeps alive).
+
+    python3 -m benchmarks.read_path --limit 20 --pages 5 --repeat 5
+"""
+import argparse
+import json
+import statistics
+import time
+import tracemalloc
+
+from database import db_session
+import models
+import readers
+
+
+def photographers():
+    return models.User.query\
+        .filter_by(is_admin=False, status='reviewed')\
+        .order_by("likes desc")
+
+
+def theme_collections():
+    theme = models.Theme.query.first()
+    return theme.collections.order_by("likes desc")
+
+
+def home_photographers():
+    return db_session.query(models.User)\
+        .join(models.HomePhotographer,
+              models.HomePhotographer.id == models.User.id)\
+        .order_by(models.HomePhotographer.number.asc())
+
+
+cases = [
+    ('photographers', photographers, readers.Reader.photographers),
+    ('theme_collections', theme_collections, readers.Reader.collections),
+    ('home_photographers', home_photographers, readers.Reader.photographers),
+]
+
+
+def orm_page(query):
+    return json.dumps([obj.format_detail() for obj in query.all()])
+
+
+def reader_page(query, read):
+    rows = read(readers.Reader(db_session()), query)
+    return json.dumps([row.format_detail() for row in rows])
+
+
+def measure(build_page, repeat):
+    timings = []
+    blocks = peak = 0
+    for i in range(repeat):
+        db_session.remove()
+        tracemalloc.start()
+        start = time.perf_counter()
+        page = build_page()
+        timings.append(time.perf_counter() - start)
+        snapshot = tracemalloc.take_snapshot()
+        _, peak_size = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del page
+        blocks = max(blocks, sum(s.count for s in snapshot.statistics('filename')))
+        peak = max(peak, peak_size)
+    return statistics.median(timings) * 1000, blocks, peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print('{:<20}{:>6}{:>8}{:>12}{:>10}{:>12}'.format(
+        'case', 'page', 'path', 'median ms', 'blocks', 'peak KiB'))
+    for name, make_query, read in cases:
+        for page in range(args.pages):
+            def paged():
+                return make_query().offset(page * args.limit).limit(args.limit)
+
+            for path, build_page in (
+                    ('orm', lambda: orm_page(paged())),
+                    ('core', lambda: reader_page(paged(), read))):
+                ms, blocks, peak = measure(build_page, args.repeat)
+                print('{:<20}{:>6}{:>8}{:>12.2f}{:>10}{:>12.1f}'.format(
+                    name, page, path, ms, blocks, peak))
+    db_session.remove()
+
+
+if __name__ == "__main__":
+    main()
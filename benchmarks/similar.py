@@ -0,0 +1,68 @@
+"""
+recommend.features and recommend.neighbours on synthetic
+photographers, so no database is needed.
+
+Each photographer gets a few random styles, categories and themes, a
+school and some tags drawn from a skewed vocabulary, roughly the shape
+of the real tables.
+
+    python3 -m benchmarks.similar --photographers 100000 --batch 256
+"""
+import argparse
+import time
+
+import numpy as np
+
+import recommend
+
+
+def synthetic(n, seed=0):
+    rng = np.random.RandomState(seed)
+    sizes = {
+        'style': (20, 3),
+        'category': (10, 2),
+        'theme': (30, 2),
+        'school': (50, 1),
+        'tag': (recommend.tag_vocabulary, 5),
+    }
+    blocks = dict()
+    for name, (width, per_row) in sizes.items():
+        counts = rng.randint(0 if name != 'school' else 1, per_row + 1, size=n)
+        rows = np.repeat(np.arange(n), counts)
+        if name == 'tag':
+            columns = np.minimum(rng.zipf(1.5, size=len(rows)) - 1, width - 1)
+        else:
+            columns = rng.randint(0, width, size=len(rows))
+        blocks[name] = (list(zip(rows.tolist(), columns.tolist())), width)
+    return blocks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--photographers', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=recommend.batch_size)
+    parser.add_argument('--k', type=int, default=recommend.top_k)
+    args = parser.parse_args()
+
+    blocks = synthetic(args.photographers)
+
+    start = time.perf_counter()
+    X = recommend.features(args.photographers, blocks)
+    built = time.perf_counter()
+    indices, scores = recommend.neighbours(X, args.k, args.batch)
+    done = time.perf_counter()
+
+    print('photographers      {:>10}'.format(args.photographers))
+    print('features           {:>10}'.format(X.shape[1]))
+    print('matrix             {:>10.1f} MiB'.format(X.nbytes / 2 ** 20))
+    print('similarity batch   {:>10.1f} MiB'.format(
+        args.batch * args.photographers * 4 / 2 ** 20))
+    print('build features     {:>10.2f} s'.format(built - start))
+    print('top-{} neighbours  {:>10.2f} s'.format(args.k, done - built))
+    print('per photographer   {:>10.1f} us'.format(
+        (done - built) / args.photographers * 1e6))
+    print('mean top score     {:>10.3f}'.format(float(scores[:, 0].mean())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Throughput and latency of every GET route in api/urls.py.
+
+Boots the application from tools/harness.py against a fresh SQLite
+file (or --database, e.g. a local MySQL) and the in-process Redis
+stand-in (or --redis host:port), loads a seeded dataset, serves it
+from a child process and drives each route with --concurrency clients.
+Results are written as JSON keyed by handler and query string, so runs
+on different commits can be compared:
+
+    python3 -m benchmarks.suite --output before.json
+    python3 -m benchmarks.suite --output after.json
+    python3 -m benchmarks.suite --compare before.json after.json
+"""
+import sys
+import json
+import time
+import argparse
+import datetime
+import platform
+import subprocess
+
+from tools import harness, stats
+
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load(base_url, targets, headers, requests, concurrency, warmup):
+    """
+    {(handler, query): summary} after `requests` GETs of each target.
+    """
+    from tornado import gen
+    from tornado.ioloop import IOLoop
+    from tornado.httpclient import AsyncHTTPClient
+
+    io_loop = IOLoop()
+    io_loop.make_current()
+    client = AsyncHTTPClient(max_clients=concurrency)
+
+    @gen.coroutine
+    def drive(url, count):
+        latencies = list()
+        statuses = dict()
+        remaining = [count]
+
+        @gen.coroutine
+        def worker():
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                start = time.perf_counter()
+                response = yield client.fetch(url, headers=headers,
+                                              raise_error=False)
+                latencies.append(time.perf_counter() - start)
+                statuses[response.code] = statuses.get(response.code, 0) + 1
+
+        start = time.perf_counter()
+        yield [worker() for i in range(concurrency)]
+        return latencies, statuses, time.perf_counter() - start
+
+    results = dict()
+    for handler, query, path in targets:
+        url = base_url + path
+        if warmup:
+            io_loop.run_sync(lambda: drive(url, warmup))
+        latencies, statuses, elapsed = io_loop.run_sync(lambda: drive(url, requests))
+        errors = sum(n for code, n in statuses.items() if code >= 500)
+        result = stats.summary(latencies, elapsed, errors)
+        result['statuses'] = dict((str(code), n) for code, n in sorted(statuses.items()))
+        results[(handler, query)] = result
+        print('{:<48}{:>9}{:>10}{:>10}{:>8}'.format(
+            (handler + ('?' + query if query else ''))[:47],
+            result['rps'], result['p50_ms'], result['p99_ms'], errors))
+    return results
+
+
+def run(args):
+    from tools.route_sweep import paths
+
+    redis = None
+    if args.redis:
+        host, port = args.redis.split(':')
+        redis = (host, int(port))
+    database_url = harness.configure(args.database, redis)
+    if args.generate:
+        ids = harness.generate({
+            'users': args.photographers,
+            'collections': args.photographers * args.collections,
+            'images': args.photographers * (args.collections * args.images + 1),
+            'themes': args.themes,
+        }, args.seed)
+    else:
+        ids = harness.seed(photographers=args.photographers,
+                           collections=args.collections,
+                           images=args.images,
+                           themes=args.themes)
+
+    port = harness.free_port()
+    pid = harness.fork_server(port)
+    try:
+        print('{:<48}{:>9}{:>10}{:>10}{:>8}'.format(
+            'route', 'req/s', 'p50 ms', 'p99 ms', 'errors'))
+        results = load('http://127.0.0.1:{}'.format(port), list(paths(ids)),
+                       {'Authorization': ids['auth']},
+                       args.requests, args.concurrency, args.warmup)
+    finally:
+        harness.stop_server(pid)
+
+    return {
+        'commit': commit(),
+        'time': datetime.datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'database': database_url.split(':')[0],
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'dataset': {
+            'generated': args.generate,
+            'seed': args.seed,
+            'photographers': args.photographers,
+            'collections': args.collections,
+            'images': args.images,
+            'themes': args.themes,
+        },
+        'routes': dict(('{}?{}'.format(handler, query) if query else handler, result)
+                       for (handler, query), result in results.items()),
+    }
+
+
+def compare(args):
+    with open(args.compare[0]) as f:
+        baseline = json.load(f)
+    with open(args.compare[1]) as f:
+        current = json.load(f)
+    rows, regressed = stats.compare(baseline['routes'], current['routes'],
+                                    args.tolerance)
+    print('{} -> {}'.format(baseline.get('commit'), current.get('commit')))
+    for route, metric, old, new, change, worse in rows:
+        print('{:<48}{:>12}{:>12}{:>12}{:>+9.1%}{}'.format(
+            route[:47], metric, old, new, change, '  !' if worse else ''))
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', help='database url, SQLite file by default')
+    parser.add_argument('--redis', help='host:port of a Redis server to use '
+                                        'instead of the in-process stand-in')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200,
+                        help='requests per route')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--photographers', type=int, default=100)
+    parser.add_argument('--collections', type=int, default=5)
+    parser.add_argument('--images', type=int, default=6)
+    parser.add_argument('--themes', type=int, default=8)
+    parser.add_argument('--generate', action='store_true',
+                        help='load the dataset with tools.generate_data '
+                             '(skewed, for large sizes) instead of the ORM seed')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results here as JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='compare two result files instead of running')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(args) else 0)
+
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Denormalized photographer cards.
+
+`photographer_card` holds one row per listed (reviewed, non-admin)
+photographer: the JSON of User.format_detail() and the keys
+/photographer, /photographer/search and /home/photographer filter and
+sort on. `photographer_card_facet` holds its style, category and
+theme ids. Handlers that change anything a card shows call `refresh`
+inside their transaction, so a full list page is one indexed select
+whose rows are joined into the response without being decoded. The
+likes of the photographer and of the collection the card shows are kept
+in columns of their own and spliced into the JSON by the select, so a
+like or unlike only updates those columns (see `like`).
+
+Requests with `fields=`, `expand=` or `since=` still go through
+readers. `python3 -m migrations.photographer_card` creates and fills
+the tables; run `rebuild` again after changing
+cdn_settings['image_host'] or the layout of `detail`.
+"""
+import json
+import uuid
+
+from sqlalchemy import (
+    select,
+    and_,
+    or_,
+    cast,
+    func,
+    String,
+    literal,
+    bindparam,
+)
+
+import models
+from readers import hex_id
+
+
+card_table = models.PhotographerCard.__table__
+facet_table = models.photographer_card_facet_table
+facet_kinds = ('style', 'category', 'theme')
+
+
+def listed(user):
+    return user.status == 'reviewed' and not user.is_admin
+
+
+def facet_key(id):
+    return id.hex if isinstance(id, uuid.UUID) else str(id)
+
+
+def shown_collection(user):
+    return user.cover_collection_id or user.hottest_collection_id
+
+
+def detail_column():
+    """
+    The card's JSON: `detail` with the likes and the shown collection
+    put in front of it.
+    """
+    c = card_table.c
+    collection = literal('{"likes": ') + cast(c.collection_likes, String) + \
+        literal(', ') + func.substr(c.collection_detail, 2)
+    return (literal('{"likes": ') + cast(c.likes, String) +
+            literal(', "collection": ') + func.coalesce(collection, literal('null')) +
+            literal(', ') + func.substr(c.detail, 2)).label('detail')
+
+
+def facets(user):
+    ids = {
+        'style': user.styles.with_entities(models.Style.id),
+        'category': user.categories.with_entities(models.Category.id),
+        'theme': user.themes.with_entities(models.Theme.id),
+    }
+    return [{'kind': kind, 'facet_id': facet_key(id), 'user_id': user.id}
+            for kind in facet_kinds for id, in ids[kind]]
+
+
+def refresh(session, user):
+    """
+    Bring user's card in line with the session's pending changes;
+    call it from the transaction that made them.
+    """
+    session.flush()
+    session.execute(facet_table.delete()
+                    .where(facet_table.c.user_id == user.id))
+    card = session.query(models.PhotographerCard).get(user.id)
+    if not listed(user):
+        if card is not None:
+            session.delete(card)
+        return
+
+    if card is None:
+        card = models.PhotographerCard(user.id)
+        session.add(card)
+    card.number = user.number
+    card.likes = user.likes or 0
+    card.trending = user.trending
+    card.create_time = user.create_time
+    card.name = user.name
+    card.school_id = user.school_id
+    detail = user.format_detail()
+    detail.pop('likes', None)
+    collection = detail.pop('collection', None)
+    if collection is None:
+        card.collection_likes = card.collection_detail = None
+    else:
+        card.collection_likes = collection.pop('likes', None) or 0
+        card.collection_detail = json.dumps(collection)
+    card.detail = json.dumps(detail)
+    session.flush()
+
+    rows = facets(user)
+    if rows:
+        session.execute(facet_table.insert(), rows)
+
+
+def like(session, collection, shown):
+    """
+    Carry a like or unlike of collection over to its photographer's
+    card: only the likes and trending columns are updated, unless it
+    changed the collection the card shows. shown is
+    shown_collection(collection.user) from before the like.
+    """
+    session.flush()
+    user = collection.user
+    if shown_collection(user) != shown:
+        return refresh(session, user)
+
+    def current(table, column, id):
+        return select([column]).where(table.c.id == id).as_scalar()
+    users = models.User.__table__
+    values = {
+        'likes': func.coalesce(current(users, users.c.likes, user.id), 0),
+        'trending': current(users, users.c.trending, user.id),
+    }
+    if shown == collection.id:
+        collections = models.Collection.__table__
+        values['collection_likes'] = func.coalesce(
+            current(collections, collections.c.likes, collection.id), 0)
+    session.execute(card_table.update()
+                    .where(card_table.c.user_id == user.id)
+                    .values(**values))
+
+
+def rebuild(session):
+    """
+    Regenerate every card.
+    """
+    session.execute(facet_table.delete())
+    session.query(models.PhotographerCard).delete()
+    users = session.query(models.User)\
+        .filter_by(is_admin=False, status='reviewed')\
+        .all()
+    for user in users:
+        refresh(session, user)
+    session.commit()
+
+
+def serves(form):
+    """
+    Whether a validated list form asks for whole cards.
+    """
+    since = getattr(form, 'since', None)
+    return form.fields.data is None and form.expand.data is None \
+        and (since is None or since.data is None)
+
+
+def dumps(details):
+    return '[' + ','.join(details) + ']'
+
+
+def ordered(statement, column, order, offset=None, limit=None):
+    statement = statement.order_by(column.desc() if order == 'desc'
+                                   else column.asc())
+    if offset is not None:
+        statement = statement.offset(offset)
+    if limit is not None:
+        statement = statement.limit(limit)
+
+    return statement
+
+
+def page_statement(counts, sortby, order, offset, limit):
+    """
+    /photographer: the card counterpart of
+    api.photographer.views.page_statement, taking the same parameters
+    with facet ids passed through facet_key.
+    """
+    c = card_table.c
+    styles, schools, categories, themes = counts
+    statement = select([detail_column()])
+    for kind, count in (('style', styles),
+                        ('category', categories),
+                        ('theme', themes)):
+        if not count:
+            continue
+        ids = [bindparam('%s_%d' % (kind, i)) for i in range(count)]
+        statement = statement.where(c.user_id.in_(
+            select([facet_table.c.user_id])
+            .where(and_(facet_table.c.kind == kind,
+                        facet_table.c.facet_id.in_(ids)))))
+    if schools:
+        statement = statement.where(c.school_id.in_(
+            [bindparam('school_%d' % i) for i in range(schools)]))
+
+    return ordered(statement, c[sortby], order,
+                   bindparam('offset') if offset else None,
+                   bindparam('limit') if limit else None)
+
+
+def ids_statement(ids):
+    return select([hex_id(card_table.c.user_id), detail_column()])\
+        .where(card_table.c.user_id.in_(ids))
+
+
+def similar_statement():
+    """
+    Cards of the photographers recommend.build found most like
+    :user_id, best first.
+    """
+    similar = models.SimilarPhotographer.__table__
+    return select([detail_column()])\
+        .select_from(similar.join(card_table,
+                                  similar.c.similar_id == card_table.c.user_id))\
+        .where(similar.c.user_id == bindparam('user_id'))\
+        .order_by(similar.c.rank)
+
+
+def search_statement(keywords, sortby, order, offset=None, limit=None):
+    c = card_table.c
+    statement = select([detail_column()])
+    if keywords:
+        statement = statement.where(or_(*[c.name.like('%' + k + '%')
+                                          for k in keywords]))
+
+    return ordered(statement, c[sortby], order, offset, limit)
+
+
+def home_statement(sortby, order, offset=None, limit=None):
+    """
+    (hex id, card) of every home photographer; the card is None for
+    those no longer listed, which have none.
+    """
+    home = models.HomePhotographer.__table__
+    statement = select([hex_id(home.c.id), detail_column()])\
+        .select_from(home.outerjoin(card_table,
+                                    home.c.id == card_table.c.user_id))
+
+    return ordered(statement, home.c[sortby], order, offset, limit)
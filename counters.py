@@ -0,0 +1,144 @@
+"""
+Counts kept up to date as they change, so the count endpoints and the
+X-Total-Count header don't run COUNT(*):
+
+    user.collection_count       collections of a photographer
+    theme.collection_count      collections in a theme
+    collection.image_count      images in a collection
+    counter 'photographers'     reviewed photographers
+
+The handlers that add or remove those rows call `add` or `incr` in the
+same transaction. `python3 -m counters` recomputes all of them.
+
+The same table holds the sequences `allocate` hands out numbers from.
+"""
+from sqlalchemy import (
+    inspect,
+    select,
+    func,
+)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql.expression import ClauseElement
+
+import models
+
+
+sequences = {
+    'user_number': models.User.number,
+    'banner_number': models.Banner.number,
+    'home_photographer_number': models.HomePhotographer.number,
+    'home_collection_number': models.HomeCollection.number,
+}
+
+
+def add(obj, attr, amount):
+    """
+    Add amount to obj.attr as an atomic `attr = attr + amount` at the
+    next flush; repeated calls before the flush accumulate.
+    """
+    if not amount:
+        return
+    state = inspect(obj)
+    if state.transient or state.pending:
+        setattr(obj, attr, (getattr(obj, attr) or 0) + amount)
+        return
+    current = state.dict.get(attr)
+    if not isinstance(current, ClauseElement):
+        current = getattr(type(obj), attr)
+    setattr(obj, attr, current + amount)
+
+
+def add_each(session, Model, attr, ids, amount):
+    """
+    add for the rows of Model with ids, in one UPDATE.
+    """
+    if not ids or not amount:
+        return
+    column = getattr(Model, attr)
+    session.query(Model)\
+        .filter(Model.id.in_(list(ids)))\
+        .update({column: column + amount}, synchronize_session=False)
+
+
+def incr(session, name, amount=1):
+    table = models.Counter.__table__
+    session.execute(table.update()
+                    .where(table.c.name == name)
+                    .values(value=table.c.value + amount))
+
+
+def get(session, name):
+    """
+    The counter's value, or None before `repair` first created it.
+    """
+    return session.query(models.Counter.value).filter_by(name=name).scalar()
+
+
+def allocate(name):
+    """
+    The next number of sequence name.
+
+    It is claimed in a transaction of its own, so the row lock lasts
+    one UPDATE and concurrent callers never get the same number; a
+    request that rolls back leaves a gap. A missing sequence starts
+    after the largest number in use.
+    """
+    from database import engine
+    table = models.Counter.__table__
+    for attempt in range(2):
+        with engine.begin() as conn:
+            if conn.dialect.name == 'mysql':
+                result = conn.execute(table.update()
+                                      .where(table.c.name == name)
+                                      .values(value=func.last_insert_id(table.c.value + 1)))
+                if result.rowcount:
+                    return conn.execute(select([func.last_insert_id()])).scalar()
+            else:
+                value = conn.execute(select([table.c.value])
+                                     .where(table.c.name == name)
+                                     .with_for_update()).scalar()
+                if value is not None:
+                    conn.execute(table.update()
+                                 .where(table.c.name == name)
+                                 .values(value=value + 1))
+                    return value + 1
+        try:
+            with engine.begin() as conn:
+                start = conn.execute(select([func.max(sequences[name])])).scalar()
+                conn.execute(table.insert().values(
+                    name=name, value=start if start is not None else -1))
+        except IntegrityError:
+            pass
+    raise RuntimeError("Can't allocate from sequence {}".format(name))
+
+
+def repair(session):
+    user = models.User.__table__
+    theme = models.Theme.__table__
+    collection = models.Collection.__table__
+    theme_collection = models.theme_collection_table
+    image_collection = models.image_collection_table
+
+    session.execute(user.update().values(collection_count=select([func.count()])
+        .where(collection.c.user_id == user.c.id)
+        .as_scalar()))
+    session.execute(theme.update().values(collection_count=select([func.count()])
+        .where(theme_collection.c.theme_id == theme.c.id)
+        .as_scalar()))
+    session.execute(collection.update().values(image_count=select([func.count()])
+        .where(image_collection.c.collection_id == collection.c.id)
+        .as_scalar()))
+
+    photographers = session.query(models.User)\
+        .filter_by(is_admin=False, status='reviewed')\
+        .count()
+    session.merge(models.Counter('photographers', photographers))
+    session.commit()
+
+
+if __name__ == "__main__":
+    from database import db_session
+    try:
+        repair(db_session())
+    finally:
+        db_session.remove()
@@ -1,20 +1,210 @@
-from sqlalchemy import create_engine
+import uuid
+
+from sqlalchemy import create_engine, bindparam, select, case, Integer
+from sqlalchemy.engine.url import make_url
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext import baked
+from sqlalchemy.util import LRUCache
 
+import metrics
+import instrument
 from settings import database_settings
 
+pool_options = dict()
+if make_url(database_settings["default"]).get_backend_name() != 'sqlite':
+    pool_options['poolclass'] = metrics.QueuePool
 engine = create_engine(database_settings["default"],
                        convert_unicode=True,
-                       encoding='utf-8')
-db_session = scoped_session(sessionmaker(autocommit=False,
-                                         autoflush=False,
-                                         bind=engine))
+                       encoding='utf-8',
+                       **pool_options)
+instrument.listen(engine)
+Session = sessionmaker(autocommit=False,
+                       autoflush=False,
+                       bind=engine)
+db_session = scoped_session(Session)
 
 Base = declarative_base()
 Base.query = db_session.query_property()
 
 
+class CountingLRUCache(LRUCache):
+    """
+    LRUCache that counts lookups, so the hit rate of the baked query
+    and compiled statement caches can be read.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        value = super().get(key, default)
+        if value is default:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+
+baked_cache = CountingLRUCache(500)
+compiled_cache = CountingLRUCache(500)
+statements = CountingLRUCache(200)
+
+
+def bakery(initial_fn, *args):
+    return baked.BakedQuery(baked_cache, initial_fn, args)
+
+
+def get_by_id(session, Model, id, **kwargs):
+    """
+    Model.query.filter_by(id=id, **kwargs).first(), with the query
+    built and compiled once per Model and kwargs.
+    """
+    if id is None:
+        return None
+    criteria = tuple(sorted(kwargs.items()))
+    bq = bakery(lambda s: s.query(Model), Model)
+    bq += lambda q: q.filter(Model.id == bindparam('id'))
+    if criteria:
+        bq.add_criteria(lambda q: q.filter_by(**dict(criteria)), criteria)
+
+    return bq(session).params(id=id).first()
+
+
+def normalize_id(Model, value):
+    """
+    The primary key value the identity map holds for a request id.
+    """
+    if isinstance(value, bytes):
+        value = value.decode()
+    if isinstance(Model.__mapper__.primary_key[0].type, Integer):
+        return int(value)
+    elif isinstance(value, uuid.UUID):
+        return value
+    else:
+        return uuid.UUID(value)
+
+
+def get_by_ids(session, Model, ids, **kwargs):
+    """
+    Resolve ids with at most one IN query, reusing objects already in
+    the session's identity map.
+
+    Returns the objects in input order and the ids that matched
+    nothing (or not kwargs).
+    """
+    mapper = Model.__mapper__
+    keys = list()
+    invalid = list()
+    for raw in ids:
+        try:
+            keys.append(normalize_id(Model, raw))
+        except (TypeError, ValueError):
+            keys.append(None)
+            invalid.append(raw.decode() if isinstance(raw, bytes) else str(raw))
+
+    found = dict()
+    missing = set()
+    for key in set(keys):
+        if key is None:
+            continue
+        obj = session.identity_map.get(mapper.identity_key_from_primary_key([key]))
+        if obj is None:
+            missing.add(key)
+        elif all(getattr(obj, k) == v for k, v in kwargs.items()):
+            found[key] = obj
+
+    if missing:
+        objects = session.query(Model)\
+            .filter(Model.id.in_(list(missing)))\
+            .filter_by(**kwargs)\
+            .all()
+        for obj in objects:
+            found[obj.id] = obj
+
+    objects = list()
+    for raw, key in zip(ids, keys):
+        if key is None:
+            continue
+        if key in found:
+            objects.append(found[key])
+        else:
+            invalid.append(raw.decode() if isinstance(raw, bytes) else str(raw))
+
+    return objects, invalid
+
+
+def change_association(session, table, owner, owner_id, target,
+                       added=(), removed=()):
+    """
+    Insert (owner_id, id) rows for added and delete those for removed,
+    one statement each; owner and target are column names.
+    """
+    if removed:
+        session.execute(table.delete()
+                        .where(table.c[owner] == owner_id)
+                        .where(table.c[target].in_(list(removed))))
+    if added:
+        session.execute(table.insert(),
+                        [{owner: owner_id, target: id} for id in added])
+
+
+def sync_association(session, table, owner, owner_id, target, ids):
+    """
+    Make the `target` values of owner_id exactly ids, changing only
+    the difference. Returns the added and removed values.
+    """
+    current = set(value for value, in session.execute(
+        select([table.c[target]]).where(table.c[owner] == owner_id)))
+    ids = set(ids)
+    added, removed = ids - current, current - ids
+    change_association(session, table, owner, owner_id, target,
+                       added, removed)
+
+    return added, removed
+
+
+def reorder(session, Model, ids, column='number'):
+    """
+    Set Model.column of each row in ids to its position in ids, in one
+    UPDATE ... CASE.
+    """
+    if not ids:
+        return
+    column = getattr(Model, column)
+    session.query(Model)\
+        .filter(Model.id.in_(ids))\
+        .update({column: case([(Model.id == id, i) for i, id in enumerate(ids)])},
+                synchronize_session=False)
+
+
+def statement(key, build):
+    """
+    The Core statement template for key, built on first use; execute
+    it with compiled_cache to reuse its compiled form.
+    """
+    template = statements.get(key)
+    if template is None:
+        template = build()
+        statements[key] = template
+    return template
+
+
+def query_cache_stats():
+    stats = dict()
+    for name, cache in (('baked', baked_cache), ('compiled', compiled_cache),
+                        ('statement', statements)):
+        lookups = cache.hits + cache.misses
+        stats[name] = {
+            'hits': cache.hits,
+            'misses': cache.misses,
+            'size': len(cache),
+            'hit_rate': cache.hits / lookups if lookups else None,
+        }
+    return stats
+
+
 def init_db():
     import models
     Base.metadata.create_all(bind=engine)
@@ -25,119 +215,77 @@ def drop_db():
     Base.metadata.drop_all(bind=engine)
 
 
+seed_rows = (
+    ('image', 'filename', ['avatar1.png', 'avatar2.png', 'avatar3.png']),
+    ('category', 'name', ["航拍&360", "单人", "多人", "团体"]),
+    ('school', 'name', ["华科", "武大"]),
+    ('style', 'name', ["情绪", "日系", "小清新", "轻私房", "极简"]),
+    ('theme', 'name', ["毕业季 bì yè jì", "闺蜜 guī mì", "情侣 qíng lǚ", "街拍 jiē pāi"]),
+)
+
+
 def init_models():
+    """
+    Insert the admin and the option rows that are missing. One query
+    finds the existing ones, so a database that has them all costs a
+    single SELECT; a concurrent seed that wins the race makes the
+    commit fail once, and the retry finds its rows.
+    """
     import models
-    session = db_session()
-    try:
-        admin = models.User(name='su',
-                            phone_number='0',
-                            email='0')
-        admin.is_admin = True
-        admin.number = 0
-        admin.set_password("18986888887")
-        admin.sex = True
-        admin.description = "1"
-        session.add(admin)
-        session.commit()
-    except Exception as e:
-        session.rollback()
-        admin = models.User.query.filter_by(number=0).first()
-
-    try:
-        avatar1 = models.Image(
-            user=admin,
-            filename='avatar1.png'
-        )
-        session.add(avatar1)
-
-        avatar2 = models.Image(
-            user=admin,
-            filename='avatar2.png'
-        )
-        session.add(avatar2)
-
-        avatar3 = models.Image(
-            user=admin,
-            filename='avatar3.png'
-        )
-        session.add(avatar3)
-        session.commit()
-    except Exception as e:
-        session.rollback()
+    from sqlalchemy import literal, union_all
+    from sqlalchemy.exc import IntegrityError
 
-    try:
-        c1 = models.Category(
-            name="航拍&360"
-        )
-        c2 = models.Category(
-            name="单人"
-        )
-        c3 = models.Category(
-            name="多人"
-        )
-        c4 = models.Category(
-            name="团体"
-        )
-
-        session.add_all([c1, c2, c3, c4])
-        session.commit()
-    except Exception as e:
-        session.rollback()
+    user = models.User
+    Models = dict((Model.__tablename__, Model) for Model in (
+        models.Image, models.Category, models.School, models.Style, models.Theme))
+    existing_query = union_all(
+        select([literal('user'), user.email]).where(user.number == 0),
+        *(select([literal(table), getattr(Models[table], column)])
+          .where(getattr(Models[table], column).in_(values))
+          for table, column, values in seed_rows))
 
+    session = db_session()
     try:
-        sc1 = models.School(
-            name="华科"
-        )
-        sc2 = models.School(
-            name="武大"
-        )
-
-        session.add_all([sc1, sc2])
-        session.commit()
-    except Exception as e:
-        session.rollback()
+        for attempt in range(2):
+            existing = set(tuple(row) for row in session.execute(existing_query))
+            if not any(row[0] == 'user' for row in existing):
+                admin = user(name='su', phone_number='0', email='0',
+                             sex=True, description="1", number=0)
+                admin.is_admin = True
+                admin.set_password("18986888887")
+                session.add(admin)
+            else:
+                admin = None
+            for table, column, values in seed_rows:
+                for value in values:
+                    if (table, value) in existing:
+                        continue
+                    if table == 'image':
+                        if admin is None:
+                            admin = user.query.filter_by(number=0).one()
+                        session.add(models.Image(user=admin, filename=value))
+                    else:
+                        session.add(Models[table](name=value))
+            try:
+                session.commit()
+                return
+            except IntegrityError:
+                session.rollback()
+                if attempt:
+                    raise
+    finally:
+        session.close()
 
-    try:
-        st1 = models.Style(
-            name="情绪"
-        )
-        st2 = models.Style(
-            name="日系"
-        )
-        st3 = models.Style(
-            name="小清新"
-        )
-        st4 = models.Style(
-            name="轻私房"
-        )
-        st5 = models.Style(
-            name="极简"
-        )
-
-        session.add_all([st1, st2, st3, st4, st5])
-        session.commit()
-    except Exception as e:
-        session.rollback()
 
-    try:
-        t1 = models.Theme(
-            name="毕业季 bì yè jì"
-        )
-        t2 = models.Theme(
-            name="闺蜜 guī mì"
-        )
-        t3 = models.Theme(
-            name="情侣 qíng lǚ"
-        )
-        t4 = models.Theme(
-            name="街拍 jiē pāi"
-        )
-        session.add_all([t1, t2, t3, t4])
-        session.commit()
-    except Exception as e:
-        session.rollback()
-
-    session.close()
+def startup():
+    """
+    What a server runs before serving: create the missing tables,
+    unless database_settings['create_tables'] is off because migrations
+    manage the schema, then the seed rows.
+    """
+    if database_settings.get('create_tables', True):
+        init_db()
+    init_models()
 
 
 def init_test_models():
@@ -0,0 +1,164 @@
+"""
+Per-request timing of SQL, Redis and Pillow work.
+
+BaseDBHandler runs each request inside a tornado StackContext that
+makes its `Timing` the `current` one, so everything a request does
+between its yields is charged to it:
+
+    db      statements executed on the engine (`listen`)
+    redis   commands and pipelines sent through `Redis`
+    pil     image processing wrapped in `timer('pil')`
+    cos     image uploads
+    smtp    mail sends
+
+Every measurement also goes to metrics.operation_seconds.
+
+When the request finishes the totals go out in a `Server-Timing`
+header (unless site_settings['server_timing'] is False) and as one
+JSON log line on the `instrument` logger. Requests slower than
+site_settings['slow_request_threshold'] seconds also log every
+statement they executed. Statements are also counted by template for
+the N+1 detector in nplusone.py.
+"""
+import json
+import time
+import logging
+import contextlib
+from collections import (
+    defaultdict,
+    Counter,
+)
+
+import redis
+from sqlalchemy import event
+
+import metrics
+import nplusone
+from settings import site_settings
+
+
+server_timing = site_settings.get('server_timing', True)
+slow_threshold = site_settings.get('slow_request_threshold', None)
+max_statements = 500
+
+log = logging.getLogger(__name__)
+current = None
+
+
+class Timing():
+    def __init__(self, name=None):
+        self.name = name
+        self.start = time.time()
+        self.durations = defaultdict(float)
+        self.calls = Counter()
+        self.statements = list()
+        self.templates = Counter()
+
+    @contextlib.contextmanager
+    def active(self):
+        global current
+        previous, current = current, self
+        try:
+            yield
+        finally:
+            current = previous
+
+    def add(self, name, elapsed):
+        metrics.operation_seconds.observe(elapsed, name)
+        self.durations[name] += elapsed
+        self.calls[name] += 1
+
+    def add_statement(self, statement, elapsed):
+        self.add('db', elapsed)
+        if slow_threshold is not None and len(self.statements) < max_statements:
+            self.statements.append((statement, elapsed))
+        if nplusone.threshold is not None:
+            nplusone.check(self, statement)
+
+    def elapsed(self):
+        return time.time() - self.start
+
+    def header(self):
+        parts = ['{};dur={:.1f};desc="{} calls"'.format(
+                     name, self.durations[name] * 1000, self.calls[name])
+                 for name in sorted(self.durations)]
+        parts.append('total;dur={:.1f}'.format(self.elapsed() * 1000))
+        return ', '.join(parts)
+
+    def report(self, handler):
+        total = self.elapsed()
+        record = {
+            'handler': type(handler).__name__,
+            'method': handler.request.method,
+            'path': handler.request.path,
+            'status': handler.get_status(),
+            'total_ms': round(total * 1000, 1),
+        }
+        for name in self.durations:
+            record[name + '_ms'] = round(self.durations[name] * 1000, 1)
+            record[name + '_calls'] = self.calls[name]
+        log.info(json.dumps(record, sort_keys=True))
+
+        if slow_threshold is not None and total >= slow_threshold:
+            log.warning("slow request %s %s: %d statements\n%s",
+                        handler.request.method, handler.request.path,
+                        self.calls['db'],
+                        '\n'.join('{:8.1f}ms  {}'.format(elapsed * 1000, statement)
+                                  for statement, elapsed in self.statements))
+
+
+def record(name, elapsed):
+    if current is not None:
+        current.add(name, elapsed)
+    else:
+        metrics.operation_seconds.observe(elapsed, name)
+
+
+@contextlib.contextmanager
+def timer(name):
+    """
+    Charge the time spent in the block to the current request as name.
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        record(name, time.time() - start)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    conn.info.setdefault('query_start', []).append(time.time())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    elapsed = time.time() - conn.info['query_start'].pop()
+    if current is not None:
+        current.add_statement(statement, elapsed)
+    else:
+        metrics.operation_seconds.observe(elapsed, 'db')
+
+
+def listen(engine):
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+
+class Pipeline(redis.client.StrictPipeline):
+    def execute(self, raise_on_error=True):
+        with timer('redis'):
+            return super().execute(raise_on_error)
+
+
+class Redis(redis.StrictRedis):
+    """
+    StrictRedis that times its commands and pipelines.
+    """
+    def execute_command(self, *args, **options):
+        with timer('redis'):
+            return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return Pipeline(self.connection_pool, self.response_callbacks,
+                        transaction, shard_hint)
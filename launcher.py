@@ -0,0 +1,216 @@
+"""
+Multi-process production launcher.
+
+    python3 launcher.py [port] [--workers N]
+
+The master creates the schema and seed rows, then forks
+site_settings['workers'] workers (0, the default, is one per core) and
+restarts any that die, backing off when one keeps crashing. With
+SO_REUSEPORT (site_settings['reuse_port'], on where the platform has
+it) every worker binds its own listening socket and the kernel spreads
+connections between them; otherwise the master binds once and the
+workers accept on the inherited socket.
+
+The handlers, and with them the database pool and the Redis clients,
+are only imported in the workers after the fork; `after_fork` also
+drops anything the master did open. Worker 0 runs the leaderboard
+reconcile.
+
+SIGTERM and SIGINT are passed on to the workers, which drain as
+lifecycle.py describes; the master exits once they all have. SIGHUP
+reloads: one worker at a time, a replacement is forked and, once it is
+serving, the old worker is told to drain, so the port always has
+listeners. Replacements import the handlers afresh; changes to what the
+master imported (settings, database, models) need a full restart.
+"""
+import os
+import time
+import select
+import random
+import signal
+import socket
+import logging
+import argparse
+import multiprocessing
+
+from settings import site_settings
+
+
+log = logging.getLogger('launcher')
+
+
+def after_fork():
+    """
+    Give a new worker its own connections and random state.
+    """
+    random.seed()
+    import database
+    database.db_session.remove()
+    database.engine.dispose()
+
+
+def serve(task_id, port, sockets=None, ready=None):
+    import tornado.ioloop
+    import tornado.netutil
+    import tornado.httpserver
+
+    import main
+    import lifecycle
+
+    after_fork()
+    server = tornado.httpserver.HTTPServer(main.make_app(), xheaders=True)
+    if sockets is None:
+        sockets = tornado.netutil.bind_sockets(port, reuse_port=True)
+    server.add_sockets(sockets)
+
+    io_loop = tornado.ioloop.IOLoop.current()
+    if task_id == 0:
+        main.schedule_reconcile(io_loop)
+    lifecycle.install([server], io_loop)
+    if ready is not None:
+        os.write(ready, b'1')
+        os.close(ready)
+    log.info("worker %d (pid %d) serving on port %d", task_id, os.getpid(), port)
+    io_loop.start()
+
+
+class Supervisor():
+    backoff_limit = 30
+    stable_after = 10
+    ready_timeout = 60
+
+    def __init__(self, workers, port, reuse_port):
+        self.workers = workers
+        self.port = port
+        self.reuse_port = reuse_port
+        self.sockets = None
+        self.children = dict()
+        self.retired = set()
+        self.started = dict()
+        self.failures = dict()
+        self.stopping = False
+        self.reloading = False
+
+    def spawn(self, task_id, wait=False):
+        """
+        Fork worker task_id. With wait, return its pid once it is
+        serving, or None if it doesn't get there within ready_timeout.
+        """
+        ready, notify = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready)
+            for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                signal.signal(signum, signal.SIG_DFL)
+            status = 0
+            try:
+                serve(task_id, self.port, self.sockets, notify)
+            except Exception:
+                log.exception("worker %d failed", task_id)
+                status = 1
+            finally:
+                os._exit(status)
+        os.close(notify)
+        self.children[pid] = task_id
+        self.started[task_id] = time.time()
+        if not wait:
+            os.close(ready)
+            return pid
+
+        readable, _, _ = select.select([ready], [], [], self.ready_timeout)
+        serving = bool(readable) and os.read(ready, 1) == b'1'
+        os.close(ready)
+        if serving:
+            return pid
+        del self.children[pid]
+        self.retired.add(pid)
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        return None
+
+    def forward(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def reload(self, signum, frame):
+        if self.stopping or self.reloading:
+            return
+        self.reloading = True
+        try:
+            for pid, task_id in sorted(self.children.items(), key=lambda c: c[1]):
+                if self.stopping:
+                    break
+                if self.spawn(task_id, wait=True) is None:
+                    log.error("replacement for worker %d did not start, "
+                              "keeping the old workers", task_id)
+                    break
+                del self.children[pid]
+                self.retired.add(pid)
+                os.kill(pid, signal.SIGTERM)
+                log.info("worker %d replaced, pid %d draining", task_id, pid)
+        finally:
+            self.reloading = False
+
+    def restart(self, task_id, status):
+        uptime = time.time() - self.started[task_id]
+        failures = self.failures.get(task_id, 0) + 1 if uptime < self.stable_after else 0
+        self.failures[task_id] = failures
+        delay = min(self.backoff_limit, 2 ** failures - 1)
+        log.warning("worker %d exited with status %d after %.0fs, restarting in %ds",
+                    task_id, status, uptime, delay)
+        time.sleep(delay)
+        if not self.stopping:
+            self.spawn(task_id)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.forward)
+        signal.signal(signal.SIGINT, self.forward)
+        signal.signal(signal.SIGHUP, self.reload)
+        if not self.reuse_port:
+            import tornado.netutil
+            self.sockets = tornado.netutil.bind_sockets(self.port)
+        for task_id in range(self.workers):
+            self.spawn(task_id)
+
+        while self.children or self.retired:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            self.retired.discard(pid)
+            task_id = self.children.pop(pid, None)
+            if task_id is not None and not self.stopping:
+                self.restart(task_id, os.WEXITSTATUS(status) if os.WIFEXITED(status)
+                             else -os.WTERMSIG(status))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('port', nargs='?', type=int, default=site_settings['port'])
+    parser.add_argument('--workers', type=int,
+                        default=site_settings.get('workers', 0))
+    args = parser.parse_args()
+
+    logging.basicConfig()
+    log.setLevel(logging.INFO)
+
+    import database
+    database.startup()
+    database.db_session.remove()
+    database.engine.dispose()
+
+    workers = args.workers or multiprocessing.cpu_count()
+    reuse_port = site_settings.get('reuse_port', hasattr(socket, 'SO_REUSEPORT'))
+    log.info("starting %d workers on port %d%s", workers, args.port,
+             " with SO_REUSEPORT" if reuse_port else "")
+    Supervisor(workers, args.port, reuse_port).run()
+
+
+if __name__ == "__main__":
+    main()
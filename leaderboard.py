@@ -0,0 +1,276 @@
+"""
+Redis sorted-set leaderboards of likes.
+
+    leaderboard:photographers                      reviewed photographers
+    leaderboard:theme:<id>:photographers           ... in a theme
+    leaderboard:photographer:<id>:collections      a photographer's collections
+    leaderboard:theme:<id>:collections             a theme's collections
+
+`sortby=likes&order=desc` pages of /photographer (unfiltered or with a
+single theme), /photographer/<id>/collection and /theme/<id>/collection
+read their ids from these. Likes and membership changes update them
+after the database commit; the scripts only touch sets that exist, so
+a missing set just means the page is sorted in SQL. `reconcile`
+rebuilds every set from the `likes` columns. main.py runs
+`python3 -m leaderboard` in a child process every
+`leaderboard_reconcile_interval` seconds, so the scans don't hold up
+requests; it can also be run by hand or from cron.
+"""
+import logging
+
+from sqlalchemy import (
+    select,
+    and_,
+    or_,
+)
+
+import cards
+import models
+from settings import site_settings
+
+
+prefix = 'leaderboard:'
+registry_key = prefix + 'keys'
+reconcile_interval = site_settings.get('leaderboard_reconcile_interval', 600)
+
+log = logging.getLogger(__name__)
+scripts = dict()
+
+incr_script = """
+for i, key in ipairs(KEYS) do
+    if redis.call('exists', key) == 1 then
+        redis.call('zincrby', key, ARGV[1], ARGV[i + 1])
+    end
+end
+"""
+
+add_script = """
+for i, key in ipairs(KEYS) do
+    if redis.call('exists', key) == 1 then
+        redis.call('zadd', key, ARGV[1], ARGV[i + 1])
+    end
+end
+"""
+
+
+def photographers_key(theme_id=None):
+    if theme_id is None:
+        return prefix + 'photographers'
+    return prefix + 'theme:{}:photographers'.format(cards.facet_key(theme_id))
+
+
+def collections_key(user_id):
+    return prefix + 'photographer:{}:collections'.format(cards.facet_key(user_id))
+
+
+def theme_collections_key(theme_id):
+    return prefix + 'theme:{}:collections'.format(cards.facet_key(theme_id))
+
+
+def serves(form):
+    """
+    Whether a validated list form asks for a likes-descending page.
+    """
+    since = getattr(form, 'since', None)
+    return form.sortby.data == 'likes' and form.order.data == 'desc' \
+        and (since is None or since.data is None)
+
+
+def page(redis_cli, key, offset=None, limit=None):
+    """
+    Hex ids of one page of key, best first, or None when the set is
+    missing or Redis is unavailable.
+    """
+    start = offset or 0
+    stop = start + limit - 1 if limit is not None else -1
+    try:
+        with redis_cli.pipeline() as pipe:
+            exists, ids = pipe.exists(key).zrevrange(key, start, stop).execute()
+    except Exception:
+        log.exception("leaderboard page %s", key)
+        return None
+    if not exists:
+        return None
+    return [i.decode() for i in ids]
+
+
+def ordered(objects, ids, key):
+    """
+    objects sorted like ids, dropping ids no longer backed by a row.
+    """
+    by_id = dict((key(o), o) for o in objects)
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def run(redis_cli, script, keys, members, amount):
+    if not keys:
+        return
+    if script not in scripts:
+        scripts[script] = redis_cli.register_script(script)
+    try:
+        scripts[script](keys=keys, args=[amount] + members, client=redis_cli)
+    except Exception:
+        log.exception("leaderboard update %s", keys)
+
+
+def photographer_keys(user):
+    if not cards.listed(user):
+        return []
+    keys = [photographers_key()]
+    keys.extend(photographers_key(theme_id)
+                for theme_id, in user.themes.with_entities(models.Theme.id))
+    return keys
+
+
+def like(redis_cli, collection, amount):
+    """
+    Apply a like (amount 1) or unlike (-1) of collection.
+    """
+    user = collection.user
+    keys, members = list(), list()
+    if collection.id != user.cover_collection_id:
+        keys.append(collections_key(user.id))
+        members.append(collection.id.hex)
+    for theme_id, in collection.themes.with_entities(models.Theme.id):
+        keys.append(theme_collections_key(theme_id))
+        members.append(collection.id.hex)
+    for key in photographer_keys(user):
+        keys.append(key)
+        members.append(user.id.hex)
+    run(redis_cli, incr_script, keys, members, amount)
+
+
+def add_photographer(redis_cli, user):
+    keys = photographer_keys(user)
+    run(redis_cli, add_script, keys, [user.id.hex] * len(keys), user.likes or 0)
+
+
+def remove_photographer(redis_cli, user):
+    keys = [photographers_key()]
+    keys.extend(photographers_key(theme_id)
+                for theme_id, in user.themes.with_entities(models.Theme.id))
+    try:
+        with redis_cli.pipeline() as pipe:
+            for key in keys:
+                pipe.zrem(key, user.id.hex)
+            pipe.execute()
+    except Exception:
+        log.exception("leaderboard update %s", keys)
+
+
+def add_collection(redis_cli, collection):
+    run(redis_cli, add_script, [collections_key(collection.user_id)],
+        [collection.id.hex], collection.likes or 0)
+
+
+def remove_collection(redis_cli, user_id, collection_id, theme_ids):
+    keys = [collections_key(user_id)]
+    keys.extend(theme_collections_key(theme_id) for theme_id in theme_ids)
+    try:
+        with redis_cli.pipeline() as pipe:
+            for key in keys:
+                pipe.zrem(key, collection_id.hex)
+            pipe.execute()
+    except Exception:
+        log.exception("leaderboard update %s", keys)
+
+
+def add_theme_collection(redis_cli, theme_id, collection):
+    run(redis_cli, add_script, [theme_collections_key(theme_id)],
+        [collection.id.hex], collection.likes or 0)
+    if cards.listed(collection.user):
+        run(redis_cli, add_script, [photographers_key(theme_id)],
+            [collection.user.id.hex], collection.user.likes or 0)
+
+
+def remove_theme_collection(redis_cli, theme_id, collection_id, user_id=None):
+    """
+    user_id is the photographer when this was their last collection
+    in the theme.
+    """
+    try:
+        with redis_cli.pipeline() as pipe:
+            pipe.zrem(theme_collections_key(theme_id), collection_id.hex)
+            if user_id is not None:
+                pipe.zrem(photographers_key(theme_id), user_id.hex)
+            pipe.execute()
+    except Exception:
+        log.exception("leaderboard update theme %s", theme_id.hex)
+
+
+def drop_theme(redis_cli, theme_id):
+    try:
+        redis_cli.delete(photographers_key(theme_id),
+                         theme_collections_key(theme_id))
+    except Exception:
+        log.exception("leaderboard update theme %s", theme_id.hex)
+
+
+def scores(session):
+    """
+    {key: [score, member, ...]} for every leaderboard, from MySQL.
+    """
+    user = models.User.__table__
+    collection = models.Collection.__table__
+    theme_user = models.theme_photographer_table
+    theme_collection = models.theme_collection_table
+    listed_users = and_(user.c.status == 'reviewed', user.c.is_admin == False)
+
+    boards = dict()
+
+    def add(key, likes, id):
+        boards.setdefault(key, []).extend((likes or 0, id.hex))
+
+    for id, likes in session.execute(
+            select([user.c.id, user.c.likes]).where(listed_users)):
+        add(photographers_key(), likes, id)
+    for theme_id, id, likes in session.execute(
+            select([theme_user.c.theme_id, user.c.id, user.c.likes])
+            .select_from(theme_user.join(user))
+            .where(listed_users)):
+        add(photographers_key(theme_id), likes, id)
+    for user_id, id, likes in session.execute(
+            select([collection.c.user_id, collection.c.id, collection.c.likes])
+            .select_from(collection.join(user, collection.c.user_id == user.c.id))
+            .where(or_(user.c.cover_collection_id == None,
+                       collection.c.id != user.c.cover_collection_id))):
+        add(collections_key(user_id), likes, id)
+    for theme_id, id, likes in session.execute(
+            select([theme_collection.c.theme_id, collection.c.id, collection.c.likes])
+            .select_from(theme_collection.join(collection))):
+        add(theme_collections_key(theme_id), likes, id)
+
+    return boards
+
+
+def reconcile(redis_cli, session=None, chunk=1000):
+    """
+    Rebuild every leaderboard from the `likes` columns. Each set is
+    written under a temporary key and renamed over the live one.
+    """
+    from database import Session
+    if session is None:
+        session = Session()
+    try:
+        boards = scores(session)
+    finally:
+        session.close()
+
+    stale = set(k.decode() for k in redis_cli.smembers(registry_key)) - set(boards)
+    for key, pairs in boards.items():
+        tmp = key + ':tmp'
+        with redis_cli.pipeline() as pipe:
+            pipe.delete(tmp)
+            for i in range(0, len(pairs), chunk * 2):
+                pipe.zadd(tmp, *pairs[i:i + chunk * 2])
+            pipe.rename(tmp, key)
+            pipe.sadd(registry_key, key)
+            pipe.execute()
+    if stale:
+        redis_cli.delete(*stale)
+        redis_cli.srem(registry_key, *stale)
+
+
+if __name__ == "__main__":
+    from util import conn_redis
+    reconcile(conn_redis())
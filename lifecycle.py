@@ -0,0 +1,100 @@
+"""
+Graceful shutdown of a serving process.
+
+On SIGTERM or SIGINT the process stops listening, stops its periodic
+tasks and waits up to site_settings['shutdown_timeout'] seconds for the
+requests in flight to finish; uploads and mails are sent within their
+request, so they finish with it. Responses written meanwhile carry
+`Connection: close`. Then the database pool and the Redis connections
+are closed and the IOLoop stops. A second signal skips the wait.
+"""
+import time
+import signal
+import logging
+
+from tornado import gen
+from tornado.ioloop import (
+    IOLoop,
+    PeriodicCallback,
+)
+
+from settings import site_settings
+
+
+log = logging.getLogger('lifecycle')
+
+timeout = site_settings.get('shutdown_timeout', 30)
+poll_interval = 0.1
+
+signalled = False
+forced = False
+draining = False
+requests = set()
+tasks = list()
+closers = list()
+
+
+def periodic(callback, interval):
+    """
+    Start calling callback every interval seconds until shutdown.
+    """
+    task = PeriodicCallback(callback, interval * 1000)
+    tasks.append(task)
+    task.start()
+    return task
+
+
+def on_close(closer):
+    """
+    Call closer once the requests have drained.
+    """
+    closers.append(closer)
+
+
+def close():
+    import database
+    database.db_session.remove()
+    database.engine.dispose()
+    for closer in closers:
+        try:
+            closer()
+        except Exception:
+            log.exception("%r failed at shutdown", closer)
+
+
+@gen.coroutine
+def shutdown(servers, timeout=timeout):
+    global draining
+    draining = True
+    for server in servers:
+        server.stop()
+    for task in tasks:
+        task.stop()
+
+    deadline = time.time() + timeout
+    while requests and not forced and time.time() < deadline:
+        yield gen.sleep(poll_interval)
+    if requests:
+        log.warning("shutting down with %d requests in flight: %s", len(requests),
+                    ', '.join(sorted(handler.timing.name for handler in requests)))
+    close()
+    IOLoop.current().stop()
+
+
+def install(servers, io_loop=None):
+    """
+    Shut down gracefully on SIGTERM and SIGINT.
+    """
+    io_loop = io_loop or IOLoop.current()
+
+    def handle(signum, frame):
+        global signalled, forced
+        if signalled:
+            forced = True
+            return
+        signalled = True
+        log.info("signal %d, draining %d requests", signum, len(requests))
+        io_loop.add_callback_from_signal(shutdown, servers)
+
+    signal.signal(signal.SIGTERM, handle)
+    signal.signal(signal.SIGINT, handle)
@@ -1,37 +1,86 @@
 #coding=utf-8
 
-if __name__ == "__main__":
-    import sys
 
-    import tornado.ioloop
+def make_app(**overrides):
+    """
+    The tornado Application; imports the handlers, so the process that
+    calls it owns their database and Redis connections.
+    """
     import tornado.web
     import tornado.locale
-    import tornado.httpserver
 
     from settings import site_settings
     import urls
     import util
+    import taxonomy
+
+    taxonomy.registry.load()
+    mapping = util.generate_url(urls.urls, urls.apps, '__main__')
+    application = tornado.web.Application(mapping,
+                                          **dict(site_settings, **overrides))
+    tornado.locale.load_gettext_translations(site_settings['locale_path'],
+                                             site_settings['locale_domain'])
+    return application
+
+
+def schedule_reconcile(io_loop):
+    """
+    Rebuild the leaderboards now and every reconcile_interval seconds
+    in a `python3 -m leaderboard` child process, so the full scans
+    don't hold up this process's requests; one process per deployment
+    is enough. A rebuild still running when the next is due is not
+    started twice.
+    """
+    import os
+    import sys
+    import logging
+    import subprocess
+
+    import lifecycle
+    import leaderboard
+
+    log = logging.getLogger('leaderboard')
+    root = os.path.dirname(os.path.abspath(__file__))
+    running = [None]
+
+    def reconcile():
+        process = running[0]
+        if process is not None:
+            status = process.poll()
+            if status is None:
+                return
+            if status:
+                log.warning("leaderboard rebuild exited with status %d", status)
+        running[0] = subprocess.Popen([sys.executable, '-m', 'leaderboard'],
+                                      cwd=root)
+
+    io_loop.add_callback(reconcile)
+    lifecycle.periodic(reconcile, leaderboard.reconcile_interval)
 
-    from database import (
-        init_db,
-        init_models,
-        drop_db
-    )
+
+if __name__ == "__main__":
+    import sys
+
+    import tornado.ioloop
+    import tornado.httpserver
+
+    import lifecycle
+    from settings import site_settings
+
+    from database import startup
 
     try:
         port = int(sys.argv[1])
     except (TypeError, IndexError):
         port = site_settings['port']
 
-    init_db()
-    init_models()
-
-    mapping = util.generate_url(urls.urls, urls.apps, __name__)
-    application = tornado.web.Application(mapping, **site_settings)
+    startup()
 
-    tornado.locale.load_gettext_translations(site_settings['locale_path'],
-                                             site_settings['locale_domain'])
-    server = tornado.httpserver.HTTPServer(application, xheaders=True)
+    server = tornado.httpserver.HTTPServer(make_app(), xheaders=True)
     server.listen(port)
 
-    tornado.ioloop.IOLoop.current().start()
+    io_loop = tornado.ioloop.IOLoop.current()
+    schedule_reconcile(io_loop)
+    lifecycle.install([server], io_loop)
+
+    io_loop.start()
@@ -0,0 +1,165 @@
+"""
+In-process metrics, served in the Prometheus text format on /metrics.
+
+    http_request_duration_seconds   histogram by handler class and method
+    http_responses_total            responses by handler class and status
+    operation_duration_seconds      db statements, redis, pil, cos uploads
+                                    and smtp sends (see instrument.timer)
+    db_pool_checkout_wait_seconds   time waiting for a pooled connection
+    db_pool_connections             pool size, checked out and overflow
+    query_cache_lookups_total       baked query and compiled statement
+                                    cache hits and misses
+
+Recording is a dict lookup and a bisect, so it stays on in production.
+Each process keeps its own registry. /metrics answers only
+site_settings['metrics_allowed_ips'] (loopback by default; None lets
+everyone in).
+"""
+import time
+import bisect
+
+import tornado.web
+from sqlalchemy import pool
+
+from settings import site_settings
+
+
+allowed_ips = site_settings.get('metrics_allowed_ips', ('127.0.0.1', '::1'))
+default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+registry = list()
+
+
+def labels_text(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('"', '\\"'))
+                          for name, value in zip(names, values)) + '}'
+
+
+class Counter():
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = dict()
+        registry.append(self)
+
+    def inc(self, amount=1, *values):
+        self.values[values] = self.values.get(values, 0) + amount
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} counter'.format(self.name)]
+        for values, value in sorted(self.values.items()):
+            lines.append('{}{} {}'.format(self.name,
+                                          labels_text(self.labels, values),
+                                          value))
+        return lines
+
+
+class Histogram():
+    def __init__(self, name, documentation, labels=(), buckets=default_buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = dict()
+        registry.append(self)
+
+    def observe(self, amount, *values):
+        series = self.values.get(values)
+        if series is None:
+            series = self.values[values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, amount)] += 1
+        series[1] += amount
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} histogram'.format(self.name)]
+        names = self.labels + ('le',)
+        for values, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(
+                    self.name, labels_text(names, values + (bound,)), cumulative))
+            lines.append('{}_sum{} {}'.format(
+                self.name, labels_text(self.labels, values), total))
+            lines.append('{}_count{} {}'.format(
+                self.name, labels_text(self.labels, values), cumulative))
+        return lines
+
+
+request_seconds = Histogram(
+    'http_request_duration_seconds', 'Request latency.',
+    ('handler', 'method'))
+responses = Counter(
+    'http_responses_total', 'Responses by status code.',
+    ('handler', 'status'))
+operation_seconds = Histogram(
+    'operation_duration_seconds', 'Latency of SQL statements, Redis calls, '
+    'image processing, COS uploads and mail sends.',
+    ('operation',))
+pool_wait_seconds = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled '
+    'database connection.')
+
+
+def observe_request(handler, elapsed):
+    name = type(handler).__name__
+    request_seconds.observe(elapsed, name, handler.request.method)
+    responses.inc(1, name, handler.get_status())
+
+
+class QueuePool(pool.QueuePool):
+    """
+    QueuePool that times how long checkouts wait for a connection.
+    """
+    def _do_get(self):
+        start = time.time()
+        try:
+            return super()._do_get()
+        finally:
+            pool_wait_seconds.observe(time.time() - start)
+
+
+def collect_pool(engine):
+    lines = ['# HELP db_pool_connections Connections of the database pool.',
+             '# TYPE db_pool_connections gauge']
+    if isinstance(engine.pool, pool.QueuePool):
+        for state, value in (('size', engine.pool.size()),
+                             ('checked_out', engine.pool.checkedout()),
+                             ('overflow', engine.pool.overflow())):
+            lines.append('db_pool_connections{{state="{}"}} {}'.format(state, value))
+    return lines
+
+
+def collect_caches():
+    from database import query_cache_stats
+    lines = ['# HELP query_cache_lookups_total Query cache lookups.',
+             '# TYPE query_cache_lookups_total counter']
+    for name, stats in sorted(query_cache_stats().items()):
+        for result, key in (('hit', 'hits'), ('miss', 'misses')):
+            lines.append('query_cache_lookups_total{{cache="{}",result="{}"}} {}'
+                         .format(name, result, stats[key]))
+    return lines
+
+
+def render():
+    from database import engine
+    lines = list()
+    for metric in registry:
+        lines.extend(metric.render())
+    lines.extend(collect_pool(engine))
+    lines.extend(collect_caches())
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        if allowed_ips is not None and self.request.remote_ip not in allowed_ips:
+            raise tornado.web.HTTPError(403)
+        self.set_header('Content-Type', 'text/plain; version=0.0.4')
+        self.finish(render())
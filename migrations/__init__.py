@@ -0,0 +1,32 @@
+"""
+Schema changes for existing MySQL databases.
+
+`init_db` only creates missing tables, so columns and indexes added to
+existing tables are applied by running the matching module once:
+
+    python3 -m migrations.<name>
+"""
+from sqlalchemy import (
+    inspect,
+    text,
+)
+
+
+def add_missing(engine, columns=(), indexes=()):
+    """
+    Run each (table, name, statement) whose column or index the
+    database lacks. Tables that init_db or an earlier migration
+    created from the current models already have them, and tables
+    that don't exist yet will be created with them.
+    """
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table, name, statement in columns:
+            if table in tables and \
+                    name not in [c['name'] for c in inspector.get_columns(table)]:
+                conn.execute(text(statement))
+        for table, name, statement in indexes:
+            if table in tables and \
+                    name not in [i['name'] for i in inspector.get_indexes(table)]:
+                conn.execute(text(statement))
@@ -0,0 +1,64 @@
+"""
+Convert every GUID column from CHAR(32) hex to BINARY(16).
+
+Run once with the server stopped, then set
+database_settings['guid_storage'] = 'binary'. Foreign keys between
+GUID columns are dropped for the conversion and recreated with their
+original names.
+"""
+from sqlalchemy import (
+    inspect,
+    text,
+)
+
+from database import (
+    Base,
+    engine,
+)
+import models
+
+
+def guid_columns():
+    for table in Base.metadata.sorted_tables:
+        for column in table.columns:
+            if isinstance(column.type, models.GUID):
+                yield table.name, column
+
+
+def upgrade():
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    columns = [(t, c) for t, c in guid_columns() if t in tables]
+    guid_names = set((t, c.name) for t, c in columns)
+
+    foreign_keys = []
+    for table in tables:
+        for fk in inspector.get_foreign_keys(table):
+            if any((table, name) in guid_names for name in fk['constrained_columns']):
+                foreign_keys.append((table, fk))
+
+    with engine.begin() as conn:
+        for table, fk in foreign_keys:
+            conn.execute(text("ALTER TABLE `{}` DROP FOREIGN KEY `{}`"
+                              .format(table, fk['name'])))
+        for table, column in columns:
+            null = "NULL" if column.nullable else "NOT NULL"
+            conn.execute(text("ALTER TABLE `{t}` MODIFY `{c}` VARBINARY(32) {n}"
+                              .format(t=table, c=column.name, n=null)))
+            conn.execute(text("UPDATE `{t}` SET `{c}` = UNHEX(`{c}`)"
+                              .format(t=table, c=column.name)))
+            conn.execute(text("ALTER TABLE `{t}` MODIFY `{c}` BINARY(16) {n}"
+                              .format(t=table, c=column.name, n=null)))
+        for table, fk in foreign_keys:
+            conn.execute(text(
+                "ALTER TABLE `{t}` ADD CONSTRAINT `{name}` FOREIGN KEY ({cols}) "
+                "REFERENCES `{ref}` ({ref_cols})".format(
+                    t=table,
+                    name=fk['name'],
+                    cols=', '.join('`{}`'.format(c) for c in fk['constrained_columns']),
+                    ref=fk['referred_table'],
+                    ref_cols=', '.join('`{}`'.format(c) for c in fk['referred_columns']))))
+
+
+if __name__ == "__main__":
+    upgrade()
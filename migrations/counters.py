@@ -0,0 +1,34 @@
+"""
+Add the counter columns that are missing and the counter table, then
+fill them with counters.repair.
+"""
+from database import (
+    db_session,
+    engine,
+)
+from migrations import add_missing
+import counters
+import models
+
+
+columns = [
+    ('user', 'collection_count',
+     "ALTER TABLE `user` ADD COLUMN collection_count INTEGER NOT NULL DEFAULT 0"),
+    ('theme', 'collection_count',
+     "ALTER TABLE theme ADD COLUMN collection_count INTEGER NOT NULL DEFAULT 0"),
+    ('collection', 'image_count',
+     "ALTER TABLE collection ADD COLUMN image_count INTEGER NOT NULL DEFAULT 0"),
+]
+
+
+def upgrade():
+    add_missing(engine, columns)
+    models.Counter.__table__.create(bind=engine, checkfirst=True)
+    try:
+        counters.repair(db_session())
+    finally:
+        db_session.remove()
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,29 @@
+"""
+Add `user.hottest_collection_id` and backfill it with each
+photographer's most liked collection.
+"""
+from sqlalchemy import text
+
+from database import engine
+import models
+
+
+statements = [
+    "ALTER TABLE `user` ADD COLUMN hottest_collection_id {type} NULL",
+    "ALTER TABLE `user` ADD CONSTRAINT fk_user_hottest_collection "
+    "FOREIGN KEY (hottest_collection_id) REFERENCES collection (id)",
+    "UPDATE `user` u SET hottest_collection_id = ("
+    "SELECT c.id FROM collection c WHERE c.user_id = u.id "
+    "ORDER BY c.likes DESC LIMIT 1)",
+]
+
+
+def upgrade():
+    column = "BINARY(16)" if models.GUID.binary else "CHAR(32)"
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement.format(type=column)))
+
+
+if __name__ == "__main__":
+    upgrade()
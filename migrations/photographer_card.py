@@ -0,0 +1,24 @@
+"""
+Create photographer_card and photographer_card_facet and fill them
+from the current photographers. Safe to rerun; every card is rebuilt.
+"""
+from database import (
+    db_session,
+    engine,
+)
+import cards
+import models
+
+
+def upgrade():
+    models.PhotographerCard.__table__.create(bind=engine, checkfirst=True)
+    models.photographer_card_facet_table.create(bind=engine, checkfirst=True)
+    session = db_session()
+    try:
+        cards.rebuild(session)
+    finally:
+        db_session.remove()
+
+
+if __name__ == "__main__":
+    upgrade()
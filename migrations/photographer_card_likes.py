@@ -0,0 +1,33 @@
+"""
+Keep the likes of a photographer card and of the collection it shows
+out of its JSON, so that likes only update columns. Adds the
+collection columns to photographer_card unless it was created with
+them, and rebuilds every card.
+"""
+from database import (
+    db_session,
+    engine,
+)
+from migrations import add_missing
+import cards
+
+
+columns = [
+    ('photographer_card', 'collection_likes',
+     "ALTER TABLE photographer_card ADD COLUMN collection_likes BIGINT NULL"),
+    ('photographer_card', 'collection_detail',
+     "ALTER TABLE photographer_card ADD COLUMN collection_detail TEXT NULL"),
+]
+
+
+def upgrade():
+    add_missing(engine, columns)
+    session = db_session()
+    try:
+        cards.rebuild(session)
+    finally:
+        db_session.remove()
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,31 @@
+"""
+Add `updated_at` to user and collection, and the tombstone table,
+for the `since=` sync feeds.
+"""
+from sqlalchemy import text
+
+from database import engine
+import models
+
+
+statements = [
+    "ALTER TABLE `user` ADD COLUMN updated_at DATETIME NULL",
+    "UPDATE `user` SET updated_at = create_time",
+    "ALTER TABLE `user` MODIFY updated_at DATETIME NOT NULL",
+    "CREATE INDEX ix_user_updated_at ON `user` (updated_at)",
+    "ALTER TABLE collection ADD COLUMN updated_at DATETIME NULL",
+    "UPDATE collection SET updated_at = create_time",
+    "ALTER TABLE collection MODIFY updated_at DATETIME NOT NULL",
+    "CREATE INDEX ix_collection_user_updated_at ON collection (user_id, updated_at)",
+]
+
+
+def upgrade():
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+    models.Tombstone.__table__.create(bind=engine, checkfirst=True)
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,79 @@
+"""
+Add the trending columns and seed them. Past likes have no
+timestamps, so each collection starts as if its likes and images all
+arrived when it was created; a photographer's score combines their
+collections'. Columns and indexes init_db already created from the
+current models are skipped; the scores are seeded on every run.
+"""
+from sqlalchemy import (
+    inspect,
+    select,
+    func,
+    text,
+)
+
+from database import engine
+from migrations import add_missing
+import models
+import trending
+
+
+columns = [
+    ('user', 'trending', "ALTER TABLE `user` ADD COLUMN trending DOUBLE NULL"),
+    ('collection', 'trending', "ALTER TABLE collection ADD COLUMN trending DOUBLE NULL"),
+    ('photographer_card', 'trending',
+     "ALTER TABLE photographer_card ADD COLUMN trending DOUBLE NULL"),
+]
+indexes = [
+    ('user', 'ix_user_trending', "CREATE INDEX ix_user_trending ON `user` (trending)"),
+    ('collection', 'ix_collection_trending',
+     "CREATE INDEX ix_collection_trending ON collection (trending)"),
+    ('collection', 'ix_collection_user_trending',
+     "CREATE INDEX ix_collection_user_trending ON collection (user_id, trending)"),
+    ('photographer_card', 'ix_photographer_card_trending',
+     "CREATE INDEX ix_photographer_card_trending ON photographer_card (trending)"),
+]
+
+
+def upgrade():
+    collection = models.Collection.__table__
+    user = models.User.__table__
+    images = models.image_collection_table
+    image_counts = select([images.c.collection_id,
+                           func.count().label('images')])\
+        .group_by(images.c.collection_id)\
+        .alias()
+    rows = select([collection.c.id, collection.c.user_id,
+                   collection.c.likes, collection.c.create_time,
+                   image_counts.c.images])\
+        .select_from(collection.outerjoin(
+            image_counts, image_counts.c.collection_id == collection.c.id))
+
+    add_missing(engine, columns, indexes)
+    cards = 'photographer_card' in inspect(engine).get_table_names()
+    with engine.begin() as conn:
+        by_user = dict()
+        for id, user_id, likes, create_time, count in conn.execute(rows):
+            weight = (likes or 0) * trending.like_weight + \
+                (count or 0) * trending.upload_weight
+            if not weight:
+                continue
+            x = trending.exponent(weight, create_time)
+            conn.execute(collection.update()
+                         .where(collection.c.id == id)
+                         .values(trending=x))
+            if user_id is not None:
+                by_user.setdefault(user_id, []).append(x)
+
+        for user_id, xs in by_user.items():
+            conn.execute(user.update()
+                         .where(user.c.id == user_id)
+                         .values(trending=trending.combine(xs)))
+        if cards:
+            conn.execute(text(
+                "UPDATE photographer_card pc JOIN `user` u ON u.id = pc.user_id "
+                "SET pc.trending = u.trending"))
+
+
+if __name__ == "__main__":
+    upgrade()
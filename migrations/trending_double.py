@@ -0,0 +1,25 @@
+"""
+Store the trending columns as DOUBLE. Single-precision FLOAT keeps
+about seven digits, too few for the small increments a like adds to a
+score in the hundreds.
+"""
+from sqlalchemy import text
+
+from database import engine
+
+
+statements = [
+    "ALTER TABLE `user` MODIFY trending DOUBLE NULL",
+    "ALTER TABLE collection MODIFY trending DOUBLE NULL",
+    "ALTER TABLE photographer_card MODIFY trending DOUBLE NULL",
+]
+
+
+def upgrade():
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+
+
+if __name__ == "__main__":
+    upgrade()
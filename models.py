@@ -1,7 +1,7 @@
 import uuid
 import json
 
-from sqlalchemy.types import TypeDecorator, CHAR
+from sqlalchemy.types import TypeDecorator, CHAR, BINARY
 from sqlalchemy.dialects.postgresql import UUID
 
 from sqlalchemy.schema import (
@@ -15,6 +15,7 @@ from sqlalchemy import (
     Column,
     BigInteger,
     SmallInteger,
+    Float,
     Integer,
     Unicode,
     UnicodeText,
@@ -29,7 +30,11 @@ from sqlalchemy.orm import (
 )
 
 from database import Base
-from settings import cdn_settings
+import taxonomy
+from settings import (
+    cdn_settings,
+    database_settings,
+)
 import util
 
 
@@ -38,14 +43,18 @@ class GUID(TypeDecorator):
     Platform-independent GUID type.
 
     Uses Postgresql's UUID type, otherwise uses
-    CHAR(32), storing as stringified hex values.
+    CHAR(32), storing as stringified hex values, or BINARY(16)
+    when database_settings['guid_storage'] is 'binary'.
 
     """
     impl = CHAR
+    binary = database_settings.get('guid_storage', 'char') == 'binary'
 
     def load_dialect_impl(self, dialect):
         if dialect.name == 'postgresql':
             return dialect.type_descriptor(UUID(as_uuid=False))
+        elif self.binary:
+            return dialect.type_descriptor(BINARY(16))
         else:
             return dialect.type_descriptor(CHAR(32))
 
@@ -54,18 +63,60 @@ class GUID(TypeDecorator):
             return value
         elif dialect.name == 'postgresql':
             return str(value)
+        elif isinstance(value, uuid.UUID):
+            return value.bytes if self.binary else value.hex
         else:
-            if not isinstance(value, uuid.UUID):
-                return "%.32x" % uuid.UUID(value).int
+            if isinstance(value, bytes):
+                if self.binary and len(value) == 16:
+                    return value
+                value = value.decode()
+            if len(value) != 32:
+                # dashed, braced or urn forms
+                value = uuid.UUID(value).hex
+            if self.binary:
+                return bytes.fromhex(value)
             else:
-                # hexstring
-                return "%.32x" % value.int
+                return value.lower()
 
     def process_result_value(self, value, dialect):
         if value is None:
             return value
+        elif self.binary and dialect.name != 'postgresql':
+            return uuid.UUID(bytes=bytes(value))
+        elif dialect.name == 'postgresql':
+            return uuid.UUID(value)
         else:
-            return uuid.UUID(str(value))
+            return uuid.UUID(int=int(value, 16))
+
+
+class HexGUID(GUID):
+    """
+    GUID loaded as its 32 character hex string instead of a uuid.UUID,
+    for read paths that serialize ids straight away.
+    """
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return value
+        elif dialect.name == 'postgresql':
+            return value.replace('-', '')
+        elif self.binary:
+            return bytes(value).hex()
+        else:
+            return value
+
+
+def wants(name, fields):
+    """
+    Whether a `fields=` selection (None meaning everything) includes name.
+    """
+    return fields is None or name in fields
+
+
+def expands(name, expand):
+    """
+    Whether relation name is rendered in full rather than as its id(s).
+    """
+    return expand is None or name in expand
 
 
 class User(Base):
@@ -121,6 +172,12 @@ class User(Base):
                       default=False)
     likes = Column(BigInteger,
                    default=0)
+    trending = Column(Float(precision=53),
+                      nullable=True,
+                      index=True)
+    collection_count = Column(Integer,
+                              default=0,
+                              nullable=False)
     school_id = Column(Integer,
                        ForeignKey('school.id'),
                        nullable=True)
@@ -130,6 +187,18 @@ class User(Base):
     cover_collection = relationship('Collection',
                                     foreign_keys=[cover_collection_id],
                                     uselist=False)
+    hottest_collection_id = Column(GUID(),
+                                   ForeignKey('collection.id'),
+                                   nullable=True)
+    hottest_collection = relationship('Collection',
+                                      foreign_keys=[hottest_collection_id],
+                                      uselist=False,
+                                      post_update=True)
+    updated_at = Column(DateTime(timezone=True),
+                        default=util.get_utc_time,
+                        onupdate=util.get_utc_time,
+                        nullable=False,
+                        index=True)
 
     def check_password(self, request_pwd):
         return util.check_password(request_pwd, self.password)
@@ -137,6 +206,24 @@ class User(Base):
     def set_password(self, new_pwd):
         self.password = util.set_password(new_pwd)
 
+    def offer_hottest_collection(self, collection):
+        """
+        Point hottest_collection at collection if it has more likes.
+        """
+        hottest = self.hottest_collection
+        if hottest is None or (collection.likes or 0) > (hottest.likes or 0):
+            self.hottest_collection = collection
+
+    def refresh_hottest_collection(self, exclude=None):
+        """
+        Recompute hottest_collection, for when it lost likes or is
+        about to be deleted.
+        """
+        query = self.collections.order_by(Collection.likes.desc())
+        if exclude is not None:
+            query = query.filter(Collection.id != exclude.id)
+        self.hottest_collection = query.first()
+
     def __init__(self, avatar=None, name=None,
                  phone_number=None, email=None,
                  sex=None, description=None,
@@ -149,47 +236,80 @@ class User(Base):
         self.sex = sex
         self.description = description
         if number is None:
-            self.number = User.query.count()
+            import counters
+            self.number = counters.allocate('user_number')
         else:
             self.number = number
 
-    def format_detail(self, get_email=False, get_collections=False):
+    detail_fields = ('id', 'name', 'likes', 'imagelink', 'major', 'number',
+                     'sex', 'description', 'status', 'email',
+                     'tags', 'styles', 'categories', 'collection',
+                     'collections', 'cover', 'avatar', 'school')
+    detail_relations = ('tags', 'styles', 'categories', 'collection',
+                        'collections', 'cover', 'avatar', 'school',
+                        'images')
+
+    def format_detail(self, get_email=False, get_collections=False,
+                      fields=None, expand=None):
         detail = {
             'id': self.id.hex,
-            'name': self.name,
-            'likes': self.likes,
-            'imagelink': self.imagelink,
-            'major': self.major,
-            'number': self.number,
-            'sex': self.sex,
-            'description': self.description,
-            'tags': [d.format_detail() for d in self.tags],
-            'styles': [s.format_detail() for s in self.styles],
-            'categories': [c.format_detail() for c in self.categories],
-            'status': self.status
         }
-
-        if get_email:
+        for attr in ('name', 'likes', 'imagelink', 'major',
+                     'number', 'sex', 'description', 'status'):
+            if wants(attr, fields):
+                detail[attr] = getattr(self, attr)
+
+        if wants('tags', fields):
+            if expands('tags', expand):
+                detail['tags'] = [d.format_detail() for d in self.tags]
+            else:
+                detail['tags'] = [i.hex for i, in self.tags.with_entities(Tag.id)]
+        if wants('styles', fields):
+            ids = [i for i, in self.styles.with_entities(Style.id)]
+            detail['styles'] = taxonomy.registry.details('style', ids) \
+                if expands('styles', expand) else ids
+        if wants('categories', fields):
+            ids = [i for i, in self.categories.with_entities(Category.id)]
+            detail['categories'] = taxonomy.registry.details('category', ids) \
+                if expands('categories', expand) else ids
+
+        collection_kwargs = {
+            'get_photographer': False,
+            'expand': expand,
+        }
+        if get_email and wants('email', fields):
             detail['email'] = self.email
         if get_collections:
-            detail['collections'] = [c.format_detail(get_photographer=False) for c in self.collections]
-            if self.cover_collection:
-                detail['cover'] = self.cover_collection.format_detail(get_photographer=False)
-        else:
-            if self.cover_collection:
-                detail['collection'] = self.cover_collection.format_detail(get_photographer=False)
+            if wants('collections', fields):
+                if expands('collections', expand):
+                    detail['collections'] = [c.format_detail(**collection_kwargs)
+                                             for c in self.collections]
+                else:
+                    detail['collections'] = [i.hex for i, in
+                                             self.collections.with_entities(Collection.id)]
+            if self.cover_collection_id and wants('cover', fields):
+                detail['cover'] = self.cover_collection.format_detail(**collection_kwargs) \
+                    if expands('cover', expand) else self.cover_collection_id.hex
+        elif wants('collection', fields):
+            if self.cover_collection_id:
+                detail['collection'] = self.cover_collection.format_detail(**collection_kwargs) \
+                    if expands('collection', expand) else self.cover_collection_id.hex
+            elif not self.hottest_collection_id:
+                detail['collection'] = None
+            elif expands('collection', expand):
+                detail['collection'] = self.hottest_collection.format_detail(**collection_kwargs)
             else:
-                hottest_collection = self.collections.order_by("likes desc").first()
-                detail['collection'] = hottest_collection.format_detail(get_photographer=False) \
-                    if hottest_collection else None
+                detail['collection'] = self.hottest_collection_id.hex
 
-        if self.is_admin:
+        if self.is_admin and 'status' in detail:
             detail['status'] = "admin"
-        if self.avatar:
-            detail['avatar'] = self.avatar.format_detail()
-        if self.school:
-            detail['school'] = self.school.format_detail()
-                
+        if self.avatar_id and wants('avatar', fields):
+            detail['avatar'] = self.avatar.format_detail() \
+                if expands('avatar', expand) else self.avatar_id.hex
+        if self.school_id and wants('school', fields):
+            detail['school'] = taxonomy.registry.detail('school', self.school_id) \
+                if expands('school', expand) else self.school_id
+
         return detail
 
 
@@ -353,6 +473,12 @@ class Collection(Base):
                          nullable=True)
     likes = Column(BigInteger,
                    default=0)
+    trending = Column(Float(precision=53),
+                      nullable=True,
+                      index=True)
+    image_count = Column(Integer,
+                         default=0,
+                         nullable=False)
     user_id = Column(GUID(),
                      ForeignKey('user.id'))
     model_name = Column(Unicode(20),
@@ -368,6 +494,15 @@ class Collection(Base):
                           lazy='dynamic')
     create_time = Column(DateTime(timezone=True),
                          nullable=False)
+    updated_at = Column(DateTime(timezone=True),
+                        default=util.get_utc_time,
+                        onupdate=util.get_utc_time,
+                        nullable=False)
+
+    __table_args__ = (
+        Index('ix_collection_user_updated_at', 'user_id', 'updated_at'),
+        Index('ix_collection_user_trending', 'user_id', 'trending'),
+    )
 
     def __init__(self, name=None, description=None,
                  model_name=None, photoshop=None, filming_time=None):
@@ -378,25 +513,34 @@ class Collection(Base):
         self.photoshop = photoshop
         self.filming_time = filming_time
 
+    detail_fields = ('id', 'name', 'description', 'likes', 'images',
+                     'photographer', 'photoshop', 'model_name',
+                     'filming_time', 'is_liked')
+    detail_relations = ('images', 'photographer') + User.detail_relations
+
     def format_detail(self, get_photographer=True,
-                      check_func=None):
+                      check_func=None, fields=None, expand=None):
         detail = {
             'id': self.id.hex,
-            'name': self.name,
-            'description': self.description,
-            'likes': self.likes,
-            'images': [i.format_detail() for i in self.images]
         }
-
-        if get_photographer:
-            detail['photographer'] = self.user.format_detail()
-        if self.photoshop:
-            detail['photoshop'] = self.photoshop
-        if self.model_name:
-            detail['model_name'] = self.model_name
-        if self.filming_time:
-            detail['filming_time'] = self.filming_time
-        if check_func:
+        for attr in ('name', 'description', 'likes'):
+            if wants(attr, fields):
+                detail[attr] = getattr(self, attr)
+        for attr in ('photoshop', 'model_name', 'filming_time'):
+            if getattr(self, attr) and wants(attr, fields):
+                detail[attr] = getattr(self, attr)
+
+        if wants('images', fields):
+            if expands('images', expand):
+                detail['images'] = [i.format_detail() for i in self.images]
+            else:
+                detail['images'] = [i.hex for i, in self.images.with_entities(Image.id)]
+        if get_photographer and wants('photographer', fields):
+            if expands('photographer', expand):
+                detail['photographer'] = self.user.format_detail(expand=expand)
+            else:
+                detail['photographer'] = self.user_id.hex if self.user_id else None
+        if check_func and wants('is_liked', fields):
             detail['is_liked'] = check_func(self)
 
         return detail
@@ -440,23 +584,154 @@ class Theme(Base):
                                  lazy="dynamic")
     create_time = Column(DateTime(timezone=True),
                          nullable=False)
+    collection_count = Column(Integer,
+                              default=0,
+                              nullable=False)
 
     def __init__(self, cover=None, name=None):
         self.cover = cover
         self.name = name
         self.create_time = util.get_utc_time()
 
-    def format_detail(self):
+    detail_fields = ('id', 'name', 'cover')
+    detail_relations = ('cover',)
+
+    def format_detail(self, fields=None, expand=None):
         detail = {
             'id': self.id.hex,
-            'name': self.name
         }
-        if self.cover:
-            detail['cover'] = self.cover.format_detail()
+        if wants('name', fields):
+            detail['name'] = self.name
+        if self.cover_id and wants('cover', fields):
+            detail['cover'] = self.cover.format_detail() \
+                if expands('cover', expand) else self.cover_id.hex
 
         return detail
 
 
+class Tombstone(Base):
+    """
+    Records a deletion so the `since=` feeds can report it.
+
+    kind is one of 'photographer', 'collection', 'theme' or
+    'theme_collection'; parent_id is the photographer of a deleted
+    collection or the theme a collection was removed from.
+    """
+    __tablename__ = 'tombstone'
+    id = Column(Integer,
+                autoincrement=True,
+                primary_key=True)
+    kind = Column(Unicode(30),
+                  nullable=False)
+    object_id = Column(GUID(),
+                       nullable=False)
+    parent_id = Column(GUID(),
+                       nullable=True)
+    delete_time = Column(DateTime(timezone=True),
+                         nullable=False)
+
+    __table_args__ = (
+        Index('ix_tombstone_feed', 'kind', 'parent_id', 'delete_time'),
+    )
+
+    def __init__(self, kind, object_id, parent_id=None):
+        self.kind = kind
+        self.object_id = object_id
+        self.parent_id = parent_id
+        self.delete_time = util.get_utc_time()
+
+
+class PhotographerCard(Base):
+    """
+    Read model of a listed photographer: the JSON of
+    User.format_detail() and the keys the list endpoints filter and
+    sort on. The likes of the photographer and of the collection the
+    card shows are kept out of the JSON. Maintained by cards.refresh
+    and cards.like.
+    """
+    __tablename__ = 'photographer_card'
+    user_id = Column(GUID(),
+                     ForeignKey('user.id'),
+                     primary_key=True)
+    number = Column(Integer,
+                    nullable=False,
+                    index=True)
+    likes = Column(BigInteger,
+                   nullable=False,
+                   index=True)
+    trending = Column(Float(precision=53),
+                      nullable=True,
+                      index=True)
+    create_time = Column(DateTime(timezone=True),
+                         nullable=False,
+                         index=True)
+    name = Column(Unicode(30),
+                  nullable=False)
+    school_id = Column(Integer,
+                       nullable=True,
+                       index=True)
+    detail = Column(UnicodeText,
+                    nullable=False)
+    collection_likes = Column(BigInteger,
+                              nullable=True)
+    collection_detail = Column(UnicodeText,
+                               nullable=True)
+    updated_at = Column(DateTime(timezone=True),
+                        default=util.get_utc_time,
+                        onupdate=util.get_utc_time,
+                        nullable=False)
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+
+
+class SimilarPhotographer(Base):
+    """
+    A photographer's nearest neighbours by rank, written by
+    recommend.build.
+    """
+    __tablename__ = 'similar_photographer'
+    user_id = Column(GUID(),
+                     ForeignKey('user.id'),
+                     primary_key=True)
+    rank = Column(SmallInteger,
+                  primary_key=True,
+                  autoincrement=False)
+    similar_id = Column(GUID(),
+                        ForeignKey('user.id'),
+                        nullable=False)
+    score = Column(Float,
+                   nullable=False)
+
+
+photographer_card_facet_table = Table('photographer_card_facet', Base.metadata,
+                                      Column('kind',
+                                             Unicode(10), nullable=False),
+                                      Column('facet_id',
+                                             Unicode(32), nullable=False),
+                                      Column('user_id',
+                                             GUID(), ForeignKey('photographer_card.user_id'),
+                                             nullable=False),
+                                      PrimaryKeyConstraint('kind', 'facet_id', 'user_id'),
+                                      Index('ix_photographer_card_facet_user', 'user_id'))
+
+
+class Counter(Base):
+    """
+    Named counters that don't belong to one row, see counters.py.
+    """
+    __tablename__ = 'counter'
+    name = Column(Unicode(30),
+                  primary_key=True)
+    value = Column(BigInteger,
+                   default=0,
+                   nullable=False)
+
+    def __init__(self, name, value=0):
+        self.name = name
+        self.value = value
+
+
 class Banner(Base):
     __tablename__ = 'banner'
     id = Column(GUID(),
@@ -501,8 +776,12 @@ class HomePhotographer(Base):
         self.photographer = photographer
         self.number = number
 
-    def format_detail(self):
-        detail = self.photographer.format_detail()
+    detail_fields = User.detail_fields
+    detail_relations = User.detail_relations
+
+    def format_detail(self, fields=None, expand=None):
+        detail = self.photographer.format_detail(fields=fields,
+                                                 expand=expand)
 
         return detail
 
@@ -521,7 +800,11 @@ class HomeCollection(Base):
         self.collection = collection
         self.number = number
 
-    def format_detail(self):
-        detail = self.collection.format_detail()
+    detail_fields = Collection.detail_fields
+    detail_relations = Collection.detail_relations
+
+    def format_detail(self, fields=None, expand=None):
+        detail = self.collection.format_detail(fields=fields,
+                                               expand=expand)
 
         return detail
@@ -0,0 +1,67 @@
+"""
+N+1 query detection.
+
+Every statement a request executes is reduced to its template (the
+SQL text with IN lists collapsed) and counted; a template executed
+more than `threshold` times in one request is a violation. That is
+what a lazy load inside a format_detail loop looks like.
+
+    site_settings['nplusone_threshold']   None (off) or the largest
+                                          count allowed per template
+    site_settings['nplusone_mode']        'log' to warn once per
+                                          template and request, 'raise'
+                                          to fail the statement with
+                                          NPlusOneError (tests)
+    site_settings['nplusone_allowlist']   regular expressions; matching
+                                          templates are never flagged
+
+The most recent violations are kept in `violations` for tools such as
+`python3 -m tools.route_sweep`.
+"""
+import re
+import logging
+from collections import deque
+
+from settings import site_settings
+
+
+threshold = site_settings.get('nplusone_threshold', None)
+mode = site_settings.get('nplusone_mode', 'log')
+allowlist = [re.compile(pattern)
+             for pattern in site_settings.get('nplusone_allowlist', ())]
+
+log = logging.getLogger(__name__)
+violations = deque(maxlen=100)
+
+in_list = re.compile(r'IN \((?:[^()]*)\)')
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+def template(statement):
+    return in_list.sub('IN (...)', statement)
+
+
+def allowed(text):
+    return any(pattern.search(text) for pattern in allowlist)
+
+
+def check(timing, statement):
+    """
+    Count statement against timing's request; called for every
+    statement while `threshold` is set.
+    """
+    text = template(statement)
+    timing.templates[text] += 1
+    count = timing.templates[text]
+    if count != threshold + 1 or allowed(text):
+        return
+
+    violations.append((timing.name, text))
+    if mode == 'raise':
+        raise NPlusOneError("{}: executed more than {} times: {}".format(
+            timing.name, threshold, text))
+    log.warning("possible N+1 in %s: executed more than %d times: %s",
+                timing.name, threshold, text)
@@ -0,0 +1,365 @@
+"""
+Read-only list path.
+
+Runs Core selects and maps the rows into slotted DTOs whose
+format_detail output matches the models', without building ORM
+instances or uuid.UUID objects. Relations are loaded with one IN
+query per relation and page, and only when `fields`/`expand` ask for
+them; styles, categories and schools come from the taxonomy registry.
+"""
+from sqlalchemy import (
+    select,
+    type_coerce,
+)
+
+import models
+import database
+import taxonomy
+from models import (
+    wants,
+    expands,
+)
+from settings import cdn_settings
+
+
+user_table = models.User.__table__
+tag_table = models.Tag.__table__
+image_table = models.Image.__table__
+collection_table = models.Collection.__table__
+banner_table = models.Banner.__table__
+
+
+def hex_id(column):
+    return type_coerce(column, models.HexGUID())
+
+
+class ImageRow(object):
+    __slots__ = ('id', 'filename')
+
+    def __init__(self, id, filename):
+        self.id = id
+        self.filename = filename
+
+    def format_detail(self):
+        host = cdn_settings['image_host']
+        detail = {
+            'id': self.id,
+            'path': host + self.filename,
+            'compressed_path': host + 'comp_' + self.filename,
+            'croped_path': host + 'crop_comp_' + self.filename
+        }
+
+        return detail
+
+
+class TagRow(object):
+    __slots__ = ('id', 'text')
+
+    def __init__(self, id, text):
+        self.id = id
+        self.text = text
+
+    def format_detail(self):
+        detail = {
+            'id': self.id,
+            'text': self.text
+        }
+
+        return detail
+
+
+class UserRow(object):
+    __slots__ = ('id', 'name', 'likes', 'imagelink', 'major', 'number',
+                 'sex', 'description', 'status', 'is_admin',
+                 'avatar_id', 'school_id', 'cover_collection_id',
+                 'hottest_collection_id',
+                 'tags', 'styles', 'categories', 'avatar',
+                 'collection_id', 'collection')
+
+    @staticmethod
+    def columns():
+        c = user_table.c
+        return [hex_id(c.id), c.name, c.likes, c.imagelink, c.major,
+                c.number, c.sex, c.description, c.status, c.is_admin,
+                hex_id(c.avatar_id), c.school_id,
+                hex_id(c.cover_collection_id),
+                hex_id(c.hottest_collection_id)]
+
+    def __init__(self, row):
+        (self.id, self.name, self.likes, self.imagelink, self.major,
+         self.number, self.sex, self.description, self.status,
+         self.is_admin, self.avatar_id, self.school_id,
+         self.cover_collection_id, self.hottest_collection_id) = row
+        self.tags = self.styles = self.categories = ()
+        self.avatar = self.collection = None
+        self.collection_id = self.cover_collection_id \
+            or self.hottest_collection_id
+
+    def format_detail(self, fields=None, expand=None):
+        detail = {
+            'id': self.id,
+        }
+        for attr in ('name', 'likes', 'imagelink', 'major',
+                     'number', 'sex', 'description', 'status'):
+            if wants(attr, fields):
+                detail[attr] = getattr(self, attr)
+
+        for attr in ('tags', 'styles', 'categories'):
+            if wants(attr, fields):
+                if expands(attr, expand):
+                    detail[attr] = [o.format_detail() for o in getattr(self, attr)]
+                else:
+                    detail[attr] = [o.id for o in getattr(self, attr)]
+
+        if wants('collection', fields):
+            if self.collection is not None:
+                detail['collection'] = self.collection.format_detail(
+                    get_photographer=False, expand=expand)
+            else:
+                detail['collection'] = self.collection_id
+
+        if self.is_admin and 'status' in detail:
+            detail['status'] = "admin"
+        if self.avatar_id and wants('avatar', fields):
+            detail['avatar'] = self.avatar.format_detail() \
+                if expands('avatar', expand) else self.avatar_id
+        if self.school_id and wants('school', fields):
+            detail['school'] = taxonomy.registry.detail('school', self.school_id) \
+                if expands('school', expand) else self.school_id
+
+        return detail
+
+
+class CollectionRow(object):
+    __slots__ = ('id', 'name', 'description', 'likes', 'user_id',
+                 'model_name', 'photoshop', 'filming_time',
+                 'images', 'photographer')
+
+    @staticmethod
+    def columns():
+        c = collection_table.c
+        return [hex_id(c.id), c.name, c.description, c.likes,
+                hex_id(c.user_id), c.model_name, c.photoshop,
+                c.filming_time]
+
+    def __init__(self, row):
+        (self.id, self.name, self.description, self.likes,
+         self.user_id, self.model_name, self.photoshop,
+         self.filming_time) = row
+        self.images = ()
+        self.photographer = None
+
+    def format_detail(self, get_photographer=True,
+                      fields=None, expand=None):
+        detail = {
+            'id': self.id,
+        }
+        for attr in ('name', 'description', 'likes'):
+            if wants(attr, fields):
+                detail[attr] = getattr(self, attr)
+        for attr in ('photoshop', 'model_name', 'filming_time'):
+            if getattr(self, attr) and wants(attr, fields):
+                detail[attr] = getattr(self, attr)
+
+        if wants('images', fields):
+            if expands('images', expand):
+                detail['images'] = [i.format_detail() for i in self.images]
+            else:
+                detail['images'] = [i.id for i in self.images]
+        if get_photographer and wants('photographer', fields):
+            if self.photographer is not None:
+                detail['photographer'] = self.photographer.format_detail(expand=expand)
+            else:
+                detail['photographer'] = self.user_id
+
+        return detail
+
+
+class BannerRow(object):
+    __slots__ = ('id', 'number', 'cover')
+
+    @staticmethod
+    def columns():
+        c = banner_table.c
+        return [hex_id(c.id), c.number,
+                hex_id(image_table.c.id), image_table.c.filename]
+
+    def __init__(self, row):
+        self.id, self.number, cover_id, filename = row
+        self.cover = ImageRow(cover_id, filename)
+
+    def format_detail(self, fields=None, expand=None):
+        detail = {
+            'id': self.id,
+            'cover': self.cover.format_detail(),
+            'number': self.number,
+        }
+
+        return detail
+
+
+class Reader(object):
+    """
+    Loads a page of DTOs for the `fields`/`expand` of one request.
+
+    Top-level rows honour `fields`; nested photographers and
+    collections are complete apart from what `expand` leaves out,
+    as with the models.
+    """
+    def __init__(self, session, fields=None, expand=None):
+        self.session = session
+        self.fields = fields
+        self.expand = expand
+
+    def execute(self, statement, params=None):
+        """
+        Statements run with params are templates from
+        database.statement, so their compiled form is cached.
+        """
+        if params is None:
+            return self.session.execute(statement).fetchall()
+        conn = self.session.connection()\
+            .execution_options(compiled_cache=database.compiled_cache)
+        return conn.execute(statement, params).fetchall()
+
+    def photographers(self, query, params=None):
+        """
+        query is a Query, or with params a templated Select of
+        UserRow.columns().
+        """
+        if params is None:
+            statement = query.with_entities(*UserRow.columns()).statement
+        else:
+            statement = query
+        users = [UserRow(row) for row in self.execute(statement, params)]
+        self.attach_users(users, self.fields)
+
+        return users
+
+    def collections(self, query):
+        statement = query.with_entities(*CollectionRow.columns()).statement
+        collections = [CollectionRow(row) for row in self.execute(statement)]
+        self.attach_collections(collections, self.fields)
+
+        return collections
+
+    def banners(self, query):
+        statement = query\
+            .join(models.Image, models.Banner.cover_id == models.Image.id)\
+            .with_entities(*BannerRow.columns())\
+            .statement
+
+        return [BannerRow(row) for row in self.execute(statement)]
+
+    def users_by_ids(self, ids):
+        statement = select(UserRow.columns())\
+            .where(user_table.c.id.in_(ids))
+        users = [UserRow(row) for row in self.execute(statement)]
+        self.attach_users(users, None)
+
+        return users
+
+    def collections_by_ids(self, ids):
+        statement = select(CollectionRow.columns())\
+            .where(collection_table.c.id.in_(ids))
+        collections = [CollectionRow(row) for row in self.execute(statement)]
+        self.attach_collections(collections, None, get_photographer=False)
+
+        return collections
+
+    def attach_users(self, users, fields):
+        if not users:
+            return
+        expand = self.expand
+        by_id = dict((u.id, u) for u in users)
+        ids = list(by_id)
+
+        if wants('tags', fields):
+            for u in users:
+                u.tags = []
+            statement = select([hex_id(tag_table.c.user_id),
+                                hex_id(tag_table.c.id),
+                                tag_table.c.text])\
+                .where(tag_table.c.user_id.in_(ids))
+            for user_id, id, text in self.execute(statement):
+                by_id[user_id].tags.append(TagRow(id, text))
+
+        for attr, kind, table, column in (
+                ('styles', 'style', models.photographer_style_table, 'style_id'),
+                ('categories', 'category', models.photographer_category_table, 'category_id')):
+            if not wants(attr, fields):
+                continue
+            for u in users:
+                setattr(u, attr, [])
+            statement = select([hex_id(table.c.photographer_id),
+                                table.c[column]])\
+                .where(table.c.photographer_id.in_(ids))
+            for user_id, id in self.execute(statement):
+                entry = taxonomy.registry.get(kind, id)
+                if entry is not None:
+                    getattr(by_id[user_id], attr).append(entry)
+
+        if wants('avatar', fields) and expands('avatar', expand):
+            avatar_ids = set(u.avatar_id for u in users if u.avatar_id)
+            avatars = self.images_by_ids(avatar_ids)
+            for u in users:
+                u.avatar = avatars.get(u.avatar_id)
+
+        if wants('collection', fields):
+            self.attach_user_collection(users)
+
+    def attach_user_collection(self, users):
+        """
+        The cover collection, or the most liked one without a cover.
+        """
+        if not expands('collection', self.expand):
+            return
+        collection_ids = set(u.collection_id for u in users if u.collection_id)
+        if not collection_ids:
+            return
+        collections = dict((c.id, c) for c in self.collections_by_ids(collection_ids))
+        for u in users:
+            u.collection = collections.get(u.collection_id)
+
+    def attach_collections(self, collections, fields, get_photographer=True):
+        if not collections:
+            return
+        expand = self.expand
+        by_id = dict((c.id, c) for c in collections)
+        ids = list(by_id)
+
+        if wants('images', fields):
+            for c in collections:
+                c.images = []
+            table = models.image_collection_table
+            if expands('images', expand):
+                statement = select([hex_id(table.c.collection_id),
+                                    hex_id(image_table.c.id),
+                                    image_table.c.filename])\
+                    .select_from(table.join(image_table))\
+                    .where(table.c.collection_id.in_(ids))
+                for collection_id, id, filename in self.execute(statement):
+                    by_id[collection_id].images.append(ImageRow(id, filename))
+            else:
+                statement = select([hex_id(table.c.collection_id),
+                                    hex_id(table.c.image_id)])\
+                    .where(table.c.collection_id.in_(ids))
+                for collection_id, id in self.execute(statement):
+                    by_id[collection_id].images.append(ImageRow(id, None))
+
+        if get_photographer and wants('photographer', fields) \
+                and expands('photographer', expand):
+            user_ids = set(c.user_id for c in collections if c.user_id)
+            if user_ids:
+                users = dict((u.id, u) for u in self.users_by_ids(user_ids))
+                for c in collections:
+                    c.photographer = users.get(c.user_id)
+
+    def images_by_ids(self, ids):
+        if not ids:
+            return {}
+        statement = select([hex_id(image_table.c.id), image_table.c.filename])\
+            .where(image_table.c.id.in_(ids))
+
+        return dict((id, ImageRow(id, filename))
+                    for id, filename in self.execute(statement))
@@ -0,0 +1,174 @@
+"""
+Similar photographers from precomputed feature vectors.
+
+Every reviewed photographer becomes a row of one-hot blocks: styles,
+categories, themes, school and the `similar_tag_vocabulary` most used
+tag texts. Each block is scaled to its weight so one long tag list
+can't drown the rest, and rows are L2 normalized, so a batch of rows
+times the transposed matrix is their cosine similarity to everyone.
+The `similar_top_k` best of each row are written to
+`similar_photographer`, which /photographer/<id>/similar reads by
+primary key.
+
+Run it from cron, it takes the whole table into memory:
+
+    python3 -m recommend
+"""
+
+import numpy as np
+from sqlalchemy import (
+    select,
+    func,
+)
+
+import models
+from settings import site_settings
+
+
+top_k = site_settings.get('similar_top_k', 10)
+tag_vocabulary = site_settings.get('similar_tag_vocabulary', 512)
+batch_size = site_settings.get('similar_batch_size', 256)
+weights = {
+    'style': 1.0,
+    'category': 1.0,
+    'theme': 1.0,
+    'school': 0.5,
+    'tag': 0.5,
+}
+
+
+def load(session):
+    """
+    Photographer ids, and for each block the (row, column) pairs of
+    its ones and its width.
+    """
+    user = models.User.__table__
+    ids = [id for id, in session.execute(
+        select([user.c.id])
+        .where(user.c.status == 'reviewed')
+        .where(user.c.is_admin == False)
+        .order_by(user.c.number))]
+    rows = dict((id, i) for i, id in enumerate(ids))
+
+    def block(pairs):
+        columns = dict()
+        coords = list()
+        for user_id, value in pairs:
+            if user_id in rows and value is not None:
+                coords.append((rows[user_id], columns.setdefault(value, len(columns))))
+        return coords, len(columns)
+
+    tag = models.Tag.__table__
+    vocabulary = set(text for text, in session.execute(
+        select([tag.c.text])
+        .group_by(tag.c.text)
+        .order_by(func.count().desc())
+        .limit(tag_vocabulary)))
+
+    blocks = {
+        'style': block(session.execute(
+            select([models.photographer_style_table.c.photographer_id,
+                    models.photographer_style_table.c.style_id]))),
+        'category': block(session.execute(
+            select([models.photographer_category_table.c.photographer_id,
+                    models.photographer_category_table.c.category_id]))),
+        'theme': block(session.execute(
+            select([models.theme_photographer_table.c.photographer_id,
+                    models.theme_photographer_table.c.theme_id]))),
+        'school': block(session.execute(
+            select([user.c.id, user.c.school_id]))),
+        'tag': block((user_id, text) for user_id, text in session.execute(
+            select([tag.c.user_id, tag.c.text])) if text in vocabulary),
+    }
+
+    return ids, blocks
+
+
+def features(n, blocks):
+    """
+    The row-normalized float32 feature matrix.
+    """
+    widths = [blocks[name][1] for name in sorted(blocks)]
+    X = np.zeros((n, max(sum(widths), 1)), dtype=np.float32)
+    offset = 0
+    for name in sorted(blocks):
+        coords, width = blocks[name]
+        if coords:
+            pairs = np.array(coords, dtype=np.int64)
+            counts = np.bincount(pairs[:, 0], minlength=n)
+            X[pairs[:, 0], offset + pairs[:, 1]] = \
+                weights[name] / np.sqrt(counts[pairs[:, 0]])
+        offset += width
+
+    norms = np.linalg.norm(X, axis=1)
+    norms[norms == 0] = 1
+    X /= norms[:, None]
+
+    return X
+
+
+def neighbours(X, k, batch=None):
+    """
+    Indices and cosine scores of each row's k nearest other rows,
+    best first, computed batch rows at a time.
+    """
+    n = X.shape[0]
+    k = min(k, n - 1)
+    batch = batch or batch_size
+    indices = np.zeros((n, max(k, 0)), dtype=np.int64)
+    scores = np.zeros((n, max(k, 0)), dtype=np.float32)
+    if k <= 0:
+        return indices, scores
+
+    for start in range(0, n, batch):
+        stop = min(start + batch, n)
+        rows = np.arange(stop - start)
+        S = np.dot(X[start:stop], X.T)
+        S[rows, np.arange(start, stop)] = -np.inf
+        part = np.argpartition(-S, k - 1, axis=1)[:, :k]
+        top = S[rows[:, None], part]
+        order = np.argsort(-top, axis=1)
+        indices[start:stop] = part[rows[:, None], order]
+        scores[start:stop] = top[rows[:, None], order]
+
+    return indices, scores
+
+
+def store(session, ids, indices, scores, chunk=5000):
+    table = models.SimilarPhotographer.__table__
+    session.execute(table.delete())
+    rows = list()
+    for i, user_id in enumerate(ids):
+        rank = 0
+        for j, score in zip(indices[i], scores[i]):
+            if score <= 0:
+                break
+            rows.append({
+                'user_id': user_id,
+                'rank': rank,
+                'similar_id': ids[j],
+                'score': float(score),
+            })
+            rank += 1
+        if len(rows) >= chunk:
+            session.execute(table.insert(), rows)
+            rows = list()
+    if rows:
+        session.execute(table.insert(), rows)
+    session.commit()
+
+
+def build(session=None):
+    from database import db_session
+    if session is None:
+        session = db_session()
+    try:
+        ids, blocks = load(session)
+        indices, scores = neighbours(features(len(ids), blocks), top_k)
+        store(session, ids, indices, scores)
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    build()
@@ -0,0 +1,142 @@
+"""
+In-memory registry of the small, rarely-changing option tables:
+styles, schools, categories and themes.
+
+It is loaded at startup and reloaded after create_option,
+create_theme, edit_theme and delete_theme. Those also bump a version
+in Redis, and every process compares it with its own at most once
+per `taxonomy_check_interval` seconds, reloading when it changed.
+"""
+import time
+import uuid
+
+from settings import site_settings
+
+
+version_key = 'taxonomy:version'
+
+
+class Entry(object):
+    __slots__ = ('id', 'name', 'cover')
+
+    def __init__(self, id, name, cover=None):
+        self.id = id
+        self.name = name
+        self.cover = cover
+
+    def format_detail(self):
+        detail = {
+            'id': self.id,
+            'name': self.name
+        }
+        if self.cover:
+            detail['cover'] = self.cover
+
+        return detail
+
+
+class Registry(object):
+    kinds = ('style', 'school', 'category', 'theme')
+
+    def __init__(self):
+        self.entries = dict((kind, dict()) for kind in self.kinds)
+        self.ordered = dict((kind, list()) for kind in self.kinds)
+        self.loaded = False
+        self.version = None
+        self.checked = 0
+        self.check_interval = site_settings.get('taxonomy_check_interval', 5)
+
+    def load(self, session=None):
+        import models
+        from database import db_session
+        if session is None:
+            session = db_session()
+
+        rows = {
+            'style': session.query(models.Style.id, models.Style.name)
+                            .order_by(models.Style.id.desc()),
+            'school': session.query(models.School.id, models.School.name)
+                             .order_by(models.School.id.desc()),
+            'category': session.query(models.Category.id, models.Category.name)
+                               .order_by(models.Category.id.desc()),
+        }
+        for kind, query in rows.items():
+            self.ordered[kind] = [Entry(id, name) for id, name in query]
+
+        themes = session.query(models.Theme.id, models.Theme.name, models.Image)\
+            .outerjoin(models.Image, models.Theme.cover_id == models.Image.id)\
+            .order_by(models.Theme.create_time.asc())
+        self.ordered['theme'] = [
+            Entry(id.hex, name, cover.format_detail() if cover else None)
+            for id, name, cover in themes
+        ]
+
+        for kind in self.kinds:
+            self.entries[kind] = dict((e.id, e) for e in self.ordered[kind])
+        self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    @staticmethod
+    def key(kind, id):
+        if isinstance(id, bytes):
+            id = id.decode()
+        if kind == 'theme':
+            return id.hex if isinstance(id, uuid.UUID) else uuid.UUID(id).hex
+        return int(id)
+
+    def get(self, kind, id):
+        """
+        The entry for id, or None; raises ValueError for malformed ids.
+        """
+        self.ensure_loaded()
+        try:
+            key = self.key(kind, id)
+        except (TypeError, AttributeError):
+            raise ValueError(id)
+        return self.entries[kind].get(key)
+
+    def all(self, kind):
+        self.ensure_loaded()
+        return self.ordered[kind]
+
+    def detail(self, kind, id):
+        entry = self.get(kind, id)
+        return entry.format_detail() if entry else None
+
+    def details(self, kind, ids):
+        return [e.format_detail() for e in (self.get(kind, i) for i in ids) if e]
+
+    def invalidate(self, redis_cli, session=None):
+        """
+        Reload after a change to the option tables, and tell the other
+        processes to do the same.
+        """
+        self.load(session)
+        try:
+            self.version = redis_cli.incr(version_key)
+        except Exception:
+            self.version = None
+
+    def check(self, redis_cli):
+        """
+        Reload if another process invalidated the registry; cheap
+        enough to call on every request.
+        """
+        now = time.time()
+        if now - self.checked < self.check_interval:
+            return
+        self.checked = now
+        try:
+            version = redis_cli.get(version_key)
+        except Exception:
+            return
+        version = int(version) if version is not None else None
+        if version != self.version:
+            self.load()
+            self.version = version
+
+
+registry = Registry()
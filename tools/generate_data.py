@@ -0,0 +1,351 @@
+"""
+Synthetic data for scale testing.
+
+Creates the schema with database.init_db and the option rows with
+init_models, then writes photographers, collections, images, themes,
+tags, taxonomy memberships, banners and home lists with chunked
+multi-row INSERTs on one connection (foreign key checks are off on
+MySQL for the load). Collections per photographer, themes per
+collection and likes per collection are skewed like real traffic; the
+same --seed gives the same rows. Run it on an empty database:
+
+    python3 -m tools.generate_data --users 100000 --collections 200000 \\
+        --images 1000000 --seed 1
+
+Counts, sequences, hottest collections and trending scores are written
+with the rows; cards are rebuilt afterwards unless --skip-cards. Run
+`python3 -m leaderboard` (or start main.py) to fill the leaderboards.
+"""
+import time
+import uuid
+import random
+import argparse
+import datetime
+
+from sqlalchemy import (
+    select,
+    func,
+)
+
+
+defaults = {
+    'users': 100000,
+    'collections': 200000,
+    'images': 1000000,
+    'themes': 50,
+    'tags': 3,
+    'vocabulary': 2000,
+    'banners': 5,
+    'home': 10,
+    'like_alpha': 1.2,
+    'reviewed': 0.9,
+}
+span = 2 * 365 * 24 * 3600
+
+
+def random_uuid(rng):
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def skewed(rng, n, exponent):
+    """
+    An index below n, small ones more likely the larger exponent is.
+    """
+    return min(n - 1, int(n * rng.random() ** exponent))
+
+
+class Batch():
+    """
+    Rows for one table, inserted chunk rows at a time; the batches in
+    `before` are flushed first so foreign keys point at written rows.
+    """
+    def __init__(self, conn, table, chunk, before=()):
+        self.conn = conn
+        self.table = table
+        self.chunk = chunk
+        self.before = before
+        self.rows = list()
+        self.count = 0
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        for batch in self.before:
+            batch.flush()
+        if self.rows:
+            self.conn.execute(self.table.insert(), self.rows)
+            self.count += len(self.rows)
+            self.rows = list()
+
+
+def generate(conn, counts, seed=0, chunk=5000, log=print):
+    """
+    Write a dataset of counts (see `defaults`) on conn. Returns the
+    ids of one photographer, its first collection and image, that
+    collection's theme and a banner.
+    """
+    import util
+    import models
+    import trending
+
+    counts = dict(defaults, **counts)
+    rng = random.Random(seed)
+    now = util.get_utc_time()
+    started = time.time()
+
+    def phase(name):
+        log('{:>8.1f}s  {}'.format(time.time() - started, name))
+
+    def moment():
+        return now - datetime.timedelta(seconds=rng.random() * span)
+
+    user = models.User.__table__
+    image = models.Image.__table__
+    collection = models.Collection.__table__
+    theme = models.Theme.__table__
+    tag = models.Tag.__table__
+    schools = [id for id, in conn.execute(select([models.School.__table__.c.id]))]
+    styles = [id for id, in conn.execute(select([models.Style.__table__.c.id]))]
+    categories = [id for id, in conn.execute(select([models.Category.__table__.c.id]))]
+    first_number = (conn.execute(select([func.max(user.c.number)])).scalar() or 0) + 1
+
+    n_users = counts['users']
+    n_collections = counts['collections']
+    n_themes = counts['themes']
+
+    # owners and likes first: the user rows carry their aggregates
+    user_ids = [random_uuid(rng) for i in range(n_users)]
+    avatar_ids = [random_uuid(rng) for i in range(n_users)]
+    reviewed = [rng.random() < counts['reviewed'] for i in range(n_users)]
+    collection_ids = [random_uuid(rng) for i in range(n_collections)]
+    owners = [skewed(rng, n_users, 2.0) for i in range(n_collections)]
+    likes = [min(int(rng.paretovariate(counts['like_alpha'])) - 1, 100000)
+             for i in range(n_collections)]
+    user_likes = [0] * n_users
+    user_collections = [0] * n_users
+    hottest = [None] * n_users
+    for c, owner in enumerate(owners):
+        user_likes[owner] += likes[c]
+        user_collections[owner] += 1
+        if hottest[owner] is None or likes[c] > likes[hottest[owner]]:
+            hottest[owner] = c
+
+    password = util.set_password('password')
+    users = Batch(conn, user, chunk)
+    for i in range(n_users):
+        number = first_number + i
+        created = moment()
+        users.add({
+            'id': user_ids[i],
+            'number': number,
+            'password': password,
+            'name': 'photographer {}'.format(number),
+            'phone_number': str(15000000000 + number),
+            'email': 'photographer{}@example.com'.format(number),
+            'sex': bool(i % 2),
+            'avatar_id': avatar_ids[i],
+            'status': 'reviewed' if reviewed[i] else 'confirmed',
+            'create_time': created,
+            'description': 'description {}'.format(number),
+            'is_admin': False,
+            'likes': user_likes[i],
+            'trending': trending.exponent(trending.like_weight * user_likes[i], created)
+            if user_likes[i] else None,
+            'collection_count': user_collections[i],
+            'school_id': rng.choice(schools) if schools else None,
+            'hottest_collection_id': collection_ids[hottest[i]]
+            if hottest[i] is not None else None,
+            'updated_at': created,
+        })
+    users.flush()
+    phase('{} users'.format(users.count))
+
+    average = max(1.0, (counts['images'] - n_users - n_themes) / max(n_collections, 1))
+    image_counts = [1 + int(rng.expovariate(1 / (average - 1))) if average > 1 else 1
+                    for i in range(n_collections)]
+    collections = Batch(conn, collection, chunk)
+    for c in range(n_collections):
+        created = moment()
+        collections.add({
+            'id': collection_ids[c],
+            'name': 'collection {}'.format(c),
+            'description': 'description {}'.format(c),
+            'likes': likes[c],
+            'trending': trending.exponent(trending.like_weight * likes[c], created)
+            if likes[c] else None,
+            'image_count': image_counts[c],
+            'user_id': user_ids[owners[c]],
+            'create_time': created,
+            'updated_at': created,
+        })
+    collections.flush()
+    phase('{} collections'.format(collections.count))
+
+    images = Batch(conn, image, chunk)
+    links = Batch(conn, models.image_collection_table, chunk, before=(images,))
+
+    def add_image(id, user_id):
+        images.add({
+            'id': id,
+            'user_id': user_id,
+            'filename': id.hex + '.jpg',
+            'create_time': moment(),
+        })
+
+    for i in range(n_users):
+        add_image(avatar_ids[i], user_ids[i])
+    theme_covers = [random_uuid(rng) for t in range(n_themes)]
+    for id in theme_covers:
+        add_image(id, None)
+    first_images = list()
+    for c in range(n_collections):
+        for k in range(image_counts[c]):
+            id = random_uuid(rng)
+            if k == 0:
+                first_images.append(id)
+            add_image(id, user_ids[owners[c]])
+            links.add({'image_id': id, 'collection_id': collection_ids[c]})
+    links.flush()
+    phase('{} images'.format(images.count))
+
+    theme_ids = [random_uuid(rng) for t in range(n_themes)]
+    memberships = [set(skewed(rng, n_themes, 1.5) for k in range(rng.randint(1, 3)))
+                   if n_themes else set() for c in range(n_collections)]
+    theme_counts = [0] * n_themes
+    for member in memberships:
+        for t in member:
+            theme_counts[t] += 1
+    themes = Batch(conn, theme, chunk)
+    for t in range(n_themes):
+        themes.add({
+            'id': theme_ids[t],
+            'name': 'theme {}'.format(t),
+            'cover_id': theme_covers[t],
+            'create_time': moment(),
+            'collection_count': theme_counts[t],
+        })
+    theme_collections = Batch(conn, models.theme_collection_table, chunk, before=(themes,))
+    theme_photographers = Batch(conn, models.theme_photographer_table, chunk, before=(themes,))
+    photographer_themes = set()
+    for c, member in enumerate(memberships):
+        for t in member:
+            theme_collections.add({'theme_id': theme_ids[t],
+                                   'collection_id': collection_ids[c]})
+            photographer_themes.add((t, owners[c]))
+    for t, owner in sorted(photographer_themes):
+        theme_photographers.add({'theme_id': theme_ids[t],
+                                 'photographer_id': user_ids[owner]})
+    theme_collections.flush()
+    theme_photographers.flush()
+    phase('{} themes, {} theme collections'.format(themes.count, theme_collections.count))
+
+    user_styles = Batch(conn, models.photographer_style_table, chunk)
+    user_categories = Batch(conn, models.photographer_category_table, chunk)
+    tags = Batch(conn, tag, chunk)
+    for i in range(n_users):
+        for id in rng.sample(styles, min(len(styles), rng.randint(1, 3))):
+            user_styles.add({'photographer_id': user_ids[i], 'style_id': id})
+        for id in rng.sample(categories, min(len(categories), rng.randint(1, 3))):
+            user_categories.add({'photographer_id': user_ids[i], 'category_id': id})
+        for k in range(rng.randint(0, 2 * counts['tags'])):
+            tags.add({
+                'id': random_uuid(rng),
+                'text': 'tag {}'.format(skewed(rng, counts['vocabulary'], 2.0)),
+                'user_id': user_ids[i],
+            })
+    for batch in (user_styles, user_categories, tags):
+        batch.flush()
+    phase('{} tags, styles and categories'.format(tags.count))
+
+    banner_ids = [random_uuid(rng) for n in range(min(counts['banners'], n_collections))]
+    banners = Batch(conn, models.Banner.__table__, chunk)
+    for n, id in enumerate(banner_ids):
+        banners.add({'id': id, 'number': n, 'cover_id': first_images[n], 'url': None})
+    banners.flush()
+    top_users = sorted((i for i in range(n_users) if reviewed[i]),
+                       key=lambda i: -user_likes[i])[:counts['home']]
+    top_collections = sorted((c for c in range(n_collections) if reviewed[owners[c]]),
+                             key=lambda c: -likes[c])[:counts['home']]
+    conn.execute(models.HomePhotographer.__table__.insert(),
+                 [{'id': user_ids[i], 'number': n} for n, i in enumerate(top_users)])
+    conn.execute(models.HomeCollection.__table__.insert(),
+                 [{'id': collection_ids[c], 'number': n} for n, c in enumerate(top_collections)])
+
+    counter = models.Counter.__table__
+    values = {
+        'photographers': conn.execute(select([func.count()])
+                                      .where(user.c.status == 'reviewed')
+                                      .where(user.c.is_admin == False)).scalar(),
+        'user_number': first_number + n_users - 1,
+        'banner_number': banners.count - 1,
+        'home_photographer_number': len(top_users) - 1,
+        'home_collection_number': len(top_collections) - 1,
+    }
+    conn.execute(counter.delete().where(counter.c.name.in_(list(values))))
+    conn.execute(counter.insert(), [{'name': name, 'value': value}
+                                    for name, value in values.items()])
+    phase('banners, home lists and counters')
+
+    c = next((c for c in range(n_collections) if reviewed[owners[c]]), 0)
+    return {
+        'photographer': user_ids[owners[c]].hex,
+        'collection': collection_ids[c].hex,
+        'image': first_images[c].hex,
+        'theme': theme_ids[min(memberships[c])].hex if memberships[c] else None,
+        'banner': banner_ids[0].hex if banner_ids else None,
+    }
+
+
+def load(engine, counts, seed=0, chunk=5000, log=print):
+    """
+    generate in one transaction on engine.
+    """
+    with engine.begin() as conn:
+        if conn.dialect.name == 'mysql':
+            conn.execute('SET FOREIGN_KEY_CHECKS=0')
+        ids = generate(conn, counts, seed, chunk, log)
+        if conn.dialect.name == 'mysql':
+            conn.execute('SET FOREIGN_KEY_CHECKS=1')
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    for name in ('users', 'collections', 'images', 'themes', 'tags',
+                 'vocabulary', 'banners', 'home'):
+        parser.add_argument('--' + name, type=int, default=defaults[name])
+    parser.add_argument('--like-alpha', type=float, default=defaults['like_alpha'],
+                        help='Pareto shape of likes per collection, lower is more skewed')
+    parser.add_argument('--reviewed', type=float, default=defaults['reviewed'],
+                        help='share of reviewed photographers')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk', type=int, default=5000,
+                        help='rows per INSERT')
+    parser.add_argument('--drop', action='store_true',
+                        help='drop every table first')
+    parser.add_argument('--skip-cards', action='store_true')
+    args = parser.parse_args()
+
+    import cards
+    import database
+    if args.drop:
+        database.drop_db()
+    database.init_db()
+    database.init_models()
+
+    counts = dict((name, getattr(args, name)) for name in defaults)
+    load(database.engine, counts, args.seed, args.chunk)
+
+    if not args.skip_cards:
+        start = time.time()
+        cards.rebuild(database.db_session())
+        print('{:>8.1f}s  photographer cards'.format(time.time() - start))
+    database.db_session.remove()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Run the application in-process without the production settings,
+MySQL or Redis, for the route sweep and the benchmarks.
+
+`configure` installs a generated `settings` module pointing at a fresh
+SQLite file (or any database url, e.g. a local MySQL), replaces
+util.conn_redis with a shared LocalRedis unless a real server is
+given, and creates the schema and the option rows. It has to run
+before anything imports the application, whose modules read settings
+and connect at import time. `application` then builds the tornado
+Application with main.make_app, `fork_server` serves it from a
+child process, and `seed` loads a small dataset through the ORM or
+`generate` a large one with tools/generate_data.py.
+"""
+import os
+import sys
+import math
+import time
+import uuid
+import types
+import socket
+import signal
+import tempfile
+
+from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
+
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+cookie_secret = 'harness'
+redis_cli = None
+
+
+def settings_module(database_url, redis_host='localhost', redis_port=6379,
+                    site=None):
+    module = types.ModuleType('settings')
+    module.site_settings = dict({
+        'port': 8888,
+        'debug': False,
+        'cookie_secret': cookie_secret,
+        'salt_length': 12,
+        'locale_path': os.path.join(root, 'locale'),
+        'locale_domain': 'wtforms',
+        'image_font': os.path.join(root, 'static', 'font', 'PTM55FT.ttf'),
+        'metrics_allowed_ips': None,
+    }, **(site or {}))
+    module.database_settings = {
+        'default': database_url,
+    }
+    module.redis_settings = {
+        'host': redis_host,
+        'port': redis_port,
+    }
+    module.cdn_settings = {
+        'image_host': 'http://images.invalid/',
+        'cos_host': 'http://cos.invalid/',
+        'bucket': 'harness',
+        'appid': '0',
+        'secretid': 'harness',
+        'secretkey': 'harness',
+    }
+    module.mail_settings = {
+        'host': 'localhost',
+        'port': 25,
+        'email': 'harness@localhost',
+        'password': '',
+    }
+    return module
+
+
+def sqlite_functions(dbapi_connection, connection_record):
+    """
+    The MySQL functions trending.py uses.
+    """
+    def apply(f):
+        return lambda *args: None if None in args else f(*args)
+    dbapi_connection.create_function('greatest', -1, apply(max))
+    dbapi_connection.create_function('ln', 1, apply(math.log))
+    dbapi_connection.create_function('exp', 1, apply(math.exp))
+
+
+def configure(database_url=None, redis=None, site=None, init=True):
+    """
+    database_url defaults to a SQLite file in a new temporary
+    directory; redis is the (host, port) of a real server, None for
+    LocalRedis. Without init the schema and option rows are left to
+    the caller. Returns the database url.
+    """
+    global redis_cli
+    if 'database' in sys.modules:
+        raise RuntimeError("configure() has to run before the application is imported")
+    if database_url is None:
+        directory = tempfile.mkdtemp(prefix='hstxcn-')
+        database_url = 'sqlite:///' + os.path.join(directory, 'harness.db')
+    host, port = redis or ('localhost', 6379)
+    sys.modules['settings'] = settings_module(database_url, host, port, site)
+
+    import util
+    if redis is None:
+        from tools.localredis import LocalRedis
+        redis_cli = LocalRedis()
+        util.conn_redis = lambda: redis_cli
+    else:
+        redis_cli = util.conn_redis()
+
+    from sqlalchemy import event
+    import database
+    if database.engine.dialect.name == 'sqlite':
+        event.listen(database.engine, 'connect', sqlite_functions)
+    if init:
+        database.init_db()
+        database.init_models()
+
+    return database_url
+
+
+def application(**overrides):
+    import main
+    return main.make_app(**overrides)
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def fork_server(port, timeout=30, **overrides):
+    """
+    Serve application() on 127.0.0.1:port from a child process, so the
+    load generator doesn't share its CPU; returns the child's pid once
+    the port accepts connections. The parent must not have started an
+    IOLoop yet.
+    """
+    import database
+    database.engine.dispose()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            import tornado.ioloop
+            import tornado.httpserver
+            io_loop = tornado.ioloop.IOLoop()
+            io_loop.make_current()
+            server = tornado.httpserver.HTTPServer(application(**overrides),
+                                                   xheaders=True)
+            server.listen(port, '127.0.0.1')
+            io_loop.start()
+        finally:
+            os._exit(0)
+
+    deadline = time.time() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.1).close()
+            return pid
+        except OSError:
+            if time.time() > deadline:
+                stop_server(pid)
+                raise RuntimeError("server didn't start on port {}".format(port))
+            time.sleep(0.05)
+
+
+def stop_server(pid):
+    os.kill(pid, signal.SIGTERM)
+    os.waitpid(pid, 0)
+
+
+def auth(user_id):
+    """
+    An Authorization header value for user_id, as /login hands out.
+    """
+    return Serializer(cookie_secret, 86400).dumps({'uid': user_id.hex}).decode()
+
+
+def generate(counts, seed=0):
+    """
+    A dataset of counts from tools.generate_data, with cards and
+    leaderboards built; returns the same ids as `seed`.
+    """
+    import cards
+    import database
+    import leaderboard
+    from tools import generate_data
+
+    ids = generate_data.load(database.engine, counts, seed)
+    cards.rebuild(database.db_session())
+    leaderboard.reconcile(redis_cli)
+    database.db_session.remove()
+    ids['auth'] = auth(uuid.UUID(ids['photographer']))
+
+    return ids
+
+
+def seed(photographers=12, collections=3, images=4, themes=3):
+    """
+    A small dataset through the ORM: reviewed photographers with tags,
+    styles, categories, collections in themes and skewed likes, plus
+    banners and home lists. Returns the ids the route sweep puts in
+    its urls.
+    """
+    import cards
+    import models
+    import counters
+    import leaderboard
+    from database import db_session
+
+    session = db_session()
+    schools = session.query(models.School).all()
+    styles = session.query(models.Style).all()
+    categories = session.query(models.Category).all()
+
+    theme_list = list()
+    for t in range(themes):
+        cover = models.Image(filename='theme-{}.jpg'.format(t))
+        session.add(cover)
+        theme_list.append(models.Theme(cover=cover, name='theme {}'.format(t)))
+    session.add_all(theme_list)
+
+    users = list()
+    members = set()
+    for i in range(photographers):
+        user = models.User(name='photographer {}'.format(i),
+                           phone_number=str(13000000000 + i),
+                           email='photographer{}@example.com'.format(i),
+                           sex=bool(i % 2),
+                           description='description {}'.format(i))
+        user.set_password('password')
+        user.status = 'reviewed'
+        user.school = schools[i % len(schools)]
+        session.add(user)
+        user.styles.append(styles[i % len(styles)])
+        user.categories.append(categories[i % len(categories)])
+        session.add(models.Tag(user, 'tag {}'.format(i % 5)))
+
+        likes = 0
+        for j in range(collections):
+            collection = models.Collection(name='collection {}-{}'.format(i, j),
+                                           description='description')
+            collection.user = user
+            collection.likes = (i * 7 + j * 3) % 20
+            likes += collection.likes
+            for k in range(images):
+                collection.images.append(models.Image(
+                    user=user, filename='image-{}-{}-{}.jpg'.format(i, j, k)))
+            theme = theme_list[(i + j) % themes]
+            theme.collections.append(collection)
+            if (theme.name, i) not in members:
+                members.add((theme.name, i))
+                theme.photographers.append(user)
+            session.add(collection)
+            user.offer_hottest_collection(collection)
+        user.likes = likes
+        users.append(user)
+    session.flush()
+
+    # the avatar belongs to its user, so it can only point back once
+    # both rows exist
+    avatars = [models.Image(user=user, filename='avatar-{}.jpg'.format(i))
+               for i, user in enumerate(users)]
+    session.add_all(avatars)
+    session.flush()
+    for user, avatar in zip(users, avatars):
+        user.avatar = avatar
+
+    first = users[0]
+    collection = first.collections.first()
+    session.add(models.Banner(cover=collection.images.first(), number=0))
+    for n, user in enumerate(users[:4]):
+        session.add(models.HomePhotographer(user, number=n))
+        session.add(models.HomeCollection(user.collections.first(), number=n))
+    session.commit()
+
+    ids = {
+        'photographer': first.id.hex,
+        'collection': collection.id.hex,
+        'image': collection.images.first().id.hex,
+        'theme': collection.themes.first().id.hex,
+        'banner': session.query(models.Banner.id).scalar().hex,
+        'auth': auth(first.id),
+    }
+
+    counters.repair(session)
+    cards.rebuild(session)
+    leaderboard.reconcile(redis_cli, session)
+    db_session.remove()
+
+    return ids
@@ -0,0 +1,179 @@
+"""
+An in-process stand-in for the part of redis.StrictRedis the
+application uses: strings, hashes, sets, sorted sets, pipelines and the
+leaderboard scripts. Values come back as bytes like redis-py's.
+Tools that run the application without a Redis server hand it out
+through harness.configure.
+"""
+
+
+class LocalConnectionPool():
+    def disconnect(self):
+        pass
+
+
+def encode(value):
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
+
+
+class LocalRedis():
+    def __init__(self, *args, **kwargs):
+        self.data = dict()
+        self.connection_pool = LocalConnectionPool()
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return LocalPipeline(self)
+
+    def register_script(self, script):
+        import leaderboard
+        commands = {
+            leaderboard.incr_script: self.zincrby_existing,
+            leaderboard.add_script: self.zadd_existing,
+        }
+        command = commands[script]
+
+        def run(keys=(), args=(), client=None):
+            return command(keys, args)
+        return run
+
+    def flushall(self):
+        self.data.clear()
+
+    # keys
+
+    def exists(self, name):
+        return encode(name) in self.data
+
+    def delete(self, *names):
+        return sum(self.data.pop(encode(name), None) is not None for name in names)
+
+    def rename(self, src, dst):
+        self.data[encode(dst)] = self.data.pop(encode(src))
+        return True
+
+    def drop_empty(self, name):
+        if encode(name) in self.data and not self.data[encode(name)]:
+            del self.data[encode(name)]
+
+    # strings
+
+    def get(self, name):
+        return self.data.get(encode(name))
+
+    def set(self, name, value):
+        self.data[encode(name)] = encode(value)
+        return True
+
+    def incr(self, name, amount=1):
+        value = int(self.data.get(encode(name), 0)) + amount
+        self.data[encode(name)] = encode(value)
+        return value
+
+    # hashes
+
+    def hset(self, name, key, value):
+        hash = self.data.setdefault(encode(name), dict())
+        new = encode(key) not in hash
+        hash[encode(key)] = encode(value)
+        return int(new)
+
+    def hget(self, name, key):
+        return self.data.get(encode(name), {}).get(encode(key))
+
+    def hdel(self, name, *keys):
+        hash = self.data.get(encode(name), {})
+        removed = sum(hash.pop(encode(key), None) is not None for key in keys)
+        self.drop_empty(name)
+        return removed
+
+    # sets
+
+    def set_of(self, name):
+        return self.data.setdefault(encode(name), set())
+
+    def sadd(self, name, *values):
+        members = self.set_of(name)
+        before = len(members)
+        members.update(encode(v) for v in values)
+        return len(members) - before
+
+    def srem(self, name, *values):
+        members = self.data.get(encode(name), set())
+        before = len(members)
+        members.difference_update(encode(v) for v in values)
+        self.drop_empty(name)
+        return before - len(members)
+
+    def sismember(self, name, value):
+        return encode(value) in self.data.get(encode(name), ())
+
+    def smembers(self, name):
+        return set(self.data.get(encode(name), ()))
+
+    # sorted sets
+
+    def zset_of(self, name):
+        return self.data.setdefault(encode(name), dict())
+
+    def zadd(self, name, *pairs):
+        scores = self.zset_of(name)
+        added = 0
+        for score, member in zip(pairs[0::2], pairs[1::2]):
+            added += encode(member) not in scores
+            scores[encode(member)] = float(score)
+        return added
+
+    def zincrby(self, name, value, amount=1):
+        scores = self.zset_of(name)
+        scores[encode(value)] = scores.get(encode(value), 0.0) + float(amount)
+        return scores[encode(value)]
+
+    def zrem(self, name, *values):
+        scores = self.data.get(encode(name), dict())
+        removed = sum(scores.pop(encode(v), None) is not None for v in values)
+        self.drop_empty(name)
+        return removed
+
+    def zrevrange(self, name, start, end, withscores=False):
+        scores = self.data.get(encode(name), dict())
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        ranked = ranked[start:] if end == -1 else ranked[start:end + 1]
+        if withscores:
+            return ranked
+        return [member for member, score in ranked]
+
+    def zincrby_existing(self, keys, args):
+        for key, member in zip(keys, args[1:]):
+            if self.exists(key):
+                self.zincrby(key, member, args[0])
+
+    def zadd_existing(self, keys, args):
+        for key, member in zip(keys, args[1:]):
+            if self.exists(key):
+                self.zadd(key, args[0], member)
+
+
+class LocalPipeline():
+    def __init__(self, client):
+        self.client = client
+        self.commands = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.commands = list()
+
+    def __getattr__(self, name):
+        command = getattr(self.client, name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((command, args, kwargs))
+            return self
+        return queue
+
+    def execute(self, raise_on_error=True):
+        commands, self.commands = self.commands, list()
+        return [command(*args, **kwargs) for command, args, kwargs in commands]
@@ -0,0 +1,315 @@
+"""
+Replay tornado access logs against a local instance.
+
+Reads the `200 GET /api/photographer?styles=1 (1.2.3.4) 12.34ms`
+lines tornado logs, maps every id in their paths and queries onto rows
+of the target database (the same original id always becomes the same
+row of the same kind), and sends them with the original spacing
+divided by --speedup and at most --concurrency in flight. The
+original client address goes in X-Real-Ip, so per-IP likes behave as
+they did. Reports latency percentiles and error rates per route; the
+--output file has the same shape as benchmarks.suite results, so two
+replays compare with `python3 -m benchmarks.suite --compare`.
+
+Against a running server whose database is the one in `settings`:
+
+    python3 -m tools.replay access.log --url http://127.0.0.1:8888
+
+or against a generated dataset served from SQLite by tools/harness.py:
+
+    python3 -m tools.replay access.log --serve --users 10000 \\
+        --collections 20000 --images 100000 --speedup 10
+"""
+import re
+import json
+import time
+import zlib
+import argparse
+import datetime
+from urllib.parse import (
+    urlsplit,
+    parse_qsl,
+    urlencode,
+)
+
+from tools import stats
+from tools.route_sweep import (
+    group,
+    uuid_kinds,
+    group_kinds,
+)
+
+
+line_pattern = re.compile(
+    r'\[\w (?P<time>\d{6} \d{2}:\d{2}:\d{2}) [^\]]*\] '
+    r'(?P<status>\d{3}) (?P<method>[A-Z]+) (?P<uri>\S+) '
+    r'\((?P<ip>[^)]*)\) (?P<ms>[\d.]+)ms')
+query_kinds = {
+    'styles': 'style',
+    'categories': 'category',
+    'schools': 'school',
+    'themes': 'theme',
+}
+
+
+class Entry():
+    __slots__ = ('time', 'status', 'method', 'uri', 'ip', 'ms')
+
+    def __init__(self, time, status, method, uri, ip, ms):
+        self.time = time
+        self.status = status
+        self.method = method
+        self.uri = uri
+        self.ip = ip
+        self.ms = ms
+
+
+def parse(lines):
+    """
+    Entries of the access log lines, in order; other lines are skipped.
+    """
+    for line in lines:
+        match = line_pattern.search(line)
+        if match is None:
+            continue
+        yield Entry(datetime.datetime.strptime(match.group('time'), '%y%m%d %H:%M:%S'),
+                    int(match.group('status')), match.group('method'),
+                    match.group('uri'), match.group('ip'),
+                    float(match.group('ms')))
+
+
+def routes(prefix='/api'):
+    """
+    (compiled pattern, handler, group names) of api/urls.py.
+    """
+    from api import urls
+    return [(re.compile(prefix + pattern + '$'), handler, group.findall(pattern))
+            for pattern, handler in urls.urls]
+
+
+def pools(session, limit=100000):
+    """
+    Ids the rewritten requests may point at, by kind.
+    """
+    import models
+    user = models.User
+    kinds = {
+        'photographer': session.query(user.id)
+                               .filter_by(is_admin=False, status='reviewed'),
+        'collection': session.query(models.Collection.id),
+        'image': session.query(models.Image.id),
+        'theme': session.query(models.Theme.id),
+        'banner': session.query(models.Banner.id),
+        'style': session.query(models.Style.id),
+        'category': session.query(models.Category.id),
+        'school': session.query(models.School.id),
+    }
+    result = dict()
+    for kind, query in kinds.items():
+        ids = [id for id, in query.limit(limit)]
+        result[kind] = [id.hex if hasattr(id, 'hex') else str(id) for id in ids]
+    return result
+
+
+class Rewriter():
+    def __init__(self, routes, pools):
+        self.routes = routes
+        self.pools = pools
+
+    def target(self, kind, original):
+        pool = self.pools.get(kind)
+        if not pool:
+            return original
+        return pool[zlib.crc32(original.encode()) % len(pool)]
+
+    def rewrite(self, uri):
+        """
+        (handler, rewritten uri); handler is None for unknown routes.
+        """
+        parts = urlsplit(uri)
+        path = parts.path
+        handler = None
+        for pattern, name, names in self.routes:
+            match = pattern.match(parts.path)
+            if match is None:
+                continue
+            handler = name
+            pieces = list()
+            last = 0
+            for group_name in names:
+                start, end = match.span(group_name)
+                if group_name == 'uuid':
+                    kind = uuid_kinds.get(name, 'photographer')
+                else:
+                    kind = group_kinds.get(group_name)
+                value = match.group(group_name)
+                pieces.append(parts.path[last:start])
+                pieces.append(self.target(kind, value) if kind else value)
+                last = end
+            pieces.append(parts.path[last:])
+            path = ''.join(pieces)
+            break
+
+        query = [(name, self.target(query_kinds[name], value)
+                  if name in query_kinds else value)
+                 for name, value in parse_qsl(parts.query, keep_blank_values=True)]
+        return handler, path + ('?' + urlencode(query) if query else '')
+
+
+def replay(base_url, requests, speedup, concurrency, headers=None, timeout=30):
+    """
+    Send (handler, entry, uri) requests; returns {handler: (latencies,
+    errors, logged ms)} and the wall time.
+    """
+    from tornado import gen, locks
+    from tornado.ioloop import IOLoop
+    from tornado.httpclient import (
+        AsyncHTTPClient,
+        HTTPRequest,
+    )
+
+    io_loop = IOLoop()
+    io_loop.make_current()
+    client = AsyncHTTPClient(max_clients=concurrency)
+    slots = locks.Semaphore(concurrency)
+    results = dict()
+
+    @gen.coroutine
+    def send(handler, entry, uri):
+        request = HTTPRequest(base_url + uri, method=entry.method,
+                              headers=dict(headers or {}, **{'X-Real-Ip': entry.ip}),
+                              body=b'' if entry.method in ('POST', 'PATCH', 'PUT') else None,
+                              allow_nonstandard_methods=True,
+                              request_timeout=timeout)
+        start = time.perf_counter()
+        try:
+            response = yield client.fetch(request, raise_error=False)
+            code = response.code
+        finally:
+            slots.release()
+        latencies, errors, logged = results.setdefault(handler, ([], [0], []))
+        latencies.append(time.perf_counter() - start)
+        logged.append(entry.ms / 1000)
+        if code >= 500:
+            errors[0] += 1
+
+    @gen.coroutine
+    def run():
+        pending = list()
+        first = None
+        start = time.perf_counter()
+        for handler, entry, uri in requests:
+            if first is None:
+                first = entry.time
+            if speedup:
+                due = (entry.time - first).total_seconds() / speedup
+                delay = due - (time.perf_counter() - start)
+                if delay > 0:
+                    yield gen.sleep(delay)
+            yield slots.acquire()
+            pending.append(send(handler, entry, uri))
+        yield pending
+        return time.perf_counter() - start
+
+    elapsed = io_loop.run_sync(run)
+    return results, elapsed
+
+
+def report(results, elapsed):
+    routes = dict()
+    print('{:<44}{:>8}{:>10}{:>10}{:>10}{:>8}{:>12}'.format(
+        'route', 'count', 'p50 ms', 'p90 ms', 'p99 ms', 'errors', 'logged p50'))
+    for handler in sorted(results, key=lambda h: -len(results[h][0])):
+        latencies, errors, logged = results[handler]
+        summary = stats.summary(latencies, elapsed, errors[0])
+        summary['logged_p50_ms'] = round(stats.percentile(logged, 50) * 1000, 3)
+        routes[handler] = summary
+        print('{:<44}{:>8}{:>10}{:>10}{:>10}{:>7.1%}{:>12}'.format(
+            handler[:43], summary['requests'], summary['p50_ms'],
+            summary['p90_ms'], summary['p99_ms'], summary['error_rate'],
+            summary['logged_p50_ms']))
+    return routes
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('logs', nargs='+', help='access log files')
+    parser.add_argument('--url', help='base url of a running server')
+    parser.add_argument('--serve', action='store_true',
+                        help='generate a dataset and serve it with tools/harness.py')
+    parser.add_argument('--database', help='with --serve, database url instead of SQLite')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--collections', type=int, default=20000)
+    parser.add_argument('--images', type=int, default=100000)
+    parser.add_argument('--themes', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--speedup', type=float, default=1.0,
+                        help='divide the logged spacing by this; 0 sends as fast as allowed')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--methods', default='GET,POST,PATCH,PUT,DELETE',
+                        help='comma separated methods to replay')
+    parser.add_argument('--auth', help='Authorization header to send')
+    parser.add_argument('--limit', type=int, help='replay at most this many requests')
+    parser.add_argument('--output', help='write the results here as JSON')
+    args = parser.parse_args()
+    if bool(args.url) == args.serve:
+        parser.error('give either --url or --serve')
+
+    pid = None
+    if args.serve:
+        from tools import harness
+        harness.configure(args.database)
+        harness.generate({
+            'users': args.users,
+            'collections': args.collections,
+            'images': args.images,
+            'themes': args.themes,
+        }, args.seed)
+    from database import db_session
+    rewriter = Rewriter(routes(), pools(db_session()))
+    db_session.remove()
+    if args.serve:
+        port = harness.free_port()
+        pid = harness.fork_server(port)
+        base_url = 'http://127.0.0.1:{}'.format(port)
+    else:
+        base_url = args.url.rstrip('/')
+
+    methods = set(args.methods.split(','))
+    requests = list()
+    for name in args.logs:
+        with open(name, encoding='utf-8', errors='replace') as f:
+            for entry in parse(f):
+                if entry.method not in methods:
+                    continue
+                handler, uri = rewriter.rewrite(entry.uri)
+                requests.append((handler or 'unrouted', entry, uri))
+    requests.sort(key=lambda request: request[1].time)
+    if args.limit:
+        requests = requests[:args.limit]
+    print('{} requests over {}'.format(
+        len(requests),
+        requests[-1][1].time - requests[0][1].time if requests else 0))
+
+    try:
+        headers = {'Authorization': args.auth} if args.auth else None
+        results, elapsed = replay(base_url, requests, args.speedup,
+                                  args.concurrency, headers)
+    finally:
+        if pid is not None:
+            harness.stop_server(pid)
+
+    routes_summary = report(results, elapsed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'logs': args.logs,
+                'speedup': args.speedup,
+                'concurrency': args.concurrency,
+                'routes': routes_summary,
+            }, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+GET every route in api/urls.py with the N+1 detector raising, against
+a seeded SQLite database and LocalRedis (see harness.py).
+
+A route fails when it answers 5xx or executes one statement template
+more than --threshold times. Authenticated routes are requested as the
+first seeded photographer.
+
+    python3 -m tools.route_sweep --threshold 5
+"""
+import re
+import sys
+import argparse
+import unittest
+
+from tools import harness
+
+
+# which object each route's `uuid` group names, by handler
+uuid_kinds = {
+    'collection.CollectionHandler': 'collection',
+    'collection.CollectionLikeHandler': 'collection',
+    'collection.UserCollectionHandler': 'collection',
+    'home.BannerHandler': 'banner',
+    'home.HomeCollectionHandler': 'collection',
+    'theme.ThemeHandler': 'theme',
+    'theme.ThemeCollectionsHandler': 'theme',
+    'theme.ThemeCollectionsCountHandler': 'theme',
+}
+group_kinds = {
+    'theme_id': 'theme',
+    'col_id': 'collection',
+    'work_id': 'image',
+}
+# extra query strings for the list routes
+variants = {
+    'photographer.PhotographersHandler': [
+        'sortby=likes&order=desc',
+        'sortby=trending&order=desc',
+        'fields=name,collection&expand=collection',
+        'since=0',
+    ],
+    'photographer.PhotographersSearchHandler': ['keyword=photographer'],
+    'collection.CollectionsHandler': ['expand=images,photographer'],
+    'theme.ThemeCollectionsHandler': ['sortby=likes&order=desc'],
+    'home.HomePhotographersHandler': ['expand=collection'],
+}
+group = re.compile(r'\(\?P<(\w+)>[^)]*\)')
+
+
+def paths(ids):
+    """
+    (handler, query, path) for every GET the sweep makes.
+    """
+    from api import urls
+    for pattern, handler in urls.urls:
+        def value(match):
+            name = match.group(1)
+            if name == 'uuid':
+                return ids[uuid_kinds.get(handler, 'photographer')]
+            if name == 'token':
+                return 'invalid'
+            return ids[group_kinds[name]]
+        path = '/api' + group.sub(value, pattern)
+        yield handler, '', path
+        for query in variants.get(handler, ()):
+            yield handler, query, path + '?' + query
+
+
+def sweep_case(threshold):
+    import tornado.testing
+
+    class RouteSweep(tornado.testing.AsyncHTTPTestCase):
+        """
+        One test over all routes, so the seed is loaded once.
+        """
+        def get_app(self):
+            return harness.application()
+
+        def test_routes(self):
+            nplusone.threshold = threshold
+            nplusone.mode = 'raise'
+            failures = list()
+            for handler, query, path in paths(ids):
+                nplusone.violations.clear()
+                response = self.fetch(path, headers={'Authorization': ids['auth']})
+                for name, template in nplusone.violations:
+                    failures.append('{} {}: N+1 {}'.format(handler, path, template))
+                if response.code >= 500 and not nplusone.violations:
+                    failures.append('{} {}: {}'.format(handler, path, response.code))
+            self.assertEqual(failures, [], '\n' + '\n'.join(failures))
+
+    harness.configure()
+    import nplusone
+    ids = harness.seed()
+    return RouteSweep
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threshold', type=int, default=5)
+    args = parser.parse_args()
+
+    suite = unittest.defaultTestLoader.loadTestsFromTestCase(sweep_case(args.threshold))
+    result = unittest.TextTestRunner(verbosity=2).run(suite)
+    sys.exit(not result.wasSuccessful())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Latency summaries and result comparison shared by benchmarks.suite and
+tools.replay.
+"""
+import math
+
+
+def percentile(values, p):
+    """
+    The p-th percentile (0-100) of values by linear interpolation.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100.0
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return ordered[int(rank)]
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summary(latencies, elapsed=None, errors=0):
+    """
+    Milliseconds summary of latencies in seconds; elapsed is the wall
+    time they were collected over, for the request rate.
+    """
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    result = {
+        'requests': len(latencies),
+        'errors': errors,
+        'error_rate': round(errors / len(latencies), 4) if latencies else None,
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p90_ms': ms(percentile(latencies, 90)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'max_ms': ms(max(latencies)) if latencies else None,
+    }
+    if elapsed:
+        result['rps'] = round(len(latencies) / elapsed, 1)
+    return result
+
+
+def compare(baseline, current, tolerance=0.1):
+    """
+    Rows of (route, metric, baseline, current, change, worse) for the
+    routes of two results dicts, and whether any got worse than
+    tolerance: slower p50/p99, fewer requests per second or more
+    errors.
+    """
+    rows = list()
+    regressed = False
+    for route in sorted(set(baseline) & set(current)):
+        for metric, higher_is_worse in (('p50_ms', True), ('p99_ms', True),
+                                        ('rps', False), ('error_rate', True)):
+            old = baseline[route].get(metric)
+            new = current[route].get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else (1.0 if new else 0.0)
+            worse = change > tolerance if higher_is_worse else change < -tolerance
+            regressed = regressed or worse
+            rows.append((route, metric, old, new, change, worse))
+    return rows, regressed
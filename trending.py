@@ -0,0 +1,107 @@
+"""
+Time-decayed trending scores.
+
+A like or upload at time t is worth weight * 2 ** -((now - t) / half_life).
+All scores decay at the same rate, so instead of decaying the stored
+values they are kept relative to a fixed epoch: every event adds
+weight * exp((t - epoch) / tau). Those terms grow without bound, so
+the columns hold their natural log, and an event is one
+log-add-exp UPDATE of a single row. Ordering by the column is then
+ordering by the current decayed score.
+
+An unlike takes back the term its like added, so the time of each like
+is kept in the Redis hash `liked_key(collection)`; likes from before
+that hash existed are taken back at the collection's create_time, the
+time the backfill gave them, which never removes more than they added.
+
+Weights and the half life come from site_settings: `trending_half_life`
+in seconds (7 days), `trending_like_weight` (1) and
+`trending_upload_weight` (3).
+"""
+import math
+import datetime
+
+from dateutil.tz import tzutc
+from sqlalchemy import (
+    case,
+    func,
+)
+
+import util
+from settings import site_settings
+
+
+epoch = datetime.datetime(2017, 1, 1, tzinfo=tzutc())
+half_life = site_settings.get('trending_half_life', 7 * 24 * 3600)
+tau = half_life / math.log(2)
+like_weight = site_settings.get('trending_like_weight', 1.0)
+upload_weight = site_settings.get('trending_upload_weight', 3.0)
+
+
+def exponent(weight, time=None):
+    """
+    log of an event's term: (time - epoch) / tau + log(weight).
+    """
+    if time is None:
+        time = util.get_utc_time()
+    elif time.tzinfo is None:
+        time = time.replace(tzinfo=tzutc())
+    return (time - epoch).total_seconds() / tau + math.log(weight)
+
+
+def add(column, x):
+    """
+    SQL for log(exp(column) + exp(x)), treating NULL as no events.
+    """
+    return case([(column == None, x)],
+                else_=func.greatest(column, x) +
+                func.ln(1 + func.exp(-func.abs(column - x))))
+
+
+def subtract(column, x):
+    """
+    SQL for log(exp(column) - exp(x)): NULL when x was all that was
+    left, and column unchanged if x is more than is left.
+    """
+    return case([(column > x + 1e-9, column + func.ln(1 - func.exp(x - column))),
+                 (column >= x - 1e-9, None)],
+                else_=column)
+
+
+def bump(obj, weight, time=None):
+    """
+    Add an event of weight to obj's score in the pending UPDATE.
+    """
+    obj.trending = add(type(obj).trending, exponent(weight, time))
+
+
+def drop(obj, weight, time):
+    """
+    Take back the event of weight that happened at time, e.g. on unlike.
+    """
+    obj.trending = subtract(type(obj).trending, exponent(weight, time))
+
+
+def liked_key(collection):
+    return 'trending:liked:' + collection.id.hex
+
+
+def liked_at(value, collection):
+    """
+    The time of a like from its liked_key entry, a POSIX timestamp or
+    None.
+    """
+    if value is None:
+        return collection.create_time
+    return datetime.datetime.fromtimestamp(float(value), tzutc())
+
+
+def combine(xs):
+    """
+    log(sum(exp(x))) of exponents in Python, for backfills.
+    """
+    xs = [x for x in xs if x is not None]
+    if not xs:
+        return None
+    top = max(xs)
+    return top + math.log(sum(math.exp(x - top) for x in xs))
@@ -3,4 +3,5 @@ apps = [
 ]
 
 urls = [
+    (r"/metrics", "metrics.MetricsHandler"),
 ]
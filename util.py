@@ -8,6 +8,7 @@ import json
 import base64
 import time
 import hmac
+import calendar
 
 import redis
 
@@ -18,6 +19,7 @@ from dateutil.tz import (
 
 from tornado import gen
 
+import instrument
 from settings import (
     site_settings,
     redis_settings,
@@ -55,6 +57,31 @@ def get_utc_time():
     return datetime.datetime.now(tzlocal()).astimezone(tzutc())
 
 
+def encode_cursor(time, id=None):
+    """
+    Turn a (naive UTC or aware) datetime, to the microsecond, and the
+    id of the last row sent at that time into a `since=` sync cursor.
+    """
+    cursor = '{}.{:06d}'.format(calendar.timegm(time.utctimetuple()),
+                                time.microsecond)
+    if id is not None:
+        cursor += '-' + id.hex
+    return cursor
+
+
+def decode_cursor(cursor):
+    """
+    (aware datetime, uuid.UUID or None) of a sync cursor; the whole
+    seconds older cursors held are accepted too.
+    """
+    time, _, id = str(cursor).partition('-')
+    seconds, _, micros = time.partition('.')
+    value = datetime.datetime.fromtimestamp(int(seconds), tzutc())
+    if micros:
+        value = value.replace(microsecond=int(micros.ljust(6, '0')[:6]))
+    return value, uuid.UUID(id) if id else None
+
+
 def generate_url(urls, apps=None, name=None):
     if apps is None:
         apps = []
@@ -83,8 +110,8 @@ def generate_url(urls, apps=None, name=None):
 
 
 def conn_redis():
-    return redis.StrictRedis(host=redis_settings["host"],
-                             port=redis_settings["port"])
+    return instrument.Redis(host=redis_settings["host"],
+                            port=redis_settings["port"])
 
 
 def encode_multipart_formdata(fields, files):